@@ -6,3 +6,7 @@ This module contains the imports for functions, classes and constants exported.
 from .ahp_core import generate_consistent_matrix
 from .constants import RI_dict, criteria_structure
 from .ahpAPP import AHPApp
+from .solver import consistent_matrices, solve, batch_principal_eigen, consistency_ratio, random_index, \
+    simulate_random_index
+from .hierarchy import Hierarchy, synthesize, random_consistent_weights
+from .uncertainty import monte_carlo_weights, monte_carlo_hierarchy, summarize_weights
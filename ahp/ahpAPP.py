@@ -1,10 +1,18 @@
 
-from constants import criteria_structure
+from constants import criteria_structure, WEIGHTS_FILE, WEIGHT_SAMPLES_FILE
 from ahp_core import AHPMatrixInput
-from ahp_core import generate_consistent_matrix
+from hierarchy import Hierarchy, random_consistent_weights, synthesize
+from uncertainty import monte_carlo_hierarchy, summarize_weights
 import tkinter as tk
 from tkinter import messagebox
+import numpy as np
 import json
+import os
+
+
+def _output_path(name):
+    """AHP 结果文件的路径（ahp 目录下，与工作目录无关）"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
 
 
 class AHPApp:
@@ -12,15 +20,18 @@ class AHPApp:
         self.root = root
         self.root.title("AHP-Based Site Suitability Analysis Tool for Green Ammonia Plants")
 
-        self.criteria = list(criteria_structure.keys())
+        # 层次结构可以有任意层数，每个非叶节点对应一个判断矩阵
+        self.hierarchy = Hierarchy(criteria_structure)
+        self.criteria = self.hierarchy.levels[self.hierarchy.root]
         self.weights = {}
         self.final_weights = {}
+        self.matrices = {}
 
         tk.Label(root, text="Step 1: Fill in the criteria-level comparison matrix").pack()
         tk.Button(root, text="Edit Criteria Matrix", command=self.edit_criteria).pack(pady=5)
 
         tk.Label(root, text="Step 2: Fill in the comparison matrix for each criterion").pack()
-        for c in self.criteria:
+        for c in [name for name in self.hierarchy.levels if name != self.hierarchy.root]:
             tk.Button(root, text=f"Edit '{c}' Subcriteria", command=lambda c=c: self.edit_subcriteria(c)).pack()
             # lambda c=c: 是为了绑定循环中当前的c值，防止闭包变量被覆盖
 
@@ -29,51 +40,64 @@ class AHPApp:
         # 新增自动计算按钮
         tk.Button(root, text="Auto-generate All Weights", command=self.auto_calculate).pack(pady=5)
 
+        # 判断值扰动的 Monte Carlo 权重不确定性分析
+        tk.Button(root, text="Weight Uncertainty (Monte Carlo)", command=self.calculate_uncertainty).pack(pady=5)
+
     def edit_criteria(self):
         AHPMatrixInput(self.root, "Criteria", self.criteria, self.save_weights)
 
     def edit_subcriteria(self, criterion):
-        items = criteria_structure[criterion]
+        items = self.hierarchy.levels[criterion]
         AHPMatrixInput(self.root, criterion, items, self.save_weights)
 
-    def save_weights(self, name, weight_dict):
+    def save_weights(self, name, weight_dict, matrix=None):
         self.weights[name] = weight_dict
+        if matrix is not None:
+            self.matrices[name] = matrix
 
     def calculate_final(self):
-        if "Criteria" not in self.weights:
-            messagebox.showerror("Error", "Please fill in the criteria-level comparison matrix first.")
+        # 层次合成由 solver.synthesize 完成，可脱离界面单独调用
+        try:
+            self.final_weights = synthesize(self.weights, self.hierarchy)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
 
-        missing = [c for c in self.criteria if c not in self.weights]
-        if missing:
-            messagebox.showerror("Error", f"The following subcriteria matrices are missing：{missing}")
-            return
-
-        self.final_weights.clear()
-        for crit, sub_weights in self.weights.items():
-            if crit == "Criteria":
-                continue
-            parent_weight = self.weights["Criteria"].get(crit, 0)
-            for sub, w in sub_weights.items():
-                self.final_weights[sub] = round(w * parent_weight, 4)
-
         msg = "\n".join([f"{k}: {v}" for k, v in self.final_weights.items()])
         messagebox.showinfo("Final Weights for All Factors (for GIS weighted overlay)", msg)
-        with open("weights.json", "w", encoding="utf-8") as f:
+        with open(_output_path(WEIGHTS_FILE), "w", encoding="utf-8") as f:
             json.dump(self.final_weights, f, ensure_ascii=False, indent=2)
 
     def auto_calculate(self):
+        # 自动为准则层及每个准则的子准则生成一致性矩阵并求权重
+        weights, matrices = random_consistent_weights(self.hierarchy)
         self.weights.clear()
-        # 自动为准则层生成一致性矩阵
-        n_crit = len(self.criteria)
-        A, w = generate_consistent_matrix(n_crit)
-        self.weights["Criteria"] = {self.criteria[i]: round(w[i], 4) for i in range(n_crit)}
-
-        # 为每个准则层也生成一致性子矩阵
-        for crit in self.criteria:
-            subfactors = criteria_structure[crit]
-            A_sub, w_sub = generate_consistent_matrix(len(subfactors))
-            self.weights[crit] = {subfactors[i]: round(w_sub[i], 4) for i in range(len(subfactors))}
+        self.matrices.clear()
+        for name, weight_dict in weights.items():
+            self.save_weights(name, weight_dict, matrices[name])
 
         # 自动展示结果
-        self.calculate_final()
\ No newline at end of file
+        self.calculate_final()
+
+    def calculate_uncertainty(self, n_draws=10000):
+        """
+        扰动全部判断矩阵（±1 个 Saaty 标度），把 CR < 0.1 的全局权重抽样保存到 weights.json 旁的 WEIGHT_SAMPLES_FILE，
+        供批量叠加做敏感性分析（python -m geoprocessing.raster_processing.batch config.json --weight-samples ...）
+        """
+        missing = [name for name in self.hierarchy.levels if name not in self.matrices]
+        if missing:
+            messagebox.showerror("Error", f"The following comparison matrices are missing：{missing}")
+            return
+
+        samples, acceptance = monte_carlo_hierarchy(self.matrices, structure=self.hierarchy, n_draws=n_draws)
+        if not len(samples):
+            messagebox.showerror("Error", "No perturbed matrices passed the consistency check (CR < 0.1)")
+            return
+
+        samples_path = _output_path(WEIGHT_SAMPLES_FILE)
+        np.save(samples_path, samples)
+        summary = summarize_weights(samples)
+        msg = f"Accepted draws: {len(samples)} / {n_draws} ({acceptance:.1%}), saved to {samples_path}\n"
+        msg += "\n".join([f"{k}: {v['mean']:.4f} ± {v['std']:.4f} (5–95%: {v['p5']:.4f}–{v['p95']:.4f})"
+                          for k, v in summary.items()])
+        messagebox.showinfo("Weight Uncertainty", msg)
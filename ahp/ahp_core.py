@@ -1,5 +1,5 @@
 
-from constants import RI_dict
+from solver import consistent_matrices, solve
 import tkinter as tk
 from tkinter import messagebox
 import numpy as np
@@ -11,12 +11,8 @@ def generate_consistent_matrix(n, base_weights=None):
     else:
         w = np.array(base_weights)
     w = w / np.sum(w) # 将权重向量归一化，让所有权重加起来等于 1
-    A = np.ones((n, n))
-    # 创建一个 n×n 的矩阵 A，并初始化为全 1
-    # 注意：对角线一定是 1，因为任何元素与自身相比的重要性为 1
-    for i in range(n):
-        for j in range(n):
-            A[i, j] = w[i] / w[j]
+    # A[i, j] = w[i] / w[j]，外除法一次构建整个矩阵，对角线自然为 1
+    A = consistent_matrices(w)
     return A, w
 
 
@@ -66,25 +62,13 @@ class AHPMatrixInput:
                 messagebox.showerror("Error", f"Invalid input: {i+1}-{j+1}")
                 return
 
-        eigvals, eigvecs = np.linalg.eig(A)
-        max_idx = np.argmax(np.real(eigvals))
-        lambda_max = np.real(eigvals[max_idx])
-        w = np.real(eigvecs[:, max_idx])
-        w = w / np.sum(w)
-        # 用 numpy 求解判断矩阵的特征值和特征向量
-        # 归一化处理
-        CI = (lambda_max - n) / (n - 1)
-        CR = CI / RI_dict.get(n, 1.0)
-        RI = RI_dict.get(n, 1.0)
-        if RI == 0.0:
-            CR = 0.0
-        else:
-            CR = CI / RI
+        # 幂迭代求主特征向量（已归一化）与一致性指标
+        w, lambda_max, CI, CR = solve(A)
 
         result = {self.items[i]: round(w[i], 4) for i in range(n)}
-        self.callback(self.name, result)
+        self.callback(self.name, result, A)
 
         msg = f"Level：{self.name}\nWeights：{result}\nCI={CI:.4f}, CR={CR:.4f}"
-        msg += "\n✅ Consistency is acceptable" if CR < 0.1 or np.isnan(CR) == False else "\n❌ Consistency is poor. Please check your input"
+        msg += "\n✅ Consistency is acceptable" if CR < 0.1 else "\n❌ Consistency is poor. Please check your input"
         messagebox.showinfo("Result", msg)
         self.top.destroy()
\ No newline at end of file
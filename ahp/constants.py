@@ -1,16 +1,29 @@
 
 
-# 一致性随机指标（RI）使用的是创始人Thomas Saaty 提供的标准表的前七个random index
-# original standard table is {
-#     1: 0.0, 2: 0.0, 3: 0.58, 4: 0.9,
-#     5: 1.12, 6: 1.24, 7: 1.32, 8: 1.41, 9: 1.45, 10: 1.49 ...
-# }
+import os
+
+# 一致性随机指标（RI）使用的是创始人Thomas Saaty 提供的标准表（n = 1–10）
 # 这个表格是通过大量随机生成的判断矩阵计算得出的平均 CI 值，因此是经验性的
+# n > 10 时由 solver.random_index 以相同方法做 Monte Carlo 模拟得到，并缓存到 RI_CACHE_FILE
 RI_dict = {
     1: 0.0, 2: 0.0, 3: 0.58, 4: 0.9,
-    5: 1.12, 6: 1.24, 7: 1.32
+    5: 1.12, 6: 1.24, 7: 1.32, 8: 1.41, 9: 1.45, 10: 1.49
 }
 
+# Monte Carlo 随机指标的缓存文件（位于用户缓存目录下，不写入源码目录；可用环境变量 RI_CACHE_ENV 指定目录）、
+# 抽样数与随机种子
+RI_CACHE_ENV = "GIS_LCA_AHP_CACHE"
+RI_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                            "gis_lca")
+RI_CACHE_FILE = "ri_cache.json"
+RI_DRAWS = 100000
+RI_SEED = 0
+
+# AHP 结果文件（位于 ahp 目录下）：最终权重供 GIS 界面读取，
+# Monte Carlo 权重抽样供批量叠加做敏感性分析（batch.py 的 --weight-samples）
+WEIGHTS_FILE = "weights.json"
+WEIGHT_SAMPLES_FILE = "weight_samples.npy"
+
 # 层级结构定义
 # 定义每个准则下有哪些因子
 # 控制弹窗矩阵输入框的数量；
@@ -20,4 +33,7 @@ criteria_structure = {
     "Transportation": ["Road Access"],
     "Environment": ["Slope", "Water System"],
     "Regulation": ["Land Use", "Protected Area"]
-} # 使得打分更加的主观且透明
\ No newline at end of file
+} # 使得打分更加的主观且透明
+
+# 因子权重的输出顺序，与 GIS 加权叠加（FACTOR_KEYS）的权重顺序一致
+factor_order = ["Land Use", "Slope", "Solar Energy", "Wind Energy", "Road Access", "Water System", "Protected Area"]
@@ -0,0 +1,134 @@
+from constants import criteria_structure
+from solver import consistent_matrices, solve
+import numpy as np
+
+# 根节点（准则层判断矩阵）的名称，与 AHPApp 中的 "Criteria" 一致
+ROOT = "Criteria"
+
+
+class Hierarchy:
+    """
+    任意层数的 AHP 层次结构
+    structure 为嵌套字典：值为列表时表示叶子因子，值为字典时表示下一层子准则，例如
+    {"Energy": {"Renewables": ["Solar Energy", "Wind Energy"], "Grid": ["Grid Connection"]}, ...}
+    每个非叶节点对应一个判断矩阵（levels[节点] 为其子节点顺序），叶子节点按出现顺序排列
+    全局权重按层自上而下逐层向量化传播：子节点全局权重 = 父节点全局权重 × 局部权重
+    """
+
+    def __init__(self, structure=None, root=ROOT):
+        self.root = root
+        self.levels = {}
+        self.leaves = []
+        self._parents = []
+        self._depths = []
+        self._index = {}
+        self._add(root, structure or criteria_structure, None, 0)
+
+        # 各层节点下标（按深度分组），传播时每层只需一次数组运算
+        depths = np.array(self._depths)
+        self._parents = np.array(self._parents)
+        self._by_depth = [np.flatnonzero(depths == d) for d in range(1, depths.max() + 1)]
+        self._leaf_index = np.array([self._index[leaf] for leaf in self.leaves])
+
+    def _register(self, name, parent, depth):
+        if name in self._index:
+            raise ValueError(f"Duplicate node name in hierarchy: {name}")
+        self._index[name] = len(self._parents)
+        self._parents.append(-1 if parent is None else self._index[parent])
+        self._depths.append(depth)
+
+    def _add(self, name, children, parent, depth):
+        self._register(name, parent, depth)
+        if isinstance(children, dict):
+            self.levels[name] = list(children)
+            for child, grandchildren in children.items():
+                self._add(child, grandchildren, name, depth + 1)
+        else:
+            self.levels[name] = list(children)
+            for leaf in children:
+                self._register(leaf, name, depth + 1)
+                self.leaves.append(leaf)
+
+    def _local_array(self, local_weights):
+        """{节点: 子节点局部权重} 转换为按节点下标排列的 (抽样数, 节点数) 局部权重数组"""
+        missing = [name for name in self.levels if name not in local_weights]
+        if missing:
+            raise ValueError(f"The following comparison matrices are missing：{missing}")
+
+        arrays = {}
+        for name, children in self.levels.items():
+            weights = local_weights[name]
+            if isinstance(weights, dict):
+                weights = [weights.get(child, 0) for child in children]
+            weights = np.asarray(weights, dtype=float)
+            if weights.shape[-1] != len(children):
+                raise ValueError(f"Expected {len(children)} weights for {name}, got {weights.shape[-1]}")
+            arrays[name] = np.atleast_2d(weights)
+        n_draws = max(len(weights) for weights in arrays.values())
+
+        local = np.ones((n_draws, len(self._parents)))
+        for name, children in self.levels.items():
+            local[:, [self._index[child] for child in children]] = arrays[name]
+        return local
+
+    def global_weights(self, local_weights):
+        """
+        叶子因子的全局权重，列按 leaves 排列
+        local_weights 为 {节点: 子节点局部权重}，权重可以是字典、(k,) 或 (抽样数, k) 数组；
+        存在抽样维时返回 (抽样数, 叶子数)，否则返回 (叶子数,)
+        """
+        batched = any(np.ndim(w) == 2 for w in local_weights.values() if not isinstance(w, dict))
+        result = self._local_array(local_weights)
+        for nodes in self._by_depth:
+            result[:, nodes] *= result[:, self._parents[nodes]]
+        result = result[:, self._leaf_index]
+        return result if batched else result[0]
+
+    def solve(self, matrices, method="power"):
+        """求解全部判断矩阵，返回 ({节点: {子节点: 局部权重}}, {节点: CR})"""
+        missing = [name for name in self.levels if name not in matrices]
+        if missing:
+            raise ValueError(f"The following comparison matrices are missing：{missing}")
+
+        weights, ratios = {}, {}
+        for name, children in self.levels.items():
+            A = np.asarray(matrices[name], dtype=float)
+            if A.shape != (len(children), len(children)):
+                raise ValueError(f"Matrix of {name} must be {len(children)}x{len(children)}, got {A.shape}")
+            w, _, _, CR = solve(A, method)
+            weights[name] = {child: float(w[i]) for i, child in enumerate(children)}
+            ratios[name] = float(CR)
+        return weights, ratios
+
+
+def random_consistent_weights(structure=None, rng=None):
+    """
+    为层次结构中每个判断矩阵随机生成一致性矩阵并求权重（AHPApp.auto_calculate 的无界面版本）
+    返回 (weights, matrices)：weights 为 {"Criteria": {准则: 权重}, 准则: {子节点: 权重}, ...}
+    """
+    hierarchy = structure if isinstance(structure, Hierarchy) else Hierarchy(structure)
+    rng = np.random.default_rng(rng)
+
+    weights, matrices = {}, {}
+    for name, children in hierarchy.levels.items():
+        A = consistent_matrices(rng.random(len(children)))
+        w = solve(A)[0]
+        weights[name] = {child: round(float(w[i]), 4) for i, child in enumerate(children)}
+        matrices[name] = A
+    return weights, matrices
+
+
+def synthesize(weights, structure=None):
+    """
+    层次合成（AHPApp.calculate_final 的无界面版本）：叶子因子全局权重 = 路径上各层局部权重之积
+    weights 为 {"Criteria": {...}, 节点: {...}}，structure 默认为 criteria_structure
+    """
+    hierarchy = structure if isinstance(structure, Hierarchy) else Hierarchy(structure)
+    if hierarchy.root not in weights:
+        raise ValueError("Please fill in the criteria-level comparison matrix first.")
+    missing = [name for name in hierarchy.levels if name not in weights]
+    if missing:
+        raise ValueError(f"The following subcriteria matrices are missing：{missing}")
+
+    result = hierarchy.global_weights(weights)
+    return {leaf: round(float(w), 4) for leaf, w in zip(hierarchy.leaves, result)}
@@ -0,0 +1,143 @@
+from constants import RI_dict, RI_CACHE_ENV, RI_CACHE_DIR, RI_CACHE_FILE, RI_DRAWS, RI_SEED
+import os
+import json
+import threading
+import numpy as np
+
+SOLVER_METHODS = ("power", "geometric")
+
+# Saaty 1–9 标度（含倒数），随机判断矩阵与判断值扰动均在该序列上取值
+SAATY_SCALE = np.array([1 / 9, 1 / 8, 1 / 7, 1 / 6, 1 / 5, 1 / 4, 1 / 3, 1 / 2, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+
+# 模拟随机指标时一次求解的矩阵数
+RI_CHUNK_SIZE = 10000
+
+_random_indices = {}
+_random_indices_lock = threading.Lock()
+
+
+def consistent_matrices(weights):
+    """
+    由权重构建完全一致的判断矩阵 A[i, j] = w[i] / w[j]（外除法）
+    weights 为 (n,) 时返回 (n, n)，为 (抽样数, n) 时返回 (抽样数, n, n)
+    """
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / weights.sum(axis=-1, keepdims=True)
+    return weights[..., :, None] / weights[..., None, :]
+
+
+def geometric_mean_weights(matrices):
+    """行几何平均近似的主特征向量 (抽样数, n)，已归一化"""
+    weights = np.exp(np.log(matrices).mean(axis=-1))
+    return weights / weights.sum(axis=-1, keepdims=True)
+
+
+def batch_principal_eigen(matrices, tol=1e-10, max_iter=200):
+    """
+    对 (抽样数, n, n) 正互反矩阵堆栈做批量幂迭代，返回归一化主特征向量 (抽样数, n) 与最大特征值 (抽样数,)
+    以行几何平均作为初值，通常十余次迭代即可收敛
+    """
+    weights = geometric_mean_weights(matrices)
+    for _ in range(max_iter):
+        product = np.einsum("bij,bj->bi", matrices, weights)
+        updated = product / product.sum(axis=1, keepdims=True)
+        converged = np.abs(updated - weights).max() < tol
+        weights = updated
+        if converged:
+            break
+    # 权重和为 1 时 A·w = λ·w 的各分量之和即为 λ
+    lambda_max = np.einsum("bij,bj->b", matrices, weights)
+    return weights, lambda_max
+
+
+def reciprocal_matrices(judgements, n):
+    """由 (抽样数, n(n-1)/2) 的上三角判断值构建互反判断矩阵堆栈 (抽样数, n, n)"""
+    upper, lower = np.triu_indices(n, 1)
+    matrices = np.ones((len(judgements), n, n))
+    matrices[:, upper, lower] = judgements
+    matrices[:, lower, upper] = 1 / judgements
+    return matrices
+
+
+def _ri_cache_path():
+    return os.path.join(os.environ.get(RI_CACHE_ENV, RI_CACHE_DIR), RI_CACHE_FILE)
+
+
+def simulate_random_index(n, n_draws=RI_DRAWS, seed=RI_SEED):
+    """随机指标的 Monte Carlo 模拟：判断值在 Saaty 标度上均匀随机抽取，RI 为随机矩阵 CI 的均值"""
+    if n <= 2:
+        return 0.0
+    rng = np.random.default_rng([seed, n])
+    n_judgements = n * (n - 1) // 2
+    total = 0.0
+    for start in range(0, n_draws, RI_CHUNK_SIZE):
+        size = min(RI_CHUNK_SIZE, n_draws - start)
+        judgements = SAATY_SCALE[rng.integers(0, len(SAATY_SCALE), (size, n_judgements))]
+        _, lambda_max = batch_principal_eigen(reciprocal_matrices(judgements, n))
+        total += ((lambda_max - n) / (n - 1)).sum()
+    return total / n_draws
+
+
+def random_index(n, n_draws=RI_DRAWS, seed=RI_SEED):
+    """
+    n 阶判断矩阵的随机指标：n 在 RI_dict 中时取标准表，否则按 (n, 抽样数, 种子) 模拟一次，
+    结果写入用户缓存目录下的 RI_CACHE_FILE，之后直接读取
+    """
+    if n in RI_dict:
+        return RI_dict[n]
+
+    key = f"{n}:{n_draws}:{seed}"
+    with _random_indices_lock:
+        if not _random_indices:
+            try:
+                with open(_ri_cache_path(), "r", encoding="utf-8") as f:
+                    _random_indices.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+        if key not in _random_indices:
+            _random_indices[key] = simulate_random_index(n, n_draws, seed)
+            tmp_path = _ri_cache_path() + ".tmp"
+            try:
+                os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(_random_indices, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, _ri_cache_path())
+            except OSError as e:
+                print(f"[WARNING] Failed to save random index cache: {e}")
+        return _random_indices[key]
+
+
+def consistency_ratio(lambda_max, n):
+    """一致性比例 CR 数组；n ≤ 2 时恒为 0"""
+    RI = random_index(n)
+    if n <= 2 or RI == 0.0:
+        return np.zeros_like(lambda_max)
+    CI = (lambda_max - n) / (n - 1)
+    return CI / RI
+
+
+def solve(matrices, method="power"):
+    """
+    批量求解判断矩阵的权重与一致性
+    matrices 为 (n, n) 或 (抽样数, n, n)；method="power" 为幂迭代精确解，"geometric" 为几何平均近似
+    返回 (weights, lambda_max, CI, CR)，单个矩阵时均去掉抽样维
+    """
+    if method not in SOLVER_METHODS:
+        raise ValueError(f"Unknown solver method {method}, expected one of {SOLVER_METHODS}")
+    matrices = np.asarray(matrices, dtype=float)
+    single = matrices.ndim == 2
+    if single:
+        matrices = matrices[None]
+    n = matrices.shape[-1]
+
+    if method == "power":
+        weights, lambda_max = batch_principal_eigen(matrices)
+    else:
+        weights = geometric_mean_weights(matrices)
+        lambda_max = np.einsum("bij,bj->b", matrices, weights)
+
+    CI = (lambda_max - n) / (n - 1) if n > 1 else np.zeros_like(lambda_max)
+    CR = consistency_ratio(lambda_max, n)
+    if single:
+        return weights[0], lambda_max[0], CI[0], CR[0]
+    return weights, lambda_max, CI, CR
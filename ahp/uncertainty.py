@@ -0,0 +1,125 @@
+from constants import factor_order
+from hierarchy import Hierarchy
+from solver import batch_principal_eigen, consistency_ratio, reciprocal_matrices, SAATY_SCALE
+import numpy as np
+
+PERTURBATION_METHODS = ("saaty", "lognormal")
+
+# 一次处理的抽样数，控制 (抽样数, n, n) 矩阵堆栈的内存
+DRAW_CHUNK_SIZE = 20000
+
+
+def _judgements(A):
+    """判断矩阵上三角的判断值（i < j）"""
+    A = np.asarray(A, dtype=float)
+    return A[np.triu_indices(len(A), 1)]
+
+
+def perturb_judgements(A, n_draws, method="saaty", sigma=0.2, rng=None):
+    """
+    扰动判断矩阵 A 的上三角判断值，返回 (n_draws, n(n-1)/2) 数组
+    method="saaty"：每个判断值等概率移动 -1、0、+1 个 Saaty 标度步长（两端截断）
+    method="lognormal"：每个判断值乘以 exp(N(0, sigma²))
+    """
+    if method not in PERTURBATION_METHODS:
+        raise ValueError(f"Unknown perturbation method {method}, expected one of {PERTURBATION_METHODS}")
+    rng = np.random.default_rng(rng)
+    judgements = _judgements(A)
+
+    if method == "lognormal":
+        return judgements * np.exp(rng.normal(0.0, sigma, (n_draws, judgements.size)))
+
+    # 在对数空间中找到最接近的标度位置
+    index = np.abs(np.log(judgements)[:, None] - np.log(SAATY_SCALE)).argmin(axis=1)
+    steps = rng.integers(-1, 2, (n_draws, judgements.size))
+    return SAATY_SCALE[np.clip(index + steps, 0, len(SAATY_SCALE) - 1)]
+
+
+def _sample_matrix(A, n_draws, method, sigma, rng):
+    """单个判断矩阵的一批扰动结果：权重 (n_draws, n) 与 CR (n_draws,)"""
+    n = len(A)
+    if n == 1:
+        return np.ones((n_draws, 1)), np.zeros(n_draws)
+    matrices = reciprocal_matrices(perturb_judgements(A, n_draws, method, sigma, rng), n)
+    weights, lambda_max = batch_principal_eigen(matrices)
+    return weights, consistency_ratio(lambda_max, n)
+
+
+def monte_carlo_weights(A, n_draws=10000, method="saaty", sigma=0.2, cr_threshold=0.1, seed=0,
+                        chunk_size=DRAW_CHUNK_SIZE):
+    """
+    判断矩阵 A 的权重不确定性：扰动判断值 n_draws 次并批量求解，只保留 CR < cr_threshold 的抽样
+    返回 (weights, cr)：weights 形状为 (保留数, n)
+    """
+    rng = np.random.default_rng(seed)
+    kept_weights, kept_cr = [], []
+    for start in range(0, n_draws, chunk_size):
+        weights, cr = _sample_matrix(A, min(chunk_size, n_draws - start), method, sigma, rng)
+        keep = cr < cr_threshold
+        kept_weights.append(weights[keep])
+        kept_cr.append(cr[keep])
+    return np.concatenate(kept_weights), np.concatenate(kept_cr)
+
+
+def monte_carlo_hierarchy(matrices, structure=None, n_draws=10000, method="saaty", sigma=0.2, cr_threshold=0.1,
+                          seed=0, order=None, chunk_size=DRAW_CHUNK_SIZE):
+    """
+    层次结构的全局权重分布：每次抽样同时扰动所有判断矩阵，
+    所有矩阵的 CR 均小于 cr_threshold 时才保留，全局权重沿层次结构逐层相乘（见 Hierarchy.global_weights）
+    matrices 为 {节点: 判断矩阵}，键与 Hierarchy.levels 一致（包括根节点），只有一个子节点的节点可以省略；
+    structure 为嵌套字典或 Hierarchy，默认为 criteria_structure
+    返回 (weights, acceptance)：weights 形状为 (保留数, 因子数)，列按 order（默认 factor_order）排列，
+    可直接作为 batch_weighted_overlay 的权重矩阵
+    """
+    hierarchy = structure if isinstance(structure, Hierarchy) else Hierarchy(structure)
+    order = order or factor_order
+    column = {factor: i for i, factor in enumerate(order)}
+    missing = [factor for factor in hierarchy.leaves if factor not in column]
+    if missing:
+        raise ValueError(f"Factors {missing} are not in the output order {order}")
+
+    unknown = [name for name in matrices if name not in hierarchy.levels]
+    if unknown:
+        raise ValueError(f"Matrices given for unknown nodes: {unknown}")
+
+    matrices = dict(matrices)
+    for name, children in hierarchy.levels.items():
+        if name not in matrices:
+            if len(children) > 1:
+                raise ValueError(f"Comparison matrix of {name} is missing")
+            matrices[name] = np.ones((1, 1))
+        if len(matrices[name]) != len(children):
+            raise ValueError(f"Matrix of {name} must be {len(children)}x{len(children)}, "
+                             f"got {len(matrices[name])}x{len(matrices[name])}")
+    columns = [column[leaf] for leaf in hierarchy.leaves]
+
+    rng = np.random.default_rng(seed)
+    kept = []
+    for start in range(0, n_draws, chunk_size):
+        size = min(chunk_size, n_draws - start)
+        keep = np.ones(size, dtype=bool)
+        local = {}
+        for name in hierarchy.levels:
+            local[name], cr = _sample_matrix(matrices[name], size, method, sigma, rng)
+            keep &= cr < cr_threshold
+        weights = np.zeros((size, len(order)))
+        weights[:, columns] = hierarchy.global_weights(local)
+        kept.append(weights[keep])
+
+    weights = np.concatenate(kept)
+    return weights, len(weights) / n_draws if n_draws else 0.0
+
+
+def summarize_weights(weights, items=None, percentiles=(5, 50, 95)):
+    """各因子的权重分布摘要：均值、标准差与分位数"""
+    items = items or factor_order
+    if not len(weights):
+        raise ValueError("No accepted weight draws to summarize")
+    quantiles = np.percentile(weights, percentiles, axis=0)
+    summary = {}
+    for i, item in enumerate(items):
+        entry = {"mean": float(weights[:, i].mean()), "std": float(weights[:, i].std())}
+        for p, q in zip(percentiles, quantiles[:, i]):
+            entry[f"p{p}"] = float(q)
+        summary[item] = entry
+    return summary
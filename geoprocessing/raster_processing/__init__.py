@@ -5,8 +5,20 @@ This module contains the imports for functions, classes and constants exported.
 from .constants import EPSG_27700_WKT, print_crs_info
 from .vector_clip import clip_vector_to_boundary
 from .raster_crop import crop_raster_to_boundary
-from .terrain_analysis import compute_slope
+from .terrain_analysis import compute_slope, compute_terrain, axis_cell_sizes, SLOPE_METHODS
 from .buffer_rasterize import buffer_and_rasterize
-from .classify import classify_natural_breaks, reclassify_landuse
-from .overlay import weighted_overlay
-from .align import align_raster_to_template
+from .classify import classify_natural_breaks, reclassify_landuse, reclassify, build_lookup_table, LANDUSE_RECLASS, \
+    natural_breaks_drift, streaming_histogram, NATURAL_BREAKS_METHODS
+from .overlay import weighted_overlay, batch_weighted_overlay
+from .align import align_raster_to_template, open_aligned, same_grid, choose_resampling, LAYER_TYPES
+from .scheduler import Stage, StageRef, run_stages, format_timings
+from .pipeline import build_suitability_stages, intermediate_paths, DEFAULT_BUFFER_PARAMS, FACTOR_KEYS, CACHE_DIR_NAME, \
+    FACTOR_LAYER_TYPES, CROP_RESAMPLING
+from .cache import IntermediateCache, file_fingerprint
+from .batch import run_batch, run_scenario, load_config
+from .boundary import Boundary, get_boundary
+from .output_profile import open_output, resolve_output_profile, build_profile, benchmark_output_profiles, \
+    gdal_env, OUTPUT_PROFILES, DEFAULT_OUTPUT_PROFILE, set_mask_mode, active_mask_mode, write_masked, read_valid_mask, read_filled, validity_source, MASK_MODES
+from .grid import GridSpec, grid_from_boundary
+from .raster_store import RasterStore, get_raster_store, read_array
+from .factor_stack import FactorStack
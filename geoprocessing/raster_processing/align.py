@@ -15,63 +15,113 @@ try:
 except Exception as e:
     print(f"⚠️ Failed to load EPSG:27700, using WKT string instead: {e}")
 
+from contextlib import contextmanager
+
 import rasterio
-from rasterio.warp import reproject, Resampling
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
 import numpy as np
 from .constants import print_crs_info
+from .output_profile import open_output, output_band_count, write_masked, read_valid_mask, validity_source
+from .tiling import iter_windows, DEFAULT_BLOCK_SIZE
+
+# 图层类型："categorical" 为类别型（最近邻），"continuous" 为连续型（双线性，明显降采样时取平均）
+LAYER_TYPES = ("categorical", "continuous")
+
+# 模板像元比源像元大到该倍数以上时，连续型图层改用平均值重采样
+AVERAGE_DOWNSAMPLE_FACTOR = 2.0
+
+
+def same_grid(src, template, tolerance=1e-6):
+    """两个数据集的投影、尺寸和仿射变换是否一致（变换参数按像元尺寸的相对容差比较）"""
+    if src.crs != template.crs or (src.height, src.width) != (template.height, template.width):
+        return False
+    cell = max(abs(template.transform.a), abs(template.transform.e))
+    return all(abs(a - b) <= tolerance * cell for a, b in zip(src.transform[:6], template.transform[:6]))
+
+
+def choose_resampling(layer_type, src, template):
+    """按图层类型和分辨率比选择重采样方式"""
+    if layer_type not in LAYER_TYPES:
+        raise ValueError(f"Unknown layer type: {layer_type}")
+    if layer_type == "categorical":
+        return Resampling.nearest
+    if src.crs == template.crs:
+        ratio = min(abs(template.transform.a / src.transform.a), abs(template.transform.e / src.transform.e))
+        if ratio >= AVERAGE_DOWNSAMPLE_FACTOR:
+            return Resampling.average
+    return Resampling.bilinear
+
+
+def _warp_options(src, template, resampling_method):
+    options = {
+        "crs": template.crs,
+        "transform": template.transform,
+        "width": template.width,
+        "height": template.height,
+        "resampling": resampling_method,
+        "nodata": 0,
+    }
+    source = validity_source(src)
+    if source != "nodata":
+        # 有效性来自 alpha 波段或掩膜波段时不按 nodata 判断，值为 0 的有效像元参与重采样；
+        # 源 alpha 波段会随 VRT 保留，掩膜波段需追加 alpha 波段，read_valid_mask 读取 VRT 时才能得到有效性
+        options.update(src_nodata=None, nodata=None, add_alpha=source == "mask")
+    elif src.nodata is not None:
+        options["src_nodata"] = src.nodata
+    return options
+
 
-def align_raster_to_template(src_path, template_path, out_path, resampling_method=Resampling.nearest):
+@contextmanager
+def open_aligned(src_path, template, layer_type="categorical", resampling_method=None):
     """
-    将 src_path 栅格对齐（重投影+重采样）到 template_path 的空间范围、分辨率和投影
+    打开 src_path，返回位于 template（已打开的数据集）网格上的只读句柄：
+    网格一致时直接返回源数据集，否则返回惰性求值的 WarpedVRT，读取哪个窗口才重投影哪个窗口，不写任何文件
     """
-    if os.path.exists(out_path):
-        print_crs_info(f"Aligned output already exists {out_path}", None)
-        return out_path
+    with rasterio.open(src_path) as src:
+        if same_grid(src, template):
+            yield src
+            return
+        if resampling_method is None:
+            resampling_method = choose_resampling(layer_type, src, template)
+        with WarpedVRT(src, **_warp_options(src, template, resampling_method)) as vrt:
+            yield vrt
 
-    with rasterio.open(template_path) as template:
-        template_transform = template.transform
-        template_crs = template.crs
-        template_shape = (template.height, template.width)
-        print_crs_info(f"Template raster {template_path}", template_crs)
 
-    with rasterio.open(src_path) as src:
+def align_raster_to_template(src_path, template_path, out_path, resampling_method=None, layer_type="categorical",
+                             block_size=None, output_profile=None):
+    """
+    将 src_path 栅格对齐（重投影+重采样）到 template_path 的空间范围、分辨率和投影
+    输出保持源数据类型；resampling_method 为空时按 layer_type 选择重采样方式（见 choose_resampling）
+    源栅格已在模板网格上时不做任何计算，直接返回 src_path；
+    否则通过 WarpedVRT 按窗口重投影写出，block_size 为空时使用 DEFAULT_BLOCK_SIZE
+    output_profile 为输出配置（见 OUTPUT_PROFILES），为空时使用 DEFAULT_OUTPUT_PROFILE
+    """
+    with rasterio.open(template_path) as template, rasterio.open(src_path) as src:
+        print_crs_info(f"Template raster {template_path}", template.crs)
         print_crs_info(f"Input raster to be aligned {src_path}", src.crs)
-        data = src.read(1)  # 只读取数据波段
-        profile = src.profile
 
-        profile.update({
-            'height': template_shape[0],
-            'width': template_shape[1],
-            'transform': template_transform,
-            'crs': template_crs
-        })
-
-        destination = np.zeros(template_shape, dtype=profile['dtype'])
-
-        reproject(
-            source=data,
-            destination=destination,
-            src_transform=src.transform,
-            src_crs=src.crs,
-            dst_transform=template_transform,
-            dst_crs=template_crs,
-            resampling=resampling_method
-        )
+        if same_grid(src, template):
+            print(f"[INFO] {src_path} already matches the template grid, skipping alignment")
+            return src_path
 
-        # 添加透明通道
-        alpha_band = (destination > 0).astype(np.uint8) * 255
-        output_data = np.stack([destination, alpha_band], axis=0)
+        if resampling_method is None:
+            resampling_method = choose_resampling(layer_type, src, template)
 
+        profile = src.profile
         profile.update(
-            dtype=rasterio.uint8,
+            height=template.height,
+            width=template.width,
+            transform=template.transform,
+            crs=template.crs,
             nodata=0,
-            crs=template_crs,
-            count=2
+            count=output_band_count()
         )
 
         print_crs_info(f"Output aligned raster {out_path}", profile["crs"])
 
-        with rasterio.open(out_path, 'w', **profile) as dst:
-            dst.write(output_data)
+        with WarpedVRT(src, **_warp_options(src, template, resampling_method)) as vrt, open_output(out_path, profile, output_profile) as dst:
+            for window in iter_windows(template.height, template.width, block_size or DEFAULT_BLOCK_SIZE):
+                write_masked(dst, vrt.read(1, window=window), read_valid_mask(vrt, window), window=window)
 
-    return out_path
\ No newline at end of file
+    return out_path
@@ -0,0 +1,322 @@
+import os
+
+# 无界面批处理入口，用法：
+#
+#     python -m geoprocessing.raster_processing.batch scenarios.yaml --jobs 4
+#
+# 配置文件（JSON 或 YAML）示例：
+#
+#     {
+#       "inputs": {"landuse": "...", "dem": "...", "solar": "...", "wind": "...",
+#                  "road": "...", "water": "...", "reserve": "...", "boundary": "..."},
+#       "out_dir": "results",
+#       "weights": {"landuse": 0.15, "slope": 0.15, "solar": 0.15, "wind": 0.15,
+#                   "road": 0.15, "water": 0.15, "reserve": 0.10},
+#       "buffer_params": {"road": {"breaks": [1000, 3000, 5000], "scores": [1, 0.8, 0.5, 0.2]}},
+#       "slope_method": "horn",
+#       "output_profile": "zstd",
+#       "mask_mode": "mask",
+#       "virtual_align": true,
+#       "shared_grid": true,
+#       "n_class": 5,
+#       "classify_method": "histogram",
+#       "classify_sample_size": 200000,
+#       "buffer_method": "distance",
+#       "clip_chunk_size": 50000,
+#       "clip_engine": "vectorized",
+#       "block_size": 1024,
+#       "landuse_mapping": {"1-2": 2, "3-7": 3, "8-19": 4, "20-21": 1},
+#       "workers": 4,
+#       "sensitivity": {"weight_samples": "ahp/weight_samples.npy", "threshold": 50, "top_fraction": 0.1,
+#                       "max_draws": 5000},
+#       "scenarios": [{"name": "base"}, {"name": "solar_heavy", "weights": {"solar": 0.3, "road": 0.0}}]
+#     }
+#
+# 每个情景写入 out_dir/<name>/，并生成 run_manifest.json（各阶段耗时与输出文件）
+#
+# 给出 sensitivity.weight_samples（AHP 界面 Monte Carlo 分析保存的权重抽样，也可用 --weight-samples 指定）时，
+# 每个情景在叠加完成后用 batch_weighted_overlay 一次评估全部抽样权重，
+# 写出 weight_sensitivity.json（逐抽样统计）与 rank_stability.tif（各像元入选的抽样比例）；
+# 抽样数超过 max_draws（默认 MAX_SENSITIVITY_DRAWS）时先随机无放回抽取 max_draws 组
+
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import concurrent.futures
+import numpy as np
+
+from .pipeline import build_suitability_stages, INPUT_KEYS, FACTOR_KEYS, FACTOR_LAYER_TYPES, CACHE_DIR_NAME
+from .overlay import batch_weighted_overlay
+from .scheduler import run_stages
+from .output_profile import set_mask_mode, MASK_MODE_ENV
+from .cache import IntermediateCache, related_files
+
+RUN_MANIFEST_NAME = "run_manifest.json"
+
+# 权重敏感性分析的输出文件（位于情景输出目录下）
+SENSITIVITY_STATS_NAME = "weight_sensitivity.json"
+STABILITY_MAP_NAME = "rank_stability.tif"
+
+# 敏感性分析默认最多评估的权重抽样数，每组抽样都要在全部像元上计算一次得分
+MAX_SENSITIVITY_DRAWS = 5000
+
+
+def load_config(config_path):
+    """读取 JSON 或 YAML 配置文件（YAML 需要安装 PyYAML）"""
+    with open(config_path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    if os.path.splitext(config_path)[1].lower() in [".yaml", ".yml"]:
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("PyYAML is required to read YAML configs, install it or use a JSON config")
+        config = yaml.safe_load(text)
+    else:
+        config = json.loads(text)
+
+    if not isinstance(config, dict):
+        raise ValueError(f"Config {config_path} must be a mapping")
+
+    # 相对路径按配置文件所在目录解析
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    for section in [config] + list(config.get("scenarios") or []):
+        for key, path in section.get("inputs", {}).items():
+            section["inputs"][key] = os.path.join(base_dir, path)
+        if "out_dir" in section and section is not config:
+            section["out_dir"] = os.path.join(base_dir, section["out_dir"])
+        if (section.get("sensitivity") or {}).get("weight_samples"):
+            section["sensitivity"]["weight_samples"] = os.path.join(base_dir, section["sensitivity"]["weight_samples"])
+    config["out_dir"] = os.path.join(base_dir, config.get("out_dir", "results"))
+    return config
+
+
+def _merge(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def expand_scenarios(config):
+    """将基础配置与 scenarios 列表合并为独立的情景配置"""
+    base = {key: value for key, value in config.items() if key != "scenarios"}
+    scenarios = config.get("scenarios") or [{"name": "default"}]
+
+    expanded = []
+    for i, override in enumerate(scenarios):
+        scenario = _merge(base, override)
+        scenario.setdefault("name", f"scenario_{i}")
+        scenario["out_dir"] = override.get("out_dir", os.path.join(base["out_dir"], scenario["name"]))
+        expanded.append(scenario)
+
+    names = [scenario["name"] for scenario in expanded]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Scenario names must be unique: {names}")
+    return expanded
+
+
+def _weights_list(weights):
+    if isinstance(weights, dict):
+        missing = [key for key in FACTOR_KEYS if key not in weights]
+        if missing:
+            raise ValueError(f"Missing weights for factors: {missing}")
+        weights = [weights[key] for key in FACTOR_KEYS]
+
+    weights = [float(w) for w in weights]
+    if not all(0 <= w <= 1 for w in weights):
+        raise ValueError("Value of weights must be between 0 and 1")
+    if not np.isclose(sum(weights), 1.0, atol=0.01):
+        print(f"[WARNING] Sum of weights {sum(weights):.2f}, should be adjusted to 1.0")
+    return weights
+
+
+def run_scenario(scenario):
+    """运行单个情景并返回机器可读的运行清单"""
+    start = time.perf_counter()
+    out_dir = scenario["out_dir"]
+    os.makedirs(out_dir, exist_ok=True)
+
+    inputs = scenario.get("inputs", {})
+    missing = [key for key in INPUT_KEYS if not inputs.get(key) or not os.path.exists(inputs[key])]
+    if missing:
+        raise ValueError(f"Input file does not exist for: {missing}")
+
+    weights = _weights_list(scenario["weights"])
+    stages = build_suitability_stages(
+        inputs,
+        weights,
+        out_dir,
+        buffer_params=scenario.get("buffer_params"),
+        grid_size=scenario.get("grid_size"),
+        n_class=scenario.get("n_class", 5),
+        buffer_method=scenario.get("buffer_method", "buffer"),
+        clip_chunk_size=scenario.get("clip_chunk_size"),
+        clip_engine=scenario.get("clip_engine", "threads"),
+        block_size=scenario.get("block_size"),
+        landuse_mapping=scenario.get("landuse_mapping"),
+        classify_method=scenario.get("classify_method", "kmeans"),
+        classify_sample_size=scenario.get("classify_sample_size"),
+        slope_method=scenario.get("slope_method", "gradient"),
+        virtual_align=scenario.get("virtual_align", False),
+        shared_grid=scenario.get("shared_grid", False),
+        output_profile=scenario.get("output_profile")
+    )
+
+    # 输出配置经阶段参数传递；掩膜方式通过环境变量传给各阶段，每个情景都显式设置（未给出时用默认值），
+    # 结束后恢复，避免串到下一个情景
+    previous_mask_mode = os.environ.get(MASK_MODE_ENV)
+    set_mask_mode(scenario.get("mask_mode"))
+    try:
+        cache = None
+        if scenario.get("cache", True):
+            cache = IntermediateCache(os.path.join(out_dir, CACHE_DIR_NAME))
+
+        results, timings = run_stages(stages, n_workers=scenario.get("workers", 1), cache=cache)
+
+        outputs = {}
+        for name, path in results.items():
+            files = related_files(path) if isinstance(path, str) else []
+            outputs[name] = {"path": path, "bytes": sum(os.path.getsize(file) for file in files)}
+
+        manifest = {
+            "name": scenario["name"],
+            "out_dir": out_dir,
+            "result": results["overlay"],
+            "weights": dict(zip(FACTOR_KEYS, weights)),
+            "total_seconds": time.perf_counter() - start,
+            "stage_seconds": timings,
+            "outputs": outputs,
+        }
+        sensitivity = scenario.get("sensitivity") or {}
+        if sensitivity.get("weight_samples"):
+            manifest["sensitivity"] = run_weight_sensitivity(
+                results, sensitivity["weight_samples"], out_dir,
+                threshold=sensitivity.get("threshold", 50.0),
+                top_fraction=sensitivity.get("top_fraction"),
+                max_draws=sensitivity.get("max_draws", MAX_SENSITIVITY_DRAWS),
+                block_size=scenario.get("block_size"),
+                output_profile=scenario.get("output_profile")
+            )
+        with open(os.path.join(out_dir, RUN_MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    finally:
+        set_mask_mode(previous_mask_mode)
+    return manifest
+
+
+def run_weight_sensitivity(results, weight_samples, out_dir, threshold=50.0, top_fraction=None, block_size=None,
+                           max_draws=MAX_SENSITIVITY_DRAWS, seed=0, output_profile=None):
+    """
+    用权重抽样（.npy，形状为 (抽样数, 因子数)，列顺序同 FACTOR_KEYS）对情景的因子栅格做一次批量叠加，
+    逐抽样统计写入 SENSITIVITY_STATS_NAME，排序稳定性栅格写入 STABILITY_MAP_NAME，返回写入运行清单的摘要
+    抽样数超过 max_draws 时按 seed 随机无放回抽取 max_draws 组（保持原有顺序），max_draws=None 时全部评估
+    """
+    samples = np.load(weight_samples)
+    total_draws = len(samples)
+    if max_draws is not None and total_draws > max_draws:
+        keep = np.sort(np.random.default_rng(seed).choice(total_draws, max_draws, replace=False))
+        samples = samples[keep]
+        print(f"[INFO] Using {max_draws} of {total_draws} weight samples for the sensitivity run")
+    if "align_0" in results:
+        factors = [results[f"align_{i}"] for i in range(len(FACTOR_KEYS))]
+        options = {}
+    else:
+        # 虚拟对齐模式没有对齐阶段，各因子按块对齐到重分类后的土地利用栅格
+        factors = [results[key] for key in FACTOR_KEYS]
+        options = {"template_path": results["landuse"], "layer_types": [FACTOR_LAYER_TYPES[key] for key in FACTOR_KEYS]}
+
+    stability_path = os.path.join(out_dir, STABILITY_MAP_NAME)
+    stats = batch_weighted_overlay(factors, samples, threshold=threshold, top_fraction=top_fraction,
+                                   stability_path=stability_path, block_size=block_size, output_profile=output_profile,
+                                   **options)
+    stats_path = os.path.join(out_dir, SENSITIVITY_STATS_NAME)
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+
+    fraction = np.array([entry["fraction_above"] for entry in stats])
+    p5, p50, p95 = np.percentile(fraction, [5, 50, 95])
+    print(f"[INFO] Weight sensitivity over {len(stats)} draws: fraction above {threshold} "
+          f"{p50:.2%} (5–95%: {p5:.2%}–{p95:.2%})")
+    return {
+        "weight_samples": os.path.abspath(weight_samples),
+        "draws": len(stats),
+        "total_draws": total_draws,
+        "threshold": threshold,
+        "top_fraction": top_fraction,
+        "fraction_above": {"mean": float(fraction.mean()), "p5": float(p5), "p50": float(p50), "p95": float(p95)},
+        "stats": stats_path,
+        "stability_map": stability_path,
+    }
+
+
+def run_batch(config, jobs=1):
+    """
+    并行运行配置中的全部情景，单个情景失败不会中断其他情景
+    返回每个情景的运行清单（失败情景包含 error 字段）
+    """
+    scenarios = expand_scenarios(config)
+    manifests = []
+
+    if jobs <= 1:
+        for scenario in scenarios:
+            manifests.append(_run_safely(scenario))
+        return manifests
+
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+        for manifest in executor.map(_run_safely, scenarios):
+            manifests.append(manifest)
+    return manifests
+
+
+def _run_safely(scenario):
+    try:
+        manifest = run_scenario(scenario)
+        manifest["status"] = "ok"
+    except Exception as e:
+        print(f"[ERROR] Scenario {scenario['name']} failed: {e}")
+        manifest = {"name": scenario["name"], "out_dir": scenario["out_dir"], "status": "failed", "error": str(e)}
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the green ammonia suitability pipeline without a GUI")
+    parser.add_argument("config", help="JSON or YAML scenario config")
+    parser.add_argument("--jobs", type=int, default=1, help="number of scenarios run in parallel")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size inside each scenario")
+    parser.add_argument("--manifest", default=None, help="batch manifest path (default: <out_dir>/batch_manifest.json)")
+    parser.add_argument("--weight-samples", default=None,
+                        help="AHP Monte Carlo weight samples (.npy) for a sensitivity run on every scenario")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.workers is not None:
+        config["workers"] = args.workers
+    if args.weight_samples is not None:
+        config.setdefault("sensitivity", {})["weight_samples"] = os.path.abspath(args.weight_samples)
+
+    start = time.perf_counter()
+    manifests = run_batch(config, jobs=args.jobs)
+    batch_manifest = {
+        "config": os.path.abspath(args.config),
+        "total_seconds": time.perf_counter() - start,
+        "scenarios": manifests,
+    }
+
+    manifest_path = args.manifest or os.path.join(config["out_dir"], "batch_manifest.json")
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(batch_manifest, f, ensure_ascii=False, indent=2)
+    print(f"[INFO] Batch manifest written to {manifest_path}")
+
+    return 0 if all(m["status"] == "ok" for m in manifests) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import os
+import threading
+import shapely
+import numpy as np
+import geopandas as gpd
+from pyproj import CRS
+from shapely.geometry import box
+from rasterio.features import geometry_mask
+from .constants import print_crs_info
+
+
+def _crs_key(target_crs):
+    if target_crs is None:
+        return None
+    return CRS.from_user_input(target_crs).to_wkt()
+
+
+class Boundary:
+    """
+    研究区边界：只读取一次，按目标坐标系缓存重投影结果、合并几何、
+    prepare 后的几何、简化几何以及在栅格网格上的掩膜
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.gdf = gpd.read_file(path)
+        print_crs_info(f"Boundary Vector {path}", self.gdf.crs)
+        if self.gdf.empty:
+            raise ValueError(f"Boundary Vector{path}is empty！")
+
+        self._lock = threading.RLock()
+        self._frames = {}
+        self._unions = {}
+        self._simplified = {}
+        self._masks = {}
+
+    @property
+    def crs(self):
+        return self.gdf.crs
+
+    def frame(self, target_crs=None):
+        """重投影到 target_crs 的边界 GeoDataFrame（None 表示原始坐标系）"""
+        key = _crs_key(target_crs)
+        with self._lock:
+            if key not in self._frames:
+                self._frames[key] = self.gdf if target_crs is None else self.gdf.to_crs(target_crs)
+            return self._frames[key]
+
+    def union(self, target_crs=None):
+        """合并后的边界几何（已 prepare，可直接用于大批量谓词判断）"""
+        key = _crs_key(target_crs)
+        with self._lock:
+            if key not in self._unions:
+                geom = self.frame(target_crs).geometry.union_all()
+                shapely.prepare(geom)
+                self._unions[key] = geom
+            return self._unions[key]
+
+    def prepared(self, target_crs=None):
+        return self.union(target_crs)
+
+    def simplified(self, target_crs=None, tolerance=0.0):
+        """按容差简化的边界几何，用于快速掩膜（容差取半个像元以内时掩膜结果基本不变）"""
+        if not tolerance:
+            return self.union(target_crs)
+        key = (_crs_key(target_crs), float(tolerance))
+        with self._lock:
+            if key not in self._simplified:
+                geom = shapely.simplify(self.union(target_crs), tolerance, preserve_topology=True)
+                shapely.prepare(geom)
+                self._simplified[key] = geom
+            return self._simplified[key]
+
+    def mask(self, transform, shape, target_crs, all_touched=True, simplify_tolerance=None, cache=True):
+        """
+        边界在给定栅格网格上的掩膜，True 表示像元位于边界内
+        simplify_tolerance 为空时取半个像元；分块计算时传 cache=False，避免缓存大量小块掩膜
+        """
+        if simplify_tolerance is None:
+            simplify_tolerance = 0.5 * min(abs(transform.a), abs(transform.e))
+        key = (_crs_key(target_crs), tuple(transform)[:6], tuple(shape), all_touched, simplify_tolerance)
+        with self._lock:
+            if key in self._masks:
+                return self._masks[key]
+            geom = self.simplified(target_crs, simplify_tolerance)
+            mask = _rasterize_inside(geom, transform, tuple(shape), all_touched)
+            if cache:
+                self._masks[key] = mask
+            return mask
+
+
+def _rasterize_inside(geom, transform, shape, all_touched):
+    """
+    几何在网格上的掩膜（True 表示在几何内）：网格完全位于几何内部或外部时不做栅格化，
+    否则先按网格范围（外扩一个像元）裁剪几何，减少分块栅格化的开销
+    """
+    height, width = shape
+    xs, ys = zip(*[transform * corner for corner in [(0, 0), (width, 0), (0, height), (width, height)]])
+    grid_box = box(min(xs), min(ys), max(xs), max(ys))
+
+    if geom.contains_properly(grid_box):
+        return np.ones(shape, dtype=bool)
+    if not geom.intersects(grid_box):
+        return np.zeros(shape, dtype=bool)
+
+    pad_x, pad_y = abs(transform.a) + abs(transform.b), abs(transform.d) + abs(transform.e)
+    local = shapely.clip_by_rect(geom, min(xs) - pad_x, min(ys) - pad_y, max(xs) + pad_x, max(ys) + pad_y)
+    if local.is_empty:
+        return np.zeros(shape, dtype=bool)
+    return geometry_mask([local], out_shape=shape, transform=transform, all_touched=all_touched, invert=True)
+
+
+_boundaries = {}
+_boundaries_lock = threading.Lock()
+
+
+def get_boundary(path):
+    """
+    获取边界服务对象，同一进程内按路径与文件修改时间缓存，文件变化后自动重新读取
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _boundaries_lock:
+        boundary = _boundaries.get(key)
+        if boundary is None:
+            # 同一路径的旧版本不再需要
+            for old_key in [k for k in _boundaries if k[0] == key[0]]:
+                del _boundaries[old_key]
+            boundary = Boundary(path)
+            _boundaries[key] = boundary
+        return boundary
@@ -16,26 +16,53 @@ except Exception as e:
     print(f"⚠️ Failed to load EPSG:27700, using WKT string instead: {e}")
 
 import rasterio
+from affine import Affine
 from rasterio.features import rasterize
 import numpy as np
 import geopandas as gpd
+import shapely
+from scipy.ndimage import distance_transform_edt
 from .constants import print_crs_info, EPSG_27700_WKT
+from .output_profile import open_output, output_band_count, write_masked
+
+def buffer_and_rasterize(shp_path, ref_raster_path, breaks, scores, reverse=False, out_path="buffered.tif",
+                         method="buffer", exact_boundaries=True, grid=None, output_profile=None):
+    """
+    按距离分级对矢量做多环缓冲并栅格化为得分
+    method="buffer"   逐环计算缓冲区差集并栅格化（原始实现）
+    method="distance" 源几何只栅格化一次，用欧氏距离变换得到距离栅格，再用一次 np.digitize 映射得分；
+                      exact_boundaries=True 时，环边界附近的像元改用到源几何的精确距离判定，与缓冲区结果保持一致
+    grid（GridSpec）不为空时直接栅格化到该网格，ref_raster_path 不再使用
+    output_profile 为输出配置（见 OUTPUT_PROFILES），为空时使用 DEFAULT_OUTPUT_PROFILE
+    """
+    if method not in ("buffer", "distance"):
+        raise ValueError(f"Unknown buffer method: {method}")
 
-def buffer_and_rasterize(shp_path, ref_raster_path, breaks, scores, reverse=False, out_path="buffered.tif"):
     gdf = gpd.read_file(shp_path)
     print_crs_info(f"Buffered input vector {shp_path}", gdf.crs)
 
-    with rasterio.open(ref_raster_path) as ref:
-        print_crs_info(f"Reference raster {ref_raster_path}", ref.crs)
-        transform = ref.transform
-        out_shape = (ref.height, ref.width)
-        profile = ref.profile
+    if grid is not None:
+        print_crs_info("Reference grid", grid.crs)
+        transform = grid.transform
+        out_shape = grid.shape
+        profile = grid.profile()
+    else:
+        with rasterio.open(ref_raster_path) as ref:
+            print_crs_info(f"Reference raster {ref_raster_path}", ref.crs)
+            transform = ref.transform
+            out_shape = (ref.height, ref.width)
+            profile = ref.profile
 
     # 将矢量重投影到目标WKT
     gdf = gdf.to_crs(EPSG_27700_WKT)
 
     distance = [0] + breaks
     classes = scores if not reverse else scores[::-1]
+
+    if method == "distance":
+        result = _distance_ring_scores(gdf, transform, out_shape, distance, classes, exact_boundaries)
+        return _write_buffer_result(result, profile, out_path, output_profile)
+
     result = np.zeros(out_shape, dtype=np.float32)
 
     for i in range(len(distance) - 1):
@@ -55,20 +82,127 @@ def buffer_and_rasterize(shp_path, ref_raster_path, breaks, scores, reverse=Fals
         )
         result = np.maximum(result, mask_layer)
 
-    # 添加透明通道
-    alpha_band = (result > 0).astype(np.uint8) * 255
-    output_data = np.stack([result, alpha_band], axis=0)
+    return _write_buffer_result(result, profile, out_path, output_profile)
+
+
+def _distance_ring_scores(gdf, transform, out_shape, distance, classes, exact_boundaries, chunk_size=100000,
+                          quad_segs=16):
+    classes = list(classes[:len(distance) - 1])
+    # 原实现对各要素的环取 np.maximum，只有得分随距离不增时才等价于“按最近距离取环”
+    if any(later > earlier for earlier, later in zip(classes, classes[1:])):
+        raise ValueError("method='distance' requires scores that do not increase with distance")
+
+    geoms = np.array([geom for geom in gdf.geometry if geom is not None and not geom.is_empty and geom.is_valid],
+                     dtype=object)
+    if geoms.size == 0:
+        return np.zeros(out_shape, dtype=np.float32)
+
+    # 源几何栅格化一次；all_touched 保证细线要素不会漏掉。
+    # 网格四周外扩最大断点对应的像元数，使落在参考网格之外的几何也参与距离变换
+    cell_x, cell_y = abs(transform.a), abs(transform.e)
+    pad_x = int(np.ceil(distance[-1] / cell_x)) + 1
+    pad_y = int(np.ceil(distance[-1] / cell_y)) + 1
+    source = rasterize(
+        [(geom, 1) for geom in geoms],
+        out_shape=(out_shape[0] + 2 * pad_y, out_shape[1] + 2 * pad_x),
+        transform=transform * Affine.translation(-pad_x, -pad_y),
+        fill=0,
+        all_touched=True,
+        dtype=np.uint8
+    )
 
+    # 面要素内部（像元中心落在面内）：每个要素的 buffer(0) 即面本身，不属于该要素的任何一环
+    is_polygon = np.array([geom.geom_type in ("Polygon", "MultiPolygon") for geom in geoms])
+    interior = np.zeros(out_shape, dtype=bool)
+    if is_polygon.any():
+        interior = rasterize(
+            [(geom, 1) for geom in geoms[is_polygon]],
+            out_shape=out_shape,
+            transform=transform,
+            fill=0,
+            dtype=np.uint8
+        ).astype(bool)
+
+    # 像元中心到最近源像元中心的距离，误差不超过半个像元对角线；距离变换后裁回参考网格
+    dist = distance_transform_edt(source == 0, sampling=(cell_y, cell_x))
+    dist = np.ascontiguousarray(dist[pad_y:pad_y + out_shape[0], pad_x:pad_x + out_shape[1]])
+    del source
+
+    tree = shapely.STRtree(geoms)
+
+    def pixel_points(rows, cols):
+        xs, ys = rasterio.transform.xy(transform, rows, cols)
+        return shapely.points(np.asarray(xs), np.asarray(ys))
+
+    # 面内部像元：只统计不包含该像元的其他要素的最近距离（超出最大断点记为无穷远）
+    rows, cols = np.nonzero(interior)
+    for start in range(0, rows.size, chunk_size):
+        r = rows[start:start + chunk_size]
+        c = cols[start:start + chunk_size]
+        points = pixel_points(r, c)
+        point_idx, geom_idx = tree.query(points, predicate="dwithin", distance=distance[-1])
+        pair_dist = shapely.distance(points[point_idx], geoms[geom_idx])
+        keep = (pair_dist > 0) | ~is_polygon[geom_idx]
+        nearest = np.full(r.size, np.inf)
+        np.minimum.at(nearest, point_idx[keep], pair_dist[keep])
+        dist[r, c] = nearest
+
+    if exact_boundaries:
+        # 缓冲区是以折线逼近的圆弧（每四分之一圆 quad_segs 段），弦高范围内需按实际缓冲多边形判定
+        def sagitta(d):
+            return d * (1 - np.cos(np.pi / (4 * quad_segs))) * 1.01 + 1e-6
+
+        # 仅对落在环边界容差带（半个像元对角线 + 弦高）内的像元计算到源几何的精确距离
+        half_diagonal = 0.5 * np.hypot(cell_x, cell_y)
+        near_edge = np.zeros(out_shape, dtype=bool)
+        for d in distance[1:]:
+            near_edge |= np.abs(dist - d) <= half_diagonal + sagitta(d)
+        near_edge &= ~interior
+
+        rows, cols = np.nonzero(near_edge)
+        if rows.size:
+            print(f"[INFO] Refining {rows.size} pixels near ring boundaries with exact distances")
+        for start in range(0, rows.size, chunk_size):
+            r = rows[start:start + chunk_size]
+            c = cols[start:start + chunk_size]
+            _, exact = tree.query_nearest(pixel_points(r, c), return_distance=True, all_matches=False)
+            dist[r, c] = exact
+
+        # 弦高范围内的像元按实际缓冲多边形判定
+        for d in distance[1:]:
+            rows, cols = np.nonzero((dist > d - sagitta(d)) & (dist <= d))
+            for start in range(0, rows.size, chunk_size):
+                r = rows[start:start + chunk_size]
+                c = cols[start:start + chunk_size]
+                points = pixel_points(r, c)
+                point_idx, geom_idx = tree.query(points, predicate="dwithin", distance=d)
+                unique_idx, inverse = np.unique(geom_idx, return_inverse=True)
+                buffers = shapely.buffer(geoms[unique_idx], d, quad_segs=quad_segs)
+                inside = shapely.contains(buffers[inverse], points[point_idx])
+                # 包含该像元中心的面要素不参与（其所有环都不含面内部）
+                inside &= ~(is_polygon[geom_idx] & shapely.contains(geoms[geom_idx], points[point_idx]))
+                covered = np.zeros(r.size, dtype=bool)
+                covered[point_idx[inside]] = True
+                dist[r[~covered], c[~covered]] = np.nextafter(d, np.inf)
+
+    # 一次查表：0 < d <= b1 为第一环，……，超出最后一个断点得分为 0；落在线要素上的像元属于第一环
+    lookup = np.array([0] + classes + [0], dtype=np.float32)
+    index = np.digitize(dist, distance, right=True)
+    index[dist == 0] = 1
+    return lookup[index]
+
+
+def _write_buffer_result(result, profile, out_path, output_profile=None):
     profile.update(
         dtype=rasterio.float32,
         nodata=0,
         crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
-        count=2
+        count=output_band_count()
     )
 
     print_crs_info(f"Output buffered raster {out_path}", profile["crs"])
 
-    with rasterio.open(out_path, 'w', **profile) as dst:
-        dst.write(output_data)
+    with open_output(out_path, profile, output_profile) as dst:
+        write_masked(dst, result, result > 0)
 
     return out_path
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from .output_profile import active_mask_mode
+
+# 缓存中被替换下来的旧版本结果总大小上限（字节）
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+SHAPEFILE_EXTENSIONS = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+
+MANIFEST_NAME = "manifest.json"
+
+
+def related_files(path):
+    """返回构成一个数据集的全部文件（shapefile 附属文件、GDAL 辅助文件）"""
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".shp":
+        candidates = [stem + extension for extension in SHAPEFILE_EXTENSIONS]
+    else:
+        candidates = [path, path + ".aux.xml", path + ".msk", path + ".ovr"]
+    return [candidate for candidate in candidates if os.path.exists(candidate)]
+
+
+def _file_checksum(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, checksum=False):
+    """
+    数据集指纹：所有组成文件的大小与修改时间，checksum=True 时附加内容 SHA-256
+    """
+    fingerprint = []
+    for file in related_files(path):
+        stat = os.stat(file)
+        entry = [os.path.basename(file), stat.st_size, stat.st_mtime_ns]
+        if checksum:
+            entry.append(_file_checksum(file))
+        fingerprint.append(entry)
+    return {"path": os.path.abspath(path), "files": fingerprint}
+
+
+class IntermediateCache:
+    """
+    以内容寻址的中间结果缓存
+    阶段键 = 哈希(函数名, 参数, 输入文件指纹)，键未变化的阶段直接复用结果；
+    键变化时旧结果移入 objects/<key>/ 保存，参数改回后可直接恢复，超过容量上限时按最近最少使用淘汰
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, checksum=False):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.max_bytes = max_bytes
+        self.checksum = checksum
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                manifest.setdefault("outputs", {})
+                manifest.setdefault("objects", {})
+                return manifest
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Cache manifest is unreadable, starting a new one: {e}")
+        return {"outputs": {}, "objects": {}}
+
+    def save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _normalize(self, value, out_path):
+        if isinstance(value, str):
+            if out_path is not None and os.path.abspath(value) == os.path.abspath(out_path):
+                return "<out_path>"
+            if os.path.isfile(value):
+                return file_fingerprint(value, self.checksum)
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self._normalize(item, out_path) for item in value]
+        if isinstance(value, dict):
+            return {str(key): self._normalize(item, out_path) for key, item in value.items()}
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        return repr(value)
+
+    def stage_key(self, func, args, kwargs, out_path=None):
+        """根据函数、参数和输入文件指纹计算阶段键"""
+        payload = {
+            "func": f"{func.__module__}.{func.__qualname__}",
+            "args": self._normalize(list(args), out_path),
+            "kwargs": self._normalize(kwargs, out_path),
+            # 输出配置是各阶段的 output_profile 参数，已包含在 kwargs 中；掩膜方式来自环境变量，单独计入
+            "mask_mode": active_mask_mode(),
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _stash(self, out_path):
+        """把 out_path 处的旧结果移入对象区；未登记的文件直接删除"""
+        entry = self.manifest["outputs"].pop(out_path, None)
+        files = related_files(out_path)
+        if entry is None or entry["key"] in self.manifest["objects"]:
+            for file in files:
+                os.remove(file)
+            return
+
+        object_dir = os.path.join(self.objects_dir, entry["key"])
+        os.makedirs(object_dir, exist_ok=True)
+        for file in files:
+            os.replace(file, os.path.join(object_dir, os.path.basename(file)))
+        self.manifest["objects"][entry["key"]] = {
+            "out_path": out_path,
+            "result": entry["result"],
+            "files": [os.path.basename(file) for file in files],
+            "size": sum(os.path.getsize(os.path.join(object_dir, os.path.basename(file))) for file in files),
+            "last_used": time.time(),
+        }
+
+    def _restore(self, key, out_path):
+        obj = self.manifest["objects"].pop(key)
+        object_dir = os.path.join(self.objects_dir, key)
+        target_dir = os.path.dirname(out_path)
+        for name in obj["files"]:
+            os.replace(os.path.join(object_dir, name), os.path.join(target_dir, name))
+        shutil.rmtree(object_dir, ignore_errors=True)
+        return obj["result"]
+
+    def lookup(self, key, out_path):
+        """
+        查询阶段结果，返回 (是否命中, 结果)
+        未命中时会清理 out_path 处的过期结果，保证阶段函数重新计算
+        """
+        entry = self.manifest["outputs"].get(out_path)
+        if entry is not None and entry["key"] == key and all(os.path.exists(os.path.join(os.path.dirname(out_path), name))
+                                                             for name in entry["files"]):
+            entry["last_used"] = time.time()
+            self.save()
+            return True, entry["result"]
+
+        self._stash(out_path)
+        obj = self.manifest["objects"].get(key)
+        if obj is not None and obj["out_path"] == out_path:
+            result = self._restore(key, out_path)
+            self.store(key, out_path, result)
+            return True, result
+
+        self.save()
+        return False, None
+
+    def store(self, key, out_path, result):
+        """登记阶段输出，并按容量上限淘汰旧版本"""
+        files = related_files(out_path)
+        self.manifest["outputs"][out_path] = {
+            "key": key,
+            "result": result,
+            "files": [os.path.basename(file) for file in files],
+            "size": sum(os.path.getsize(file) for file in files),
+            "last_used": time.time(),
+        }
+        self.evict()
+        self.save()
+
+    def evict(self):
+        """按最近最少使用顺序删除旧版本，直到对象区总大小不超过上限"""
+        objects = self.manifest["objects"]
+        total = sum(obj["size"] for obj in objects.values())
+        for key in sorted(objects, key=lambda k: objects[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= objects[key]["size"]
+            shutil.rmtree(os.path.join(self.objects_dir, key), ignore_errors=True)
+            del objects[key]
+            print(f"[INFO] Evicted cached intermediate {key[:12]}")
+
+    def clear(self):
+        """清空所有缓存记录与旧版本"""
+        shutil.rmtree(self.objects_dir, ignore_errors=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.manifest = {"outputs": {}, "objects": {}}
+        self.save()
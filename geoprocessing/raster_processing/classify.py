@@ -15,28 +15,219 @@ try:
 except Exception as e:
     print(f"⚠️ Failed to load EPSG:27700, using WKT string instead: {e}")
 
+import re
 import rasterio
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from .constants import print_crs_info, EPSG_27700_WKT
+from .output_profile import open_output, output_band_count, write_masked, read_valid_mask
+from .tiling import iter_windows, DEFAULT_BLOCK_SIZE
 
-def classify_natural_breaks(raster_path, out_path, n_class=5):
-    with rasterio.open(raster_path) as src:
-        print_crs_info(f"Input classified raster {raster_path}", src.crs)
-        data = src.read(1)
-        profile = src.profile
-        nodata = src.nodata
+# 自然断点分级方法："kmeans" 为全量 KMeans（原始实现），"sampled" 为分块分层抽样 + MiniBatchKMeans，
+# "histogram" 为流式直方图上的精确一维 k-means 动态规划
+NATURAL_BREAKS_METHODS = ("kmeans", "sampled", "histogram")
+
+# 抽样模式默认样本量
+DEFAULT_SAMPLE_SIZE = 200000
+
+# 直方图模式默认分箱数；断点误差不超过一个分箱宽度 (max - min) / bins
+DEFAULT_HISTOGRAM_BINS = 4096
+
+
+def _valid_pixels(src, data, window=None):
+    # 有效性取自掩膜（见 read_valid_mask），mask / alpha 模式下值为 0 的有效像元同样参与分级
+    return read_valid_mask(src, window) & (~np.isnan(data))
+
+
+def _centers_to_thresholds(centers):
+    centers = sorted(np.asarray(centers).flatten())
+    return [(centers[i] + centers[i + 1]) / 2 for i in range(len(centers) - 1)]
+
+
+def _kmeans_thresholds(valid_data, n_class):
+    kmeans = KMeans(n_clusters=n_class, random_state=0).fit(valid_data.reshape(-1, 1))
+    return _centers_to_thresholds(kmeans.cluster_centers_)
+
+
+def _refine_centers_1d(values, centers, max_iter=300, tol=1e-9):
+    """
+    一维 Lloyd 迭代：样本排序后每轮只需 searchsorted 与前缀和，
+    用于把 MiniBatchKMeans 的近似中心收敛到样本上的局部最优
+    """
+    values = np.sort(values)
+    cumsum = np.concatenate([[0.0], np.cumsum(values)])
+    centers = np.sort(np.asarray(centers, dtype=np.float64).flatten())
+    for _ in range(max_iter):
+        edges = np.searchsorted(values, _centers_to_thresholds(centers), side="right")
+        bounds = np.concatenate([[0], edges, [values.size]])
+        counts = np.diff(bounds)
+        sums = cumsum[bounds[1:]] - cumsum[bounds[:-1]]
+        updated = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+        if np.max(np.abs(updated - centers)) <= tol * (abs(values[-1] - values[0]) or 1.0):
+            return updated
+        centers = updated
+    return centers
+
+
+def _minibatch_thresholds(sample, n_class, seed):
+    kmeans = MiniBatchKMeans(n_clusters=n_class, random_state=seed, batch_size=4096, n_init=3)
+    kmeans.fit(sample.reshape(-1, 1))
+    return _centers_to_thresholds(_refine_centers_1d(sample, kmeans.cluster_centers_))
+
+
+def sample_valid_pixels(src, sample_size=DEFAULT_SAMPLE_SIZE, seed=0, block_size=None):
+    """
+    按窗口分层抽取有效像元：第一遍统计各窗口有效像元数，按比例（最大余数法）分配样本量，
+    第二遍在每个窗口内无放回抽样，内存只占一个窗口加样本
+    """
+    windows = list(iter_windows(src.height, src.width, block_size or DEFAULT_BLOCK_SIZE))
+    counts = np.array([np.count_nonzero(_valid_pixels(src, src.read(1, window=w), w)) for w in windows])
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.float64)
+
+    if total <= sample_size:
+        quotas = counts
+    else:
+        exact = counts * (sample_size / total)
+        quotas = np.floor(exact).astype(np.int64)
+        remainder = sample_size - int(quotas.sum())
+        quotas[np.argsort(quotas - exact)[:remainder]] += 1
+
+    rng = np.random.default_rng(seed)
+    samples = []
+    for window, quota in zip(windows, quotas):
+        if quota == 0:
+            continue
+        data = src.read(1, window=window)
+        values = data[_valid_pixels(src, data, window)]
+        samples.append(values if quota >= values.size else rng.choice(values, quota, replace=False))
+    return np.concatenate(samples).astype(np.float64)
+
+
+def streaming_histogram(src, bins=DEFAULT_HISTOGRAM_BINS, block_size=None):
+    """
+    按窗口两遍扫描有效像元：第一遍求值域，第二遍累加定宽直方图，返回 (counts, edges)
+    """
+    windows = list(iter_windows(src.height, src.width, block_size or DEFAULT_BLOCK_SIZE))
+    low, high = np.inf, -np.inf
+    for window in windows:
+        data = src.read(1, window=window)
+        values = data[_valid_pixels(src, data, window)]
+        if values.size:
+            low, high = min(low, float(values.min())), max(high, float(values.max()))
+    if low > high:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    if low == high:
+        high = low + 1.0
+    counts = np.zeros(bins, dtype=np.int64)
+    for window in windows:
+        data = src.read(1, window=window)
+        values = data[_valid_pixels(src, data, window)]
+        if values.size:
+            counts += np.histogram(values, bins=bins, range=(low, high))[0]
+    return counts, np.linspace(low, high, bins + 1)
+
+
+def _weighted_kmeans_1d(values, weights, n_class):
+    """
+    加权一维 k-means 的精确解（values 已升序）：
+    D[k][m] = min_j D[k-1][j-1] + cost(j, m)，cost 由前缀和 O(1) 求得，
+    最优分割点随 m 单调，按分治法每层 O(n log n) 完成；返回各类的加权均值
+    """
+    n = values.size
+    n_class = min(n_class, n)
+    w = np.concatenate([[0.0], np.cumsum(weights)])
+    wx = np.concatenate([[0.0], np.cumsum(weights * values)])
+    wxx = np.concatenate([[0.0], np.cumsum(weights * values * values)])
+
+    def cost(starts, end):
+        # 区间 [starts, end] 的加权平方误差（下标从 0 开始，闭区间）
+        sw = w[end + 1] - w[starts]
+        sx = wx[end + 1] - wx[starts]
+        sxx = wxx[end + 1] - wxx[starts]
+        return sxx - sx * sx / np.maximum(sw, 1e-300)
+
+    previous = cost(np.zeros(n, dtype=np.int64), np.arange(n))
+    splits = []
+    for k in range(1, n_class):
+        current = np.full(n, np.inf)
+        argmin = np.zeros(n, dtype=np.int64)
+
+        def solve(lo, hi, opt_lo, opt_hi):
+            if lo > hi:
+                return
+            mid = (lo + hi) // 2
+            starts = np.arange(max(opt_lo, k), min(opt_hi, mid) + 1)
+            if starts.size:
+                totals = previous[starts - 1] + cost(starts, mid)
+                best = int(np.argmin(totals))
+                current[mid] = totals[best]
+                argmin[mid] = starts[best]
+            best_start = argmin[mid] if starts.size else opt_lo
+            solve(lo, mid - 1, opt_lo, best_start)
+            solve(mid + 1, hi, best_start, opt_hi)
+
+        solve(k, n - 1, k, n - 1)
+        splits.append(argmin)
+        previous = current
+
+    # 回溯各类的起点
+    bounds = [n]
+    end = n - 1
+    for argmin in reversed(splits):
+        start = int(argmin[end])
+        bounds.append(start)
+        end = start - 1
+    bounds.append(0)
+    bounds = bounds[::-1]
+    return np.array([(wx[b] - wx[a]) / (w[b] - w[a]) for a, b in zip(bounds[:-1], bounds[1:])])
+
+
+def histogram_thresholds(counts, edges, n_class):
+    """以非空分箱中心为样本、像元数为权重求精确一维 k-means 断点"""
+    centers = (edges[:-1] + edges[1:]) / 2
+    keep = counts > 0
+    return _centers_to_thresholds(_weighted_kmeans_1d(centers[keep], counts[keep].astype(np.float64), n_class))
 
-    valid_mask = (data != nodata) & (~np.isnan(data))
-    valid_data = data[valid_mask].reshape(-1, 1)
 
-    if valid_data.size == 0:
-        raise ValueError("Input raster has no valid data for classification!")
+def _class_index(values, thresholds):
+    # 与分级规则一致：data <= t0 为第 0 级，t(i-1) < data <= t(i) 为第 i 级
+    return np.searchsorted(np.asarray(thresholds), values, side="left")
 
-    kmeans = KMeans(n_clusters=n_class, random_state=0).fit(valid_data)
-    centers = sorted(kmeans.cluster_centers_.flatten())
-    thresholds = [(centers[i] + centers[i + 1]) / 2 for i in range(len(centers) - 1)]
 
+def _threshold_drift(src, thresholds, n_class):
+    data = src.read(1)
+    valid_data = data[_valid_pixels(src, data)]
+    full_thresholds = _kmeans_thresholds(valid_data, n_class)
+
+    drift = np.abs(np.asarray(thresholds) - np.asarray(full_thresholds))
+    value_range = float(valid_data.max() - valid_data.min()) or 1.0
+    changed = np.count_nonzero(_class_index(valid_data, thresholds) != _class_index(valid_data, full_thresholds))
+    return {
+        "thresholds": [float(t) for t in thresholds],
+        "full_thresholds": [float(t) for t in full_thresholds],
+        "max_drift": float(drift.max()),
+        "max_relative_drift": float(drift.max() / value_range),
+        "changed_fraction": float(changed / valid_data.size)
+    }
+
+
+def natural_breaks_drift(raster_path, n_class=5, sample_size=DEFAULT_SAMPLE_SIZE, seed=0, block_size=None):
+    """
+    比较抽样断点与全量 KMeans 断点：返回两组断点、最大绝对/相对（占数据值域）漂移，
+    以及因断点漂移而改变等级的有效像元比例
+    """
+    with rasterio.open(raster_path) as src:
+        sample = sample_valid_pixels(src, sample_size, seed, block_size)
+        if sample.size == 0:
+            raise ValueError("Input raster has no valid data for classification!")
+        thresholds = _minibatch_thresholds(sample, n_class, seed)
+        return _threshold_drift(src, thresholds, n_class)
+
+
+def _classify_block(data, valid_mask, thresholds):
     scores = [1, 0.75, 0.5, 0.25, 0]
     classified = np.zeros_like(data, dtype=np.float32)
     for i, t in enumerate(thresholds):
@@ -45,58 +236,176 @@ def classify_natural_breaks(raster_path, out_path, n_class=5):
         else:
             classified[(data > thresholds[i - 1]) & (data <= t) & valid_mask] = scores[-1 - i]
     classified[(data > thresholds[-1]) & valid_mask] = scores[0]
+    return classified
+
 
-    # 添加透明通道
-    alpha_band = (valid_mask * 255).astype(np.uint8)
-    output_data = np.stack([classified, alpha_band], axis=0)
+def classify_natural_breaks(raster_path, out_path, n_class=5, method="kmeans", sample_size=DEFAULT_SAMPLE_SIZE,
+                            seed=0, block_size=None, report_drift=False, bins=DEFAULT_HISTOGRAM_BINS,
+                            output_profile=None):
+    """
+    自然断点分级
+    method="kmeans"  对全部有效像元做 KMeans（原始实现）
+    method="sampled" 分块分层抽取 sample_size 个有效像元并用 MiniBatchKMeans 求断点；
+                     report_drift=True 时额外做一次全量拟合并打印断点漂移（见 natural_breaks_drift）
+    method="histogram" 按窗口累加 bins 个分箱的直方图，在其上用动态规划求精确一维 k-means，
+                     全程按窗口读写（block_size 为空时用 DEFAULT_BLOCK_SIZE），无需整幅数组驻留内存
+    block_size 不为空时按窗口读取并写出分级结果
+    output_profile 为输出配置（见 OUTPUT_PROFILES），为空时使用 DEFAULT_OUTPUT_PROFILE
+    """
+    if method not in NATURAL_BREAKS_METHODS:
+        raise ValueError(f"Unknown natural breaks method: {method}")
 
-    profile.update(
-        dtype=rasterio.float32,
-        nodata=0,
-        crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
-        count=2
-    )
+    with rasterio.open(raster_path) as src:
+        print_crs_info(f"Input classified raster {raster_path}", src.crs)
+        profile = src.profile
+
+        data = None
+        if method == "kmeans":
+            data = src.read(1)
+            valid_data = data[_valid_pixels(src, data)]
+            if valid_data.size == 0:
+                raise ValueError("Input raster has no valid data for classification!")
+            thresholds = _kmeans_thresholds(valid_data, n_class)
+        elif method == "histogram":
+            block_size = block_size or DEFAULT_BLOCK_SIZE
+            counts, edges = streaming_histogram(src, bins, block_size)
+            if counts.sum() == 0:
+                raise ValueError("Input raster has no valid data for classification!")
+            thresholds = histogram_thresholds(counts, edges, n_class)
+            print(f"[INFO] Natural breaks from {bins}-bin histogram: {[round(float(t), 4) for t in thresholds]}")
+        else:
+            sample = sample_valid_pixels(src, sample_size, seed, block_size)
+            if sample.size == 0:
+                raise ValueError("Input raster has no valid data for classification!")
+            thresholds = _minibatch_thresholds(sample, n_class, seed)
+            print(f"[INFO] Natural breaks from {sample.size} sampled pixels: {[round(float(t), 4) for t in thresholds]}")
+            if report_drift:
+                report = _threshold_drift(src, thresholds, n_class)
+                print(f"[INFO] Threshold drift vs full fit: max {report['max_drift']:.4f} "
+                      f"({report['max_relative_drift']:.2%} of range), "
+                      f"{report['changed_fraction']:.2%} of pixels change class")
+
+        profile.update(
+            dtype=rasterio.float32,
+            nodata=0,
+            crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
+            count=output_band_count()
+        )
 
-    print_crs_info(f"Output classified raster {out_path}", profile["crs"])
+        print_crs_info(f"Output classified raster {out_path}", profile["crs"])
 
-    with rasterio.open(out_path, 'w', **profile) as dst:
-        dst.write(output_data)
+        windows = [None] if not block_size else list(iter_windows(src.height, src.width, block_size))
+        with open_output(out_path, profile, output_profile) as dst:
+            for window in windows:
+                block = data if data is not None and window is None else src.read(1, window=window)
+                valid_mask = _valid_pixels(src, block, window)
+                write_masked(dst, _classify_block(block, valid_mask, thresholds), valid_mask, window=window)
 
     return out_path
 
 
-def reclassify_landuse(landuse_path, out_path):
-    with rasterio.open(landuse_path) as src:
-        print_crs_info(f"Input land use raster {landuse_path}", src.crs)
-        data = src.read(1)
-        profile = src.profile
+# 土地利用类别代码 -> 适宜性等级（得分为 6 - 等级）
+LANDUSE_RECLASS = {
+    1: 4, 2: 4,
+    3: 3, 4: 3, 5: 3, 6: 3, 7: 3,
+    8: 2, 9: 2, 10: 2, 11: 2, 12: 2, 13: 2, 14: 2,
+    15: 2, 16: 2, 17: 2, 18: 2, 19: 2,
+    20: 5, 21: 5
+}
 
-    reclass = {
-        1: 4, 2: 4,
-        3: 3, 4: 3, 5: 3, 6: 3, 7: 3,
-        8: 2, 9: 2, 10: 2, 11: 2, 12: 2, 13: 2, 14: 2,
-        15: 2, 16: 2, 17: 2, 18: 2, 19: 2,
-        20: 5, 21: 5
-    }
+# 查找表允许的最大代码跨度，避免误传浮点连续值时分配过大的数组
+MAX_LUT_SIZE = 10 ** 7
 
-    out = np.zeros_like(data, dtype=np.float32)
-    for k, v in reclass.items():
-        out[data == k] = 6 - v
 
-    # 添加透明通道
-    alpha_band = (out > 0).astype(np.uint8) * 255
-    output_data = np.stack([out, alpha_band], axis=0)
+def _parse_code_key(key):
+    """映射键支持整数、(起, 止) 闭区间元组以及 JSON 中的 "起-止" 字符串"""
+    if isinstance(key, (tuple, list)):
+        low, high = key
+        return int(low), int(high)
+    if isinstance(key, str):
+        match = re.match(r"^\s*(-?\d+)\s*-\s*(-?\d+)\s*$", key)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+        return int(key), int(key)
+    return int(key), int(key)
 
-    profile.update(
-        dtype=rasterio.float32,
-        nodata=0,
-        crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
-        count=2
-    )
 
-    print_crs_info(f"Output reclassified land use raster {out_path}", profile["crs"])
+def build_lookup_table(mapping, default=0, dtype=np.float32):
+    """
+    将类别映射展开为查找表，返回 (lut, offset)：代码 k 的新值为 lut[k - offset]
+    """
+    ranges = []
+    for key, value in mapping.items():
+        low, high = _parse_code_key(key)
+        if low > high:
+            raise ValueError(f"Invalid code range in reclass mapping: {key}")
+        ranges.append((low, high, value))
+    if not ranges:
+        raise ValueError("Reclass mapping is empty!")
+
+    offset = min(low for low, _, _ in ranges)
+    size = max(high for _, high, _ in ranges) - offset + 1
+    if size > MAX_LUT_SIZE:
+        raise ValueError(f"Reclass code span {size} is too large for a lookup table")
+
+    lut = np.full(size, default, dtype=dtype)
+    for low, high, value in ranges:
+        lut[low - offset:high - offset + 1] = value
+    return lut, offset
+
+
+def _apply_lookup(data, lut, offset, valid_mask, default):
+    """一次向量化 gather 完成重分类；不在映射中的代码、非整数值与无效像元（valid_mask 为 False）取 default"""
+    if np.issubdtype(data.dtype, np.integer):
+        index = data.astype(np.int64) - offset
+        valid = (index >= 0) & (index < lut.size)
+    else:
+        valid = np.isfinite(data) & (np.mod(data, 1) == 0)
+        index = np.where(valid, data, offset).astype(np.int64) - offset
+        valid &= (index >= 0) & (index < lut.size)
+    if valid_mask is not None:
+        valid &= valid_mask
+
+    out = lut[np.where(valid, index, 0)]
+    out[~valid] = default
+    return out
+
+
+def reclassify(raster_path, out_path, mapping, default=0, block_size=None, label="reclassified", output_profile=None):
+    """
+    通用查找表重分类：mapping 为 {代码或代码区间: 新值}，
+    一次 lut[data] 取值完成全部类别映射，block_size 不为空时按窗口分块处理
+    """
+    lut, offset = build_lookup_table(mapping, default=default)
+
+    with rasterio.open(raster_path) as src:
+        print_crs_info(f"Input {label} raster {raster_path}", src.crs)
+        profile = src.profile
+
+        profile.update(
+            dtype=rasterio.float32,
+            nodata=0,
+            crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
+            count=output_band_count()
+        )
+
+        print_crs_info(f"Output {label} raster {out_path}", profile["crs"])
+
+        windows = [None] if not block_size else list(iter_windows(src.height, src.width, block_size))
+        with open_output(out_path, profile, output_profile) as dst:
+            for window in windows:
+                out = _apply_lookup(src.read(1, window=window), lut, offset, read_valid_mask(src, window), default)
+                write_masked(dst, out, out > 0, window=window)
+
+    return out_path
 
-    with rasterio.open(out_path, 'w', **profile) as dst:
-        dst.write(output_data)
 
-    return out_path
\ No newline at end of file
+def reclassify_landuse(landuse_path, out_path, mapping=None, block_size=None, output_profile=None):
+    """
+    土地利用重分类为适宜性得分；mapping 为空时使用 LANDUSE_RECLASS（得分 = 6 - 等级），
+    也可传入自定义的 {代码或代码区间: 得分} 方案
+    """
+    if mapping is None:
+        mapping = {k: 6 - v for k, v in LANDUSE_RECLASS.items()}
+    return reclassify(landuse_path, out_path, mapping, block_size=block_size, label="land use",
+                      output_profile=output_profile)
@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+from contextlib import ExitStack
+
+import numpy as np
+import rasterio
+from .align import open_aligned
+from .cache import file_fingerprint
+from .constants import print_crs_info, EPSG_27700_WKT
+from .output_profile import open_output, output_band_count, write_masked, read_filled
+from .raster_store import get_raster_store
+from .tiling import iter_windows, DEFAULT_BLOCK_SIZE
+
+# 因子堆栈超过该大小（字节）时改用磁盘上的 .npy memmap，不占用进程内存
+STACK_MEMMAP_BYTES = 1024 ** 3
+
+# 交互预览的像元数上限，preview_level 按此选择金字塔层级
+PREVIEW_PIXELS = 2_000_000
+
+
+class FactorStack:
+    """
+    因子堆栈：所有因子得分一次性读入 (n, H, W) float32 数组（大栅格为 memmap），
+    无效像元（见 read_valid_mask）与 NaN 置 0，与 weighted_overlay 的处理一致；
+    权重变化时只需一次 np.tensordot 即可得到新的适宜性得分，无需重新读取栅格
+    金字塔第 k 层为按 2^k 步长抽稀的堆栈，直接由原始堆栈切片得到；只有预览层级（preview_level）
+    复制为连续数组并缓存，其余层级为原始堆栈（或 memmap）的视图，不额外占用内存
+    """
+
+    def __init__(self, layers, profile):
+        self.layers = layers
+        self.profile = dict(profile)
+        self._preview = None
+
+    @classmethod
+    def from_rasters(cls, raster_paths, template_path=None, layer_types=None, block_size=None,
+                     memmap_bytes=STACK_MEMMAP_BYTES):
+        """
+        读取各因子栅格；template_path 不为空时经 open_aligned 按块对齐到模板网格（见 weighted_overlay 虚拟对齐），
+        否则要求各栅格已对齐
+        堆栈超过 memmap_bytes 时写入 RasterStore 目录下按输入文件指纹命名的 .npy，之后再次加载直接映射
+        """
+        layer_types = layer_types or ["categorical"] * len(raster_paths)
+        if len(layer_types) != len(raster_paths):
+            raise ValueError(f"Expected {len(raster_paths)} layer types, got {len(layer_types)}")
+
+        with ExitStack() as stack:
+            if template_path is not None:
+                template = stack.enter_context(rasterio.open(template_path))
+                sources = [stack.enter_context(open_aligned(path, template, layer_type))
+                           for path, layer_type in zip(raster_paths, layer_types)]
+                profile = template.profile
+            else:
+                sources = [stack.enter_context(rasterio.open(path)) for path in raster_paths]
+                profile = sources[-1].profile
+
+            height, width = sources[0].height, sources[0].width
+            for path, src in zip(raster_paths, sources):
+                print_crs_info(f"Input raster for factor stack {path}", src.crs)
+                if (src.height, src.width) != (height, width):
+                    raise ValueError(f"Raster {path} is not aligned with {raster_paths[0]}, align all inputs first!")
+
+            shape = (len(sources), height, width)
+            stack_path = None
+            if np.prod(shape) * 4 > memmap_bytes:
+                key = {"inputs": [file_fingerprint(path) for path in raster_paths],
+                       "template": file_fingerprint(template_path) if template_path else None,
+                       "layer_types": layer_types}
+                digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+                stack_path = os.path.join(get_raster_store().store_dir, f"stack_{digest}.npy")
+                if os.path.exists(stack_path):
+                    print(f"[INFO] Reusing factor stack {stack_path}")
+                    return cls(np.load(stack_path, mmap_mode="r"), profile)
+                temp_path = f"{stack_path}.{os.getpid()}.tmp"
+                layers = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=shape)
+            else:
+                layers = np.empty(shape, dtype=np.float32)
+
+            try:
+                for window in iter_windows(height, width, block_size or DEFAULT_BLOCK_SIZE):
+                    rows, cols = window.toslices()
+                    for i, src in enumerate(sources):
+                        layers[i, rows, cols] = read_filled(src, window)
+            except BaseException:
+                # 读取失败（或被中断）时删除写了一半的临时 memmap，避免残留在 RasterStore 目录
+                if stack_path is not None:
+                    del layers
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                raise
+
+        if stack_path is not None:
+            layers.flush()
+            del layers
+            os.replace(temp_path, stack_path)
+            layers = np.load(stack_path, mmap_mode="r")
+        return cls(layers, profile)
+
+    @property
+    def shape(self):
+        return self.layers.shape[1:]
+
+    def level(self, k):
+        """金字塔第 k 层（k=0 为原始分辨率）"""
+        if k == 0:
+            return self.layers
+        step = 2 ** k
+        if k != self.preview_level():
+            return self.layers[:, ::step, ::step]
+        if self._preview is None:
+            self._preview = np.ascontiguousarray(self.layers[:, ::step, ::step])
+        return self._preview
+
+    def preview_level(self, max_pixels=None):
+        """像元数不超过 max_pixels（默认 PREVIEW_PIXELS）的最精细金字塔层级"""
+        max_pixels = max_pixels or PREVIEW_PIXELS
+        height, width = self.shape
+        k = 0
+        while height * width > max_pixels and min(height, width) > 1:
+            height, width = (height + 1) // 2, (width + 1) // 2
+            k += 1
+        return k
+
+    def weighted_sum(self, weights, level=0):
+        layers = self.level(level)
+        weights = np.asarray(weights, dtype=np.float32)
+        if weights.shape != (layers.shape[0],):
+            raise ValueError(f"Expected {layers.shape[0]} weights, got {weights.size}")
+        return np.tensordot(weights, layers, axes=1)
+
+    def score(self, weights, level=0):
+        """按 weights 重新计算 0-100 适宜性得分（float32，公式同 weighted_overlay）"""
+        weighted_sum = self.weighted_sum(weights, level)
+        max_val = weighted_sum.max()
+        if max_val != 0:
+            weighted_sum *= np.float32(100 / max_val)
+        return weighted_sum
+
+    def write(self, weights, out_path, output_profile=None):
+        """以 weights 写出全分辨率适宜性得分栅格，格式与 weighted_overlay 的输出相同"""
+        score = self.score(weights)
+        profile = dict(self.profile)
+        profile.update(
+            dtype=rasterio.float32,
+            nodata=0,
+            crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
+            count=output_band_count()
+        )
+
+        print_crs_info(f"Output weighted overlay raster {out_path}", profile["crs"])
+
+        with open_output(out_path, profile, output_profile) as dst:
+            write_masked(dst, score, score > 0)
+        return out_path
@@ -0,0 +1,99 @@
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS as RasterioCRS
+from rasterio.features import geometry_window
+from rasterio.windows import Window, transform as window_transform
+from .constants import EPSG_27700_WKT
+from .boundary import get_boundary
+
+# 判断两个网格是否重合时，仿射参数按像元尺寸计的相对容差
+GRID_TOLERANCE = 1e-6
+
+
+class GridSpec:
+    """
+    输出网格（投影、仿射变换、行列数），在流水线开始时由边界和模板栅格计算一次，
+    各阶段据此直接写出位于同一网格上的结果，对齐阶段因此成为空操作
+    """
+
+    def __init__(self, transform, width, height, crs):
+        self.transform = Affine(*tuple(transform)[:6])
+        self.width = int(width)
+        self.height = int(height)
+        self.crs = RasterioCRS.from_user_input(crs)
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        return cls(dataset.transform, dataset.width, dataset.height, dataset.crs)
+
+    @classmethod
+    def from_raster(cls, path):
+        with rasterio.open(path) as src:
+            return cls.from_dataset(src)
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    @property
+    def cell_size(self):
+        return abs(self.transform.a), abs(self.transform.e)
+
+    def to_dict(self):
+        return {"transform": list(self.transform)[:6], "width": self.width, "height": self.height,
+                "crs": self.crs.to_wkt()}
+
+    @classmethod
+    def from_dict(cls, value):
+        return cls(value["transform"], value["width"], value["height"], value["crs"])
+
+    def __eq__(self, other):
+        # 投影按语义比较：同一坐标系写入文件后读回的 WKT 名称可能不同（如 "OSGB 1936" 与 "OSGB36"）
+        return (isinstance(other, GridSpec) and self.crs == other.crs
+                and (self.transform, self.width, self.height) == (other.transform, other.width, other.height))
+
+    def __hash__(self):
+        return hash((tuple(self.transform)[:6], self.width, self.height))
+
+    def __repr__(self):
+        # 阶段缓存键使用 repr，需要对同一网格保持稳定
+        return (f"GridSpec(transform={tuple(round(v, 9) for v in tuple(self.transform)[:6])}, "
+                f"width={self.width}, height={self.height}, crs={self.crs.to_wkt()!r})")
+
+    def _close(self, a, b):
+        return abs(a - b) <= GRID_TOLERANCE * max(self.cell_size)
+
+    def matches(self, dataset):
+        """数据集是否恰好位于该网格上"""
+        return (dataset.crs == self.crs and (dataset.height, dataset.width) == self.shape
+                and all(self._close(a, b) for a, b in zip(tuple(dataset.transform)[:6], tuple(self.transform)[:6])))
+
+    def window_in(self, dataset):
+        """
+        网格在数据集中对应的窗口：仅当两者投影、分辨率一致且网格原点落在数据集像元角点上时返回，
+        此时可直接按窗口读取（越界部分用 boundless 读取补 nodata），否则返回 None，需要重投影
+        """
+        src, dst = dataset.transform, self.transform
+        if dataset.crs != self.crs or not all(self._close(a, b) for a, b in
+                                              ((src.a, dst.a), (src.b, dst.b), (src.d, dst.d), (src.e, dst.e))):
+            return None
+        col, row = ~src * (dst.c, dst.f)
+        if abs(col - round(col)) > GRID_TOLERANCE or abs(row - round(row)) > GRID_TOLERANCE:
+            return None
+        return Window(int(round(col)), int(round(row)), self.width, self.height)
+
+    def profile(self, **overrides):
+        """该网格上新建 GeoTIFF 的基础 profile"""
+        profile = {"driver": "GTiff", "width": self.width, "height": self.height, "transform": self.transform,
+                   "crs": self.crs, "count": 1, "dtype": "float32", "nodata": 0}
+        profile.update(overrides)
+        return profile
+
+
+def grid_from_boundary(template_path, boundary_path):
+    """模板栅格按边界范围裁剪后的网格，与 crop_raster_to_boundary 对模板的输出网格一致"""
+    with rasterio.open(template_path) as src:
+        geom = get_boundary(boundary_path).union(EPSG_27700_WKT)
+        window = geometry_window(src, [geom])
+        return GridSpec(window_transform(window, src.transform), window.width, window.height,
+                        RasterioCRS.from_wkt(EPSG_27700_WKT))
@@ -0,0 +1,285 @@
+import os
+
+# 所有阶段写出栅格时共用的输出配置（分块、压缩、BigTIFF、COG）以及有效像元的表示方式
+#
+# 输出配置由各阶段的 output_profile 参数显式传入（流水线经阶段参数传递，阶段缓存键随之变化），
+# 默认 "legacy" 与原始输出一致；有效像元的表示方式由环境变量 GIS_LCA_MASK_MODE 决定，spawn 出的工作进程会继承。
+# 对比各预设的文件大小与读写速度：
+#
+#     python -m geoprocessing.raster_processing.output_profile input.tif --repeat 3
+
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from contextlib import contextmanager
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import ColorInterp, MaskFlags
+
+# GeoTIFF 分块大小
+OUTPUT_BLOCK_SIZE = 512
+
+# 预估未压缩大小超过该值时强制 BIGTIFF=YES（压缩后 IF_SAFER 无法可靠判断）
+BIGTIFF_THRESHOLD = 3.5 * 1024 ** 3
+
+# 输出配置预设；predictor="auto" 时整型用水平差分 (2)，浮点用浮点预测 (3)
+OUTPUT_PROFILES = {
+    "legacy": {},
+    "tiled": {"tiled": True},
+    "deflate": {"tiled": True, "compress": "deflate", "zlevel": 6, "predictor": "auto"},
+    "zstd": {"tiled": True, "compress": "zstd", "zstd_level": 9, "predictor": "auto"},
+    "lerc": {"tiled": True, "compress": "lerc", "max_z_error": 0},
+    "lerc_zstd": {"tiled": True, "compress": "lerc_zstd", "max_z_error": 0},
+    "cog": {"tiled": True, "compress": "deflate", "zlevel": 6, "predictor": "auto", "cog": True},
+}
+
+DEFAULT_OUTPUT_PROFILE = "legacy"
+
+MASK_MODE_ENV = "GIS_LCA_MASK_MODE"
+
+# 有效像元的表示方式："alpha" 追加 uint8 alpha 波段（原始布局），"mask" 写 GDAL 内部掩膜波段，
+# "nodata" 只依靠 nodata 值（值恰好等于 nodata 的有效像元会被视为无效）
+MASK_MODES = ("alpha", "mask", "nodata")
+
+DEFAULT_MASK_MODE = "alpha"
+
+# 由输出配置接管的创建参数，源栅格 profile 中的同名项会被丢弃
+_MANAGED_KEYS = ("tiled", "blockxsize", "blockysize", "compress", "predictor", "zlevel", "zstd_level",
+                 "max_z_error", "num_threads", "bigtiff", "photometric")
+
+
+def resolve_output_profile(profile=None):
+    """把预设名 / JSON 字符串 / 字典解析为配置字典；None 表示 DEFAULT_OUTPUT_PROFILE"""
+    if profile is None:
+        profile = DEFAULT_OUTPUT_PROFILE
+    if isinstance(profile, dict):
+        return dict(profile)
+    if profile in OUTPUT_PROFILES:
+        return dict(OUTPUT_PROFILES[profile])
+    if isinstance(profile, str) and profile.lstrip().startswith("{"):
+        return json.loads(profile)
+    raise ValueError(f"Unknown output profile: {profile}")
+
+
+def set_mask_mode(mode):
+    """设置有效像元的表示方式（见 MASK_MODES），None 恢复默认"""
+    if mode is None:
+        os.environ.pop(MASK_MODE_ENV, None)
+        return
+    if mode not in MASK_MODES:
+        raise ValueError(f"Unknown mask mode: {mode}")
+    os.environ[MASK_MODE_ENV] = mode
+
+
+def active_mask_mode():
+    mode = os.environ.get(MASK_MODE_ENV, DEFAULT_MASK_MODE)
+    if mode not in MASK_MODES:
+        raise ValueError(f"Unknown mask mode: {mode}")
+    return mode
+
+
+def output_band_count(data_bands=1):
+    """输出文件的波段数：alpha 模式多一个 alpha 波段"""
+    return data_bands + 1 if active_mask_mode() == "alpha" else data_bands
+
+
+def write_masked(dst, data, valid, window=None):
+    """
+    写出数据波段及有效性（valid 为二维布尔数组），替代 np.stack([data, alpha]) 后整体写入
+    alpha 模式把 valid 写入最后一个波段并标记为 alpha，mask 模式写 GDAL 内部掩膜，nodata 模式只写数据
+    """
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    bands = data.shape[0]
+    # 标记 alpha 波段后，read_masks / dataset_mask 可直接得到有效性（GTiff 要求在写入数据前设置）
+    if dst.count > bands and dst.colorinterp[bands] != ColorInterp.alpha:
+        dst.colorinterp = list(dst.colorinterp[:bands]) + [ColorInterp.alpha]
+    dst.write(data, indexes=list(range(1, bands + 1)), window=window)
+
+    if dst.count > bands:
+        dst.write((valid * 255).astype(dst.dtypes[bands]), indexes=bands + 1, window=window)
+    elif active_mask_mode() == "mask":
+        dst.write_mask(valid, window=window)
+
+
+def validity_source(src):
+    """
+    数据集有效性的来源："alpha"（末波段为 alpha 波段）、"mask"（内部或外部掩膜波段）、
+    "nodata"（nodata 值，未设置 nodata 时全部有效）
+    """
+    if src.count > 1 and src.colorinterp[-1] == ColorInterp.alpha:
+        return "alpha"
+    if MaskFlags.per_dataset in src.mask_flag_enums[0]:
+        return "mask"
+    return "nodata"
+
+
+def read_valid_mask(src, window=None):
+    """
+    读取有效像元掩膜（True 为有效）：alpha 布局直接读 alpha 波段，
+    否则读 GDAL 掩膜（内部掩膜波段或 nodata）；dataset_mask 会把 alpha 波段自身的 nodata 掩膜并入，不能直接使用
+    """
+    if validity_source(src) == "alpha":
+        return src.read(src.count, window=window) > 0
+    return src.read_masks(1, window=window) > 0
+
+
+def read_filled(src, window=None, dtype=np.float32):
+    """
+    读取第 1 波段，无效像元（read_valid_mask 为 False）与 NaN 置 0
+    有效性取自掩膜而不是 data == nodata，mask / alpha 模式下值恰好为 0 的有效得分不会被当作 nodata
+    """
+    data = src.read(1, window=window).astype(dtype)
+    return np.where(read_valid_mask(src, window) & ~np.isnan(data), data, 0).astype(dtype, copy=False)
+
+
+def _io_threads():
+    # 调度器按工作进程数分配 GDAL_NUM_THREADS，未设置时使用全部 CPU
+    try:
+        return rasterio.env.getenv().get("GDAL_NUM_THREADS", "ALL_CPUS")
+    except Exception:
+        return "ALL_CPUS"
+
+
+def build_profile(profile, output_profile=None):
+    """在源栅格 profile 基础上套用输出配置，返回 (创建参数, 是否转为 COG)"""
+    options = resolve_output_profile(output_profile)
+    if not options:
+        return dict(profile), False
+
+    creation = {key: value for key, value in profile.items() if key not in _MANAGED_KEYS}
+    creation["driver"] = "GTiff"
+    cog = bool(options.pop("cog", False))
+
+    if options.pop("tiled", False):
+        block_size = options.pop("block_size", OUTPUT_BLOCK_SIZE)
+        creation.update(tiled=True, blockxsize=block_size, blockysize=block_size)
+
+    if options.get("predictor") == "auto":
+        is_float = np.issubdtype(np.dtype(creation["dtype"]), np.floating)
+        options["predictor"] = 3 if is_float else 2
+    creation.update(options)
+
+    if creation.get("compress"):
+        creation.setdefault("num_threads", _io_threads())
+
+    raw_bytes = creation["width"] * creation["height"] * creation["count"] * np.dtype(creation["dtype"]).itemsize
+    creation.setdefault("bigtiff", "YES" if raw_bytes > BIGTIFF_THRESHOLD else "IF_SAFER")
+    return creation, cog
+
+
+def _cog_options(creation):
+    options = {"blocksize": creation.get("blockxsize", OUTPUT_BLOCK_SIZE), "bigtiff": creation["bigtiff"],
+               "num_threads": creation.get("num_threads", "ALL_CPUS"), "overviews": "AUTO"}
+    if creation.get("compress"):
+        options["compress"] = creation["compress"]
+    if creation.get("predictor"):
+        options["predictor"] = "FLOATING_POINT" if creation["predictor"] == 3 else "STANDARD"
+    if creation.get("zlevel"):
+        options["level"] = creation["zlevel"]
+    return options
+
+
+@contextmanager
+def open_output(out_path, profile, output_profile=None):
+    """
+    按输出配置 output_profile（为空时使用 DEFAULT_OUTPUT_PROFILE）打开待写栅格，替代 rasterio.open(out_path, 'w', **profile)
+    COG 驱动不支持逐块写入，因此先写分块 GeoTIFF 临时文件，关闭后再复制为 COG
+    """
+    creation, cog = build_profile(profile, output_profile)
+    if not cog:
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), rasterio.open(out_path, 'w', **creation) as dst:
+            yield dst
+        return
+
+    temp_path = f"{os.path.splitext(out_path)[0]}.tmp.tif"
+    try:
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), rasterio.open(temp_path, 'w', **creation) as dst:
+            yield dst
+        rasterio.shutil.copy(temp_path, out_path, driver="COG", **_cog_options(creation))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def gdal_env(num_threads="ALL_CPUS"):
+    """GDAL 多线程读写环境（解压缩 / 压缩线程数）"""
+    return rasterio.Env(GDAL_NUM_THREADS=str(num_threads))
+
+
+def benchmark_output_profiles(raster_path, profiles=None, repeat=1, work_dir=None):
+    """
+    用各输出配置重写 raster_path，记录文件大小、写入与按块读取的吞吐量（MB/s，按未压缩大小计）
+    """
+    profiles = list(profiles or OUTPUT_PROFILES)
+    # 只删除自己创建的临时目录；调用方给定的目录只清理本函数写出的文件
+    own_dir = work_dir is None
+    work_dir = tempfile.mkdtemp(prefix="gis_lca_profile_") if own_dir else work_dir
+    written = []
+    with rasterio.open(raster_path) as src:
+        profile = src.profile
+        data = src.read()
+    raw_mb = data.nbytes / 1024 ** 2
+
+    results = []
+    try:
+        for name in profiles:
+            out_path = os.path.join(work_dir, f"{name}.tif")
+            written.append(out_path)
+            write_s, read_s = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                with gdal_env(), open_output(out_path, profile, name) as dst:
+                    dst.write(data)
+                write_s.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                with gdal_env(), rasterio.open(out_path) as src:
+                    for _, window in src.block_windows(1):
+                        src.read(window=window)
+                read_s.append(time.perf_counter() - start)
+
+            size = os.path.getsize(out_path)
+            results.append({
+                "profile": name,
+                "bytes": size,
+                "ratio": size / data.nbytes,
+                "write_seconds": min(write_s),
+                "read_seconds": min(read_s),
+                "write_mb_s": raw_mb / min(write_s),
+                "read_mb_s": raw_mb / min(read_s),
+            })
+            print(f"[INFO] {name:<10} {size / 1024 ** 2:9.1f} MB  write {raw_mb / min(write_s):8.1f} MB/s  "
+                  f"read {raw_mb / min(read_s):8.1f} MB/s")
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            for out_path in written:
+                if os.path.exists(out_path):
+                    os.remove(out_path)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark GeoTIFF output profiles")
+    parser.add_argument("raster", help="Raster to rewrite with each profile")
+    parser.add_argument("--profiles", nargs="+", default=None, help="Profile names (default: all presets)")
+    parser.add_argument("--repeat", type=int, default=1, help="Repetitions per profile (best time is kept)")
+    parser.add_argument("--json", default=None, help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = benchmark_output_profiles(args.raster, args.profiles, args.repeat)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,21 +15,48 @@ try:
 except Exception as e:
     print(f"⚠️ Failed to load EPSG:27700, using WKT string instead: {e}")
 
+from contextlib import ExitStack
+
 import rasterio
 import numpy as np
+from rasterio.vrt import WarpedVRT
+from tqdm import tqdm
+from .align import open_aligned
+from .factor_stack import FactorStack
 from .constants import print_crs_info, EPSG_27700_WKT
+from .output_profile import open_output, output_band_count, write_masked, read_filled
+from .tiling import iter_windows, DEFAULT_BLOCK_SIZE
+
+# 批量叠加时单次矩阵乘法的 情景数 × 像元数 上限，控制中间数组的内存占用
+BATCH_CHUNK_ELEMENTS = 1 << 24
+
+# 求前 top_fraction 得分阈值时使用的 0-100 得分直方图分箱数（分辨率 0.01 分）；
+# 直方图按情景分批累计，每批 情景数 × 分箱数 同样不超过 BATCH_CHUNK_ELEMENTS
+SCORE_HISTOGRAM_BINS = 10000
+
+def weighted_overlay(raster_paths, weights, out_path, block_size=None, template_path=None, layer_types=None,
+                     output_profile=None):
+    """
+    加权叠加各因子栅格并归一化到 0-100
+    block_size 不为空时按窗口分块流式计算，内存占用与栅格大小无关，结果与整幅计算逐位一致
+    template_path 不为空时为虚拟对齐模式：输入无需事先对齐，各层通过 open_aligned 按块即时重投影到模板网格
+    （layer_types 决定各层的重采样方式），始终分块计算，block_size 为空时使用 DEFAULT_BLOCK_SIZE
+    output_profile 为输出配置（见 OUTPUT_PROFILES），为空时使用 DEFAULT_OUTPUT_PROFILE
+    """
+    if template_path is not None:
+        return _weighted_overlay_virtual(raster_paths, weights, out_path, block_size or DEFAULT_BLOCK_SIZE,
+                                         template_path, layer_types, output_profile)
+
+    if block_size:
+        return _weighted_overlay_windowed(raster_paths, weights, out_path, block_size, output_profile)
 
-def weighted_overlay(raster_paths, weights, out_path):
     layers = []
     profile = None
     for path in raster_paths:
         with rasterio.open(path) as src:
             print_crs_info(f"Input raster for weighted overlay {path}", src.crs)
-            data = src.read(1).astype(float)  # 只读取数据波段
+            layers.append(read_filled(src, dtype=float))  # 只读取数据波段
             profile = src.profile
-            nodata = src.nodata
-            data = np.where((data == nodata) | np.isnan(data), 0, data)
-            layers.append(data)
 
     weighted_sum = np.zeros_like(layers[0])
     for i, layer in enumerate(layers):
@@ -38,20 +65,261 @@ def weighted_overlay(raster_paths, weights, out_path):
     max_val = np.nanmax(weighted_sum)
     score = (weighted_sum / max_val) * 100 if max_val != 0 else weighted_sum
 
-    # 添加透明通道
-    alpha_band = (score > 0).astype(np.uint8) * 255
-    output_data = np.stack([score.astype(np.float32), alpha_band], axis=0)
-
     profile.update(
         dtype=rasterio.float32,
         nodata=0,
         crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
-        count=2
+        count=output_band_count()
     )
 
     print_crs_info(f"Output weighted overlay raster {out_path}", profile["crs"])
 
-    with rasterio.open(out_path, 'w', **profile) as dst:
-        dst.write(output_data)
+    with open_output(out_path, profile, output_profile) as dst:
+        write_masked(dst, score.astype(np.float32), score > 0)
+
+    return out_path
+
+
+def _read_weighted_tile(sources, weights, window):
+    """读取所有输入在同一窗口内的数据并累加加权和（运算顺序与整幅模式一致）"""
+    weighted_sum = None
+    for src, weight in zip(sources, weights):
+        data = read_filled(src, window, dtype=float)
+        if weighted_sum is None:
+            weighted_sum = np.zeros_like(data)
+        weighted_sum += data * weight
+    return weighted_sum
+
+
+def _weighted_overlay_windowed(raster_paths, weights, out_path, block_size, output_profile=None):
+    sources = [rasterio.open(path) for path in raster_paths]
+    try:
+        ref = sources[0]
+        for path, src in zip(raster_paths, sources):
+            print_crs_info(f"Input raster for weighted overlay {path}", src.crs)
+            if (src.height, src.width) != (ref.height, ref.width):
+                raise ValueError(f"Raster {path} is not aligned with {raster_paths[0]}, align all inputs first!")
+
+        _overlay_sources(sources, weights, out_path, block_size, sources[-1].profile, output_profile)
+    finally:
+        for src in sources:
+            src.close()
+
+    return out_path
+
+
+def _weighted_overlay_virtual(raster_paths, weights, out_path, block_size, template_path, layer_types,
+                              output_profile=None):
+    layer_types = layer_types or ["categorical"] * len(raster_paths)
+    if len(layer_types) != len(raster_paths):
+        raise ValueError(f"Expected {len(raster_paths)} layer types, got {len(layer_types)}")
+
+    with rasterio.open(template_path) as template, ExitStack() as stack:
+        print_crs_info(f"Template raster {template_path}", template.crs)
+        sources = []
+        for path, layer_type in zip(raster_paths, layer_types):
+            src = stack.enter_context(open_aligned(path, template, layer_type))
+            kind = "virtual warp" if isinstance(src, WarpedVRT) else "on template grid"
+            print_crs_info(f"Input raster for weighted overlay ({kind}) {path}", src.crs)
+            sources.append(src)
+
+        _overlay_sources(sources, weights, out_path, block_size, template.profile, output_profile)
 
     return out_path
+
+
+def _overlay_sources(sources, weights, out_path, block_size, profile, output_profile=None):
+    """对已位于同一网格上的数据集句柄做两遍分块叠加"""
+    ref = sources[0]
+    windows = list(iter_windows(ref.height, ref.width, block_size))
+
+    # 第一遍：逐块计算加权和，只保留全局最大值
+    max_val = None
+    for window in tqdm(windows, desc="Weighted overlay (pass 1/2)"):
+        tile_max = np.nanmax(_read_weighted_tile(sources, weights, window))
+        max_val = tile_max if max_val is None else max(max_val, tile_max)
+
+    profile = dict(profile)
+    profile.update(
+        dtype=rasterio.float32,
+        nodata=0,
+        crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
+        count=output_band_count()
+    )
+
+    print_crs_info(f"Output weighted overlay raster {out_path}", profile["crs"])
+
+    # 第二遍：重新计算加权和，按全局最大值归一化后逐块写出
+    with open_output(out_path, profile, output_profile) as dst:
+        for window in tqdm(windows, desc="Weighted overlay (pass 2/2)"):
+            weighted_sum = _read_weighted_tile(sources, weights, window)
+            score = (weighted_sum / max_val) * 100 if max_val != 0 else weighted_sum
+            write_masked(dst, score.astype(np.float32), score > 0, window=window)
+
+
+def _factor_matrix(sources, window):
+    """窗口内各因子展平为 (n, 像元数) float32 矩阵，无效像元与 NaN 置 0"""
+    if isinstance(sources, FactorStack):
+        rows, cols = window.toslices()
+        return np.asarray(sources.layers[:, rows, cols]).reshape(len(sources.layers), -1)
+
+    matrix = np.empty((len(sources), window.height * window.width), dtype=np.float32)
+    for i, src in enumerate(sources):
+        matrix[i] = read_filled(src, window).ravel()
+    return matrix
+
+
+def _iter_batch_scores(sources, weight_matrix, windows, scale=None):
+    """
+    逐块、逐段计算全部情景的加权和 (N, 像元数)，scale 不为空时乘以各情景的归一化系数得到 0-100 得分
+    每个窗口只读取一次，段长按 BATCH_CHUNK_ELEMENTS 限制
+    """
+    chunk = max(1, BATCH_CHUNK_ELEMENTS // len(weight_matrix))
+    for window in windows:
+        matrix = _factor_matrix(sources, window)
+        for start in range(0, matrix.shape[1], chunk):
+            scores = weight_matrix @ matrix[:, start:start + chunk]
+            if scale is not None:
+                scores *= scale[:, None]
+            yield window, start, scores
+
+
+def _add_to_histogram(histogram, scores):
+    """把一段 0-100 得分的有效像元（> 0）累加到 (情景数, SCORE_HISTOGRAM_BINS) 直方图"""
+    bins = np.clip((scores * (SCORE_HISTOGRAM_BINS / 100)).astype(np.int64), 0, SCORE_HISTOGRAM_BINS - 1)
+    bins += (np.arange(len(histogram)) * SCORE_HISTOGRAM_BINS)[:, None]
+    histogram += np.bincount(bins[scores > 0], minlength=histogram.size).reshape(histogram.shape)
+
+
+def _top_cutoffs(histogram, valid_counts, top_fraction):
+    """由各情景的得分直方图求前 top_fraction 得分阈值（分箱下边界）"""
+    from_top = np.cumsum(histogram[:, ::-1], axis=1)
+    needed = np.maximum(1, np.ceil(top_fraction * valid_counts))[:, None]
+    top_bins = SCORE_HISTOGRAM_BINS - 1 - np.argmax(from_top >= needed, axis=1)
+    return (top_bins * (100 / SCORE_HISTOGRAM_BINS)).astype(np.float32)
+
+
+def batch_weighted_overlay(factors, weight_matrix, threshold=50.0, top_fraction=None, stability_path=None,
+                           block_size=None, template_path=None, layer_types=None, output_profile=None):
+    """
+    一次计算 N 组权重（weight_matrix 形状为 (N, 因子数)）下的适宜性得分统计，不写出 N 幅栅格
+    factors 为已对齐的因子栅格路径列表（template_path 不为空时经 open_aligned 虚拟对齐）或 FactorStack
+    每块因子数据经一次矩阵乘法得到全部情景的得分，归一化方式与 weighted_overlay 相同；
+    第一遍求各情景最大值，第二遍统计，给出 top_fraction 时第三遍按各情景前 top_fraction 得分阈值统计入选频率；
+    top_fraction 所需的得分直方图按情景分批累计，情景数超过一批时每批额外读一遍数据，内存与情景总数无关
+    返回每个情景的统计字典列表：平均得分、有效像元数、得分 ≥ threshold 的像元数/面积/占比等
+    stability_path 不为空时写出排序稳定性栅格：各像元入选（得分 ≥ threshold，或位于前 top_fraction）的情景比例
+    """
+    weight_matrix = np.atleast_2d(np.asarray(weight_matrix, dtype=np.float32))
+    if top_fraction is not None and not 0 < top_fraction <= 1:
+        raise ValueError(f"top_fraction must be in (0, 1], got {top_fraction}")
+
+    with ExitStack() as stack:
+        if isinstance(factors, FactorStack):
+            sources = factors
+            n_factors, (height, width) = len(factors.layers), factors.shape
+            profile = factors.profile
+        else:
+            layer_types = layer_types or ["categorical"] * len(factors)
+            if template_path is not None:
+                template = stack.enter_context(rasterio.open(template_path))
+                sources = [stack.enter_context(open_aligned(path, template, layer_type))
+                           for path, layer_type in zip(factors, layer_types)]
+                profile = template.profile
+            else:
+                sources = [stack.enter_context(rasterio.open(path)) for path in factors]
+                profile = sources[-1].profile
+            for path, src in zip(factors, sources):
+                print_crs_info(f"Input raster for batch overlay {path}", src.crs)
+                if (src.height, src.width) != (sources[0].height, sources[0].width):
+                    raise ValueError(f"Raster {path} is not aligned with {factors[0]}, align all inputs first!")
+            n_factors, height, width = len(sources), sources[0].height, sources[0].width
+
+        if weight_matrix.shape[1] != n_factors:
+            raise ValueError(f"Expected weight matrix with {n_factors} columns, got shape {weight_matrix.shape}")
+        n_scenarios = len(weight_matrix)
+        windows = list(iter_windows(height, width, block_size or DEFAULT_BLOCK_SIZE))
+
+        # 第一遍：各情景加权和的全局最大值
+        max_vals = np.full(n_scenarios, -np.inf, dtype=np.float32)
+        for _, _, scores in tqdm(_iter_batch_scores(sources, weight_matrix, windows), desc="Batch overlay (pass 1)"):
+            np.maximum(max_vals, scores.max(axis=1), out=max_vals)
+        scale = np.where(max_vals != 0, 100 / np.where(max_vals != 0, max_vals, 1), 1).astype(np.float32)
+
+        profile = dict(profile)
+        profile.update(dtype=rasterio.float32, nodata=0, crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
+                       count=output_band_count())
+        dst = stack.enter_context(open_output(stability_path, profile, output_profile)) if stability_path else None
+
+        def write_frequency(window, start, selected, valid, buffers):
+            # 同一窗口的各段拼接完整后再写出
+            frequency, any_valid = buffers.setdefault(window, (np.zeros(window.height * window.width, np.float32),
+                                                               np.zeros(window.height * window.width, bool)))
+            end = start + selected.shape[1]
+            frequency[start:end] = selected.mean(axis=0)
+            any_valid[start:end] = valid.any(axis=0)
+            if end == frequency.size:
+                del buffers[window]
+                shape = (window.height, window.width)
+                write_masked(dst, frequency.reshape(shape), any_valid.reshape(shape), window=window)
+
+        # 第二遍：平均得分、超过阈值的像元数；情景数不超过一批时同时累计 0-100 得分直方图
+        score_sums = np.zeros(n_scenarios)
+        valid_counts = np.zeros(n_scenarios, dtype=np.int64)
+        above_counts = np.zeros(n_scenarios, dtype=np.int64)
+        histogram_batch = max(1, BATCH_CHUNK_ELEMENTS // SCORE_HISTOGRAM_BINS)
+        histogram = None
+        if top_fraction and n_scenarios <= histogram_batch:
+            histogram = np.zeros((n_scenarios, SCORE_HISTOGRAM_BINS), dtype=np.int64)
+        buffers = {}
+        for window, start, scores in tqdm(_iter_batch_scores(sources, weight_matrix, windows, scale),
+                                          desc="Batch overlay (pass 2)"):
+            valid = scores > 0
+            above = valid & (scores >= threshold)
+            score_sums += np.where(valid, scores, 0).sum(axis=1, dtype=np.float64)
+            valid_counts += valid.sum(axis=1)
+            above_counts += above.sum(axis=1)
+            if histogram is not None:
+                _add_to_histogram(histogram, scores)
+            elif dst is not None and not top_fraction:
+                write_frequency(window, start, above, valid, buffers)
+
+        # 第三遍（仅 top_fraction）：由直方图得到各情景的前 top_fraction 得分阈值，统计入选频率
+        cutoffs = None
+        if top_fraction:
+            cutoffs = np.empty(n_scenarios, dtype=np.float32)
+            for first in range(0, n_scenarios, histogram_batch):
+                rows = slice(first, first + histogram_batch)
+                if histogram is None:
+                    # 情景数超过一批：每批单独读一遍数据累计该批的直方图
+                    histogram = np.zeros((len(weight_matrix[rows]), SCORE_HISTOGRAM_BINS), dtype=np.int64)
+                    for _, _, scores in tqdm(_iter_batch_scores(sources, weight_matrix[rows], windows, scale[rows]),
+                                             desc=f"Batch overlay (histogram, scenarios {first}+)"):
+                        _add_to_histogram(histogram, scores)
+                cutoffs[rows] = _top_cutoffs(histogram, valid_counts[rows], top_fraction)
+                histogram = None
+            if dst is not None:
+                for window, start, scores in tqdm(_iter_batch_scores(sources, weight_matrix, windows, scale),
+                                                  desc="Batch overlay (pass 3)"):
+                    valid = scores > 0
+                    write_frequency(window, start, valid & (scores >= cutoffs[:, None]), valid, buffers)
+
+    pixel_area = abs(profile["transform"].a * profile["transform"].e)
+    stats = []
+    for i in range(n_scenarios):
+        entry = {
+            "weights": weight_matrix[i].tolist(),
+            "max_weighted_sum": float(max_vals[i]),
+            "valid_pixels": int(valid_counts[i]),
+            "mean_score": float(score_sums[i] / valid_counts[i]) if valid_counts[i] else 0.0,
+            "pixels_above": int(above_counts[i]),
+            "area_above": float(above_counts[i] * pixel_area),
+            "fraction_above": float(above_counts[i] / valid_counts[i]) if valid_counts[i] else 0.0,
+        }
+        if cutoffs is not None:
+            entry["top_cutoff"] = float(cutoffs[i])
+        stats.append(entry)
+
+    if stability_path:
+        print(f"[INFO] Rank stability map written to {stability_path}")
+    return stats
@@ -0,0 +1,167 @@
+import os
+
+from .vector_clip import clip_vector_to_boundary
+from .raster_crop import crop_raster_to_boundary
+from .terrain_analysis import compute_slope
+from .buffer_rasterize import buffer_and_rasterize
+from .classify import classify_natural_breaks, reclassify_landuse
+from .overlay import weighted_overlay
+from .align import align_raster_to_template
+from .grid import grid_from_boundary
+from .output_profile import DEFAULT_OUTPUT_PROFILE
+from .scheduler import Stage, StageRef
+
+# 流水线需要的输入数据
+INPUT_KEYS = ["landuse", "dem", "solar", "wind", "road", "water", "reserve", "boundary"]
+
+# 参与加权叠加的因子顺序（与权重顺序一一对应）
+FACTOR_KEYS = ["landuse", "slope", "solar", "wind", "road", "water", "reserve"]
+
+# 输出到共享网格时各输入栅格的重采样方式（土地利用为类别代码，其余为连续值）
+CROP_RESAMPLING = {"landuse": "nearest", "dem": "bilinear", "solar": "bilinear", "wind": "bilinear"}
+
+# 对齐时各因子的图层类型：对齐发生在分级之后，土地利用、坡度、光照、风能与各缓冲区因子都已是离散的等级得分，
+# 均按类别型（最近邻）处理，避免插值出不属于任何等级的得分
+FACTOR_LAYER_TYPES = {"landuse": "categorical", "slope": "categorical", "solar": "categorical", "wind": "categorical",
+                      "road": "categorical", "water": "categorical", "reserve": "categorical"}
+
+# 中间结果缓存目录（位于输出目录下）
+CACHE_DIR_NAME = ".gis_lca_cache"
+
+# 缓冲区分级距离（米）与对应得分
+DEFAULT_BUFFER_PARAMS = {
+    "road": {"breaks": [1000, 3000, 5000], "scores": [1, 0.8, 0.5, 0.2], "reverse": False},
+    "water": {"breaks": [500, 1000, 2000], "scores": [1, 0.8, 0.6, 0.3], "reverse": False},
+    "reserve": {"breaks": [1000, 2000, 5000], "scores": [0, 0.2, 0.6, 1], "reverse": True},
+}
+
+
+def build_suitability_stages(inputs, weights, out_dir, buffer_params=None, grid_size=None, n_class=5,
+                             buffer_method="buffer", clip_chunk_size=None, clip_engine="threads", block_size=None,
+                             landuse_mapping=None, classify_method="kmeans", classify_sample_size=None,
+                             slope_method="gradient", virtual_align=False, shared_grid=False, output_profile=None):
+    """
+    构建适宜性分析流水线的阶段依赖图
+    inputs 为 INPUT_KEYS 到文件路径的字典，weights 按 FACTOR_KEYS 顺序排列
+    grid_size 为空时坡度按 DEM 仿射变换的 x/y 像元尺寸计算，slope_method 见 SLOPE_METHODS
+    buffer_method 传给 buffer_and_rasterize（"buffer" 或 "distance"）
+    clip_chunk_size 不为空时矢量裁剪按块流式读取，clip_engine 选择裁剪引擎（"threads" 或 "vectorized"）
+    block_size 不为空时栅格阶段按窗口分块处理
+    classify_method / classify_sample_size 传给 classify_natural_breaks（"kmeans"、"sampled" 或 "histogram"）
+    shared_grid=True 时先计算共享网格（GridSpec），栅格裁剪与缓冲直接输出到该网格，对齐阶段随之成为空操作
+    virtual_align=True 时不生成对齐阶段，叠加阶段直接以 WarpedVRT 按块读取各因子（见 weighted_overlay）
+    landuse_mapping 为自定义的土地利用 {代码或代码区间: 得分} 方案，为空时使用 LANDUSE_RECLASS
+    output_profile 为各栅格阶段的输出配置（见 OUTPUT_PROFILES），为空时使用 DEFAULT_OUTPUT_PROFILE；
+    作为阶段参数传入，因此也是阶段缓存键的一部分
+    返回阶段列表，最终结果阶段名为 "overlay"
+    """
+    missing = [key for key in INPUT_KEYS if not inputs.get(key)]
+    if missing:
+        raise ValueError(f"Missing pipeline inputs: {missing}")
+    if len(weights) != len(FACTOR_KEYS):
+        raise ValueError(f"Expected {len(FACTOR_KEYS)} weights, got {len(weights)}")
+
+    params = {key: dict(value) for key, value in DEFAULT_BUFFER_PARAMS.items()}
+    for key, value in (buffer_params or {}).items():
+        params.setdefault(key, {}).update(value)
+
+    # 解析为具体的预设名，缓存键不随默认值的变化而失真
+    output_profile = output_profile or DEFAULT_OUTPUT_PROFILE
+    classify_kwargs = {"n_class": n_class, "method": classify_method, "block_size": block_size,
+                       "output_profile": output_profile}
+    if classify_sample_size:
+        classify_kwargs["sample_size"] = classify_sample_size
+
+    boundary = inputs["boundary"]
+    ref_raster = inputs["landuse"]
+    stages = []
+
+    # 0. 共享网格：由土地利用栅格和边界计算一次，栅格裁剪与缓冲直接输出到该网格
+    crop_kwargs = {key: {"block_size": block_size, "output_profile": output_profile} for key in CROP_RESAMPLING}
+    buffer_grid = {}
+    if shared_grid:
+        stages.append(Stage("grid", grid_from_boundary, (ref_raster, boundary), description="Computing shared grid"))
+        for key, resampling in CROP_RESAMPLING.items():
+            crop_kwargs[key].update(grid=StageRef("grid"), resampling=resampling)
+        buffer_grid = {"grid": StageRef("grid")}
+
+    # 1. 裁剪矢量（三个图层互不依赖）
+    vector_labels = {"road": "road", "water": "water", "reserve": "protected area"}
+    for key, label in vector_labels.items():
+        out_path = f"{out_dir}/{key}_clip.shp"
+        stages.append(Stage(f"{key}_clip", clip_vector_to_boundary, (inputs[key], boundary, out_path),
+                            {"chunk_size": clip_chunk_size, "engine": clip_engine},
+                            out_path=out_path, description=f"Clipping {label} vector"))
+
+    # 2. 裁剪栅格并处理（土地利用、坡度、太阳能、风能四条链互不依赖）
+    for key in ["landuse", "dem", "solar", "wind"]:
+        out_path = f"{out_dir}/{key}_crop.tif"
+        stages.append(Stage(f"{key}_crop", crop_raster_to_boundary, (inputs[key], boundary, out_path), crop_kwargs[key],
+                            out_path=out_path, description=f"Cropping {key} raster"))
+
+    out_path = f"{out_dir}/landuse_reclass.tif"
+    stages.append(Stage("landuse", reclassify_landuse, (StageRef("landuse_crop"), out_path),
+                        {"mapping": landuse_mapping, "block_size": block_size, "output_profile": output_profile},
+                        out_path=out_path, description="Reclassifying land use"))
+
+    out_path = f"{out_dir}/slope_score.tif"
+    stages.append(Stage("slope", compute_slope, (StageRef("dem_crop"), out_path),
+                        {"grid_size": grid_size, "block_size": block_size, "method": slope_method,
+                         "output_profile": output_profile},
+                        out_path=out_path, description="Computing slope"))
+
+    for key in ["solar", "wind"]:
+        out_path = f"{out_dir}/{key}_score.tif"
+        stages.append(Stage(key, classify_natural_breaks, (StageRef(f"{key}_crop"), out_path), dict(classify_kwargs),
+                            out_path=out_path, description=f"Classifying {key} potential"))
+
+    # 3. 矢量缓冲并栅格化
+    for key in ["road", "water", "reserve"]:
+        out_path = f"{out_dir}/{key}_score.tif"
+        stages.append(Stage(key, buffer_and_rasterize,
+                            (StageRef(f"{key}_clip"), ref_raster, params[key]["breaks"], params[key]["scores"]),
+                            {"reverse": params[key].get("reverse", False), "out_path": out_path,
+                             "method": buffer_method, "output_profile": output_profile, **buffer_grid},
+                            out_path=out_path, description=f"Buffering and rasterizing {key}"))
+
+    # 5. 加权叠加（虚拟对齐：叠加时按块即时重投影各因子，不写出 aligned_*.tif）
+    overlay_path = f"{out_dir}/suitability_score.tif"
+    if virtual_align:
+        factors = [StageRef(key) for key in FACTOR_KEYS]
+        stages.append(Stage("overlay", weighted_overlay, (factors, list(weights), overlay_path),
+                            {"block_size": block_size, "template_path": StageRef("landuse"),
+                             "layer_types": [FACTOR_LAYER_TYPES[key] for key in FACTOR_KEYS],
+                             "output_profile": output_profile},
+                            out_path=overlay_path, description="Performing weighted overlay"))
+        return stages
+
+    # 4. 栅格对齐到重分类后的土地利用栅格
+    for i, key in enumerate(FACTOR_KEYS):
+        out_path = f"{out_dir}/aligned_{i}.tif"
+        stages.append(Stage(f"align_{i}", align_raster_to_template, (StageRef(key), StageRef("landuse"), out_path),
+                            {"layer_type": FACTOR_LAYER_TYPES[key], "block_size": block_size,
+                             "output_profile": output_profile},
+                            out_path=out_path, description=f"Aligning raster {i} ({key})"))
+
+    # 5. 加权叠加
+    aligned = [StageRef(f"align_{i}") for i in range(len(FACTOR_KEYS))]
+    stages.append(Stage("overlay", weighted_overlay, (aligned, list(weights), overlay_path),
+                        {"block_size": block_size, "output_profile": output_profile}, out_path=overlay_path, description="Performing weighted overlay"))
+
+    return stages
+
+
+def intermediate_paths(out_dir, n_factors=len(FACTOR_KEYS)):
+    """流水线产生的全部中间文件（含 shapefile 附属文件）"""
+    files = []
+    for key in ["road", "water", "reserve"]:
+        files += [f"{key}_clip.{ext}" for ext in ["shp", "shx", "dbf", "prj", "cpg"]]
+    files += [
+        "landuse_crop.tif", "landuse_reclass.tif",
+        "dem_crop.tif", "slope_score.tif",
+        "solar_crop.tif", "solar_score.tif",
+        "wind_crop.tif", "wind_score.tif",
+        "road_score.tif", "water_score.tif", "reserve_score.tif"
+    ]
+    files += [f"aligned_{i}.tif" for i in range(n_factors)]
+    return [os.path.join(out_dir, name) for name in files]
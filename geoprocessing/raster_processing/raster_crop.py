@@ -15,31 +15,47 @@ try:
 except Exception as e:
     print(f"⚠️ Failed to load EPSG:27700, using WKT string instead: {e}")
 
+from contextlib import ExitStack
+
 import rasterio
+from rasterio.enums import Resampling
 from rasterio.mask import mask
+from rasterio.vrt import WarpedVRT
+from rasterio.features import geometry_window
+from rasterio.windows import Window, transform as window_transform
 import numpy as np
-import geopandas as gpd
+from tqdm import tqdm
 from .constants import EPSG_27700_WKT
+from .output_profile import open_output, output_band_count, write_masked
+from .boundary import get_boundary
+from .tiling import iter_windows, DEFAULT_BLOCK_SIZE
 
-def crop_raster_to_boundary(input_raster, boundary_shp, output_raster):
+def crop_raster_to_boundary(input_raster, boundary_shp, output_raster, block_size=None, grid=None,
+                            resampling="nearest", output_profile=None):
     """
     裁剪栅格数据到边界范围内，使用完整WKT字符串定义坐标系，并添加透明通道
+    block_size 不为空时按窗口分块裁剪：输出窗口由边界范围计算，逐块栅格化边界掩膜，
+    数据与透明通道逐块写入分块（tiled）GeoTIFF，内存占用与栅格大小无关
+    grid（GridSpec）不为空时直接输出到该网格：源栅格与网格像元对齐时按窗口读取，
+    否则经 WarpedVRT 按 resampling（Resampling 名称）重投影，始终分块处理
+    output_profile 为输出配置（见 OUTPUT_PROFILES），为空时使用 DEFAULT_OUTPUT_PROFILE
     """
+    if block_size or grid is not None:
+        return _crop_raster_windowed(input_raster, boundary_shp, output_raster, block_size or DEFAULT_BLOCK_SIZE,
+                                     grid, resampling, output_profile)
+
     try:
         with rasterio.open(input_raster) as src:
-            # 读取边界矢量
-            boundary = gpd.read_file(boundary_shp)
+            # 读取边界矢量（边界服务缓存，各裁剪阶段共用）
+            boundary = get_boundary(boundary_shp)
 
             # 打印栅格和边界的原始CRS信息（用于调试）
             print(f"Original CRS of raster: {src.crs}")
             print(f"Original CRS of boundary: {boundary.crs}")
 
-            # 将边界重投影到目标WKT
+            # 将边界重投影到目标WKT并提取合并后的边界几何
             print(f"Reprojecting boundary to OSGB 1936/ British National Grid")
-            boundary = boundary.to_crs(EPSG_27700_WKT)
-
-            # 提取边界几何
-            geom = boundary.geometry.unary_union
+            geom = boundary.union(EPSG_27700_WKT)
 
             # 使用mask函数裁剪栅格
             out_image, out_transform = mask(
@@ -71,20 +87,97 @@ def crop_raster_to_boundary(input_raster, boundary_shp, output_raster):
                         print(f"Warning: Cropped data contains decimal values, cannot safely convert back to type{src.dtypes[0]}")
                 out_meta.update({"dtype": src.dtypes[0]})
 
-            # **添加透明通道**
-            alpha_band = np.ones((out_image.shape[1], out_image.shape[2]), dtype=np.uint8) * 255
+            # 有效像元：任一波段等于 nodata 即视为无效
+            valid = np.ones((out_image.shape[1], out_image.shape[2]), dtype=bool)
             for i in range(out_image.shape[0]):
-                alpha_band[out_image[i] == src.nodata] = 0
-
-            # 将透明通道添加到输出图像
-            out_image = np.vstack((out_image, alpha_band[np.newaxis, :, :]))
+                valid[out_image[i] == src.nodata] = False
 
             # 更新波段数
-            out_meta.update({"count": out_image.shape[0]})
+            out_meta.update({"count": output_band_count(out_image.shape[0])})
 
             # 写入裁剪后的栅格
-            with rasterio.open(output_raster, "w", **out_meta) as dest:
-                dest.write(out_image)
+            with open_output(output_raster, out_meta, output_profile) as dest:
+                write_masked(dest, out_image, valid)
+
+        print(f"Raster cropping completed: {output_raster} (OSGB 1936 / British National Grid)")
+        return output_raster
+
+    except Exception as e:
+        print(f"Error occurs while raster cropping: {str(e)}")
+        raise e
+
+
+def _crop_raster_windowed(input_raster, boundary_shp, output_raster, block_size, grid=None, resampling="nearest",
+                          output_profile=None):
+    try:
+        with rasterio.open(input_raster) as src, ExitStack() as stack:
+            boundary = get_boundary(boundary_shp)
+
+            print(f"Original CRS of raster: {src.crs}")
+            print(f"Original CRS of boundary: {boundary.crs}")
+
+            print(f"Reprojecting boundary to OSGB 1936/ British National Grid")
+            geom = boundary.union(EPSG_27700_WKT)
+
+            nodata = src.nodata if src.nodata is not None else 0
+            reader = src
+            if grid is None:
+                # 输出窗口与 rasterio.mask(crop=True) 一致
+                crop_window = geometry_window(src, [geom])
+            else:
+                crop_window = grid.window_in(src)
+                if crop_window is None:
+                    print(f"[INFO] Warping {input_raster} onto the shared grid ({resampling})")
+                    reader = stack.enter_context(WarpedVRT(
+                        src, crs=grid.crs, transform=grid.transform, width=grid.width, height=grid.height,
+                        resampling=Resampling[resampling], nodata=nodata))
+                    crop_window = Window(0, 0, grid.width, grid.height)
+            crop_transform = window_transform(crop_window, reader.transform)
+
+            # 共享网格上的边界掩膜只栅格化一次，由边界服务缓存，同一进程内的各裁剪阶段共用
+            grid_inside = None
+            if grid is not None:
+                grid_inside = boundary.mask(crop_transform, (crop_window.height, crop_window.width), EPSG_27700_WKT,
+                                            simplify_tolerance=0)
+
+            out_meta = src.meta.copy()
+            out_meta.update({
+                "height": crop_window.height,
+                "width": crop_window.width,
+                "transform": crop_transform,
+                "nodata": src.nodata,
+                "crs": rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
+                "count": output_band_count(src.count),
+                "tiled": True,
+                "blockxsize": 512,
+                "blockysize": 512
+            })
+
+            with open_output(output_raster, out_meta, output_profile) as dest:
+                blocks = list(iter_windows(crop_window.height, crop_window.width, block_size))
+                for block in tqdm(blocks, desc="Cropping raster"):
+                    src_block = Window(crop_window.col_off + block.col_off, crop_window.row_off + block.row_off,
+                                       block.width, block.height)
+                    block_shape = (block.height, block.width)
+
+                    # 共享网格可能超出源栅格范围，仅越界的分块使用 boundless 读取
+                    boundless = not (0 <= src_block.col_off and src_block.col_off + src_block.width <= reader.width
+                                     and 0 <= src_block.row_off and src_block.row_off + src_block.height <= reader.height)
+                    data = reader.read(window=src_block, masked=True, boundless=boundless)
+                    if grid_inside is not None:
+                        outside = ~grid_inside[block.toslices()]
+                    else:
+                        outside = ~boundary.mask(window_transform(block, crop_transform), block_shape, EPSG_27700_WKT,
+                                                 simplify_tolerance=0, cache=False)
+                    data.mask = data.mask | outside
+                    data.fill_value = nodata
+                    data = data.filled()
+
+                    valid = np.ones(block_shape, dtype=bool)
+                    for i in range(data.shape[0]):
+                        valid[data[i] == src.nodata] = False
+
+                    write_masked(dest, data, valid, window=block)
 
         print(f"Raster cropping completed: {output_raster} (OSGB 1936 / British National Grid)")
         return output_raster
@@ -0,0 +1,207 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import rasterio
+from .cache import file_fingerprint
+from .output_profile import read_valid_mask
+from .tiling import iter_windows, DEFAULT_BLOCK_SIZE
+
+# 解码后数组（.npy）的存放目录，可通过环境变量指定，默认位于系统临时目录
+RASTER_STORE_ENV = "GIS_LCA_RASTER_STORE"
+DEFAULT_STORE_DIR = os.path.join(tempfile.gettempdir(), "gis_lca_raster_store")
+
+# 同时保持打开的数据集个数上限（最近最少使用的先关闭）
+DEFAULT_MAX_OPEN = 8
+
+# 数组文件总大小上限（字节），超过时按最近最少使用删除当前未映射的数组
+DEFAULT_MAX_BYTES = 8 * 1024 ** 3
+
+# RasterStore 管理的数组文件名前缀；目录中的其他文件（如 FactorStack 的 stack_*.npy）不会被删除
+ARRAY_PREFIX = "array_"
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class RasterStore:
+    """
+    栅格读取层：按文件指纹把解码后的波段保存为未压缩 .npy，之后以只读 memmap 返回，
+    重复读取同一结果或中间文件时直接命中页缓存，不再解压 GeoTIFF；
+    打开的数据集按最近最少使用保留 max_open 个，元数据查询（CRS、仿射变换等）无需重新打开文件
+    文件被重写后指纹变化，旧数组自动失效并删除；数组总大小超过 max_bytes 时按最近最少使用淘汰
+    """
+
+    def __init__(self, store_dir=None, max_open=DEFAULT_MAX_OPEN, max_bytes=DEFAULT_MAX_BYTES):
+        self.store_dir = store_dir or os.environ.get(RASTER_STORE_ENV, DEFAULT_STORE_DIR)
+        self.max_open = max_open
+        self.max_bytes = max_bytes
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._datasets = OrderedDict()
+        self._arrays = {}
+
+    def _fingerprint(self, path):
+        fingerprint = file_fingerprint(path)
+        if not fingerprint["files"]:
+            raise ValueError(f"Raster {path} does not exist")
+        return _digest(fingerprint)
+
+    def dataset(self, path):
+        """已打开的只读数据集（LRU 缓存，文件变化后重新打开）"""
+        path = os.path.abspath(path)
+        fingerprint = self._fingerprint(path)
+        with self._lock:
+            entry = self._datasets.get(path)
+            if entry is not None and entry[0] == fingerprint:
+                self._datasets.move_to_end(path)
+                return entry[1]
+            if entry is not None:
+                entry[1].close()
+            self._remove_arrays(path, keep=fingerprint)
+
+            src = rasterio.open(path)
+            self._datasets[path] = (fingerprint, src)
+            while len(self._datasets) > self.max_open:
+                _, (_, old) = self._datasets.popitem(last=False)
+                old.close()
+            return src
+
+    def profile(self, path):
+        """数据集 profile 的副本，可直接修改后用于写出"""
+        with self._lock:
+            return self.dataset(path).profile.copy()
+
+    def _array_files(self):
+        """目录中由 RasterStore 写出的数组文件名（不含其他进程正在写的临时文件）"""
+        return [name for name in os.listdir(self.store_dir) if name.startswith(ARRAY_PREFIX) and name.endswith(".npy")]
+
+    def _remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.store_dir, name))
+        except OSError:
+            # Windows 下仍被映射的文件无法删除，留待下次清理
+            pass
+
+    def _remove_arrays(self, path=None, keep=None):
+        """删除 path（为空时为全部文件）的数组文件，keep 为需保留的当前指纹"""
+        for key in [key for key in self._arrays if (path is None or key[0] == path) and key[1] != keep]:
+            del self._arrays[key]
+        prefix = None if path is None else _digest(path)
+        for name in self._array_files():
+            parts = name[len(ARRAY_PREFIX):].split("_", 2)
+            if (prefix is None or parts[0] == prefix) and (keep is None or parts[1:2] != [keep]):
+                self._remove_file(name)
+
+    def _array_path(self, path, fingerprint, name):
+        return os.path.join(self.store_dir, f"{ARRAY_PREFIX}{_digest(path)}_{fingerprint}_{name}.npy")
+
+    def evict(self):
+        """按最近使用时间删除数组文件，直到总大小不超过 max_bytes；本实例正在映射的数组不删除"""
+        with self._lock:
+            in_use = {os.path.basename(self._array_path(*key)) for key in self._arrays}
+            files = []
+            for name in self._array_files():
+                try:
+                    stat = os.stat(os.path.join(self.store_dir, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if name in in_use:
+                    continue
+                self._remove_file(name)
+                total -= size
+                print(f"[INFO] Evicted stored array {name}")
+
+    def _load(self, path, name, decode, dtype):
+        path = os.path.abspath(path)
+        with self._lock:
+            src = self.dataset(path)
+            fingerprint = self._datasets[path][0]
+            key = (path, fingerprint, name)
+            if key in self._arrays:
+                return self._arrays[key]
+
+            array_path = self._array_path(path, fingerprint, name)
+            if not os.path.exists(array_path):
+                # 先写临时文件再改名，多个进程同时解码同一文件时不会读到半成品
+                tmp_path = f"{array_path}.{os.getpid()}.tmp"
+                out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(src.height, src.width))
+                for window in iter_windows(src.height, src.width, DEFAULT_BLOCK_SIZE):
+                    rows, cols = window.toslices()
+                    out[rows, cols] = decode(src, window)
+                out.flush()
+                del out
+                os.replace(tmp_path, array_path)
+            else:
+                # 修改时间记录最近一次使用，供 evict 按最近最少使用淘汰
+                os.utime(array_path)
+
+            array = np.load(array_path, mmap_mode="r")
+            self._arrays[key] = array
+            self.evict()
+            return array
+
+    def read(self, path, band=1):
+        """波段数据（只读 memmap，形状为 (height, width)）"""
+        with self._lock:
+            dtype = self.dataset(path).dtypes[band - 1]
+        return self._load(path, f"b{band}", lambda src, window: src.read(band, window=window), dtype)
+
+    def read_valid(self, path):
+        """有效像元掩膜（只读 memmap，True 表示有效，见 read_valid_mask）"""
+        return self._load(path, "valid", lambda src, window: read_valid_mask(src, window) > 0, bool)
+
+    def invalidate(self, path=None):
+        """关闭并丢弃 path（为空时为全部文件）的数据集与数组；文件重写前调用可释放文件句柄"""
+        with self._lock:
+            path = None if path is None else os.path.abspath(path)
+            for key in list(self._datasets) if path is None else [path]:
+                entry = self._datasets.pop(key, None)
+                if entry is not None:
+                    entry[1].close()
+            self._remove_arrays(path)
+
+    def close(self):
+        """关闭全部数据集，保留磁盘上的数组供之后复用"""
+        with self._lock:
+            for _, src in self._datasets.values():
+                src.close()
+            self._datasets.clear()
+            self._arrays.clear()
+
+    def clear(self):
+        """删除全部数组文件（目录中不属于 RasterStore 的文件保持不变）"""
+        with self._lock:
+            self.close()
+            for name in os.listdir(self.store_dir):
+                if name.startswith(ARRAY_PREFIX):
+                    self._remove_file(name)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_raster_store():
+    """进程内共享的 RasterStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RasterStore()
+        return _store
+
+
+def read_array(path, band=1):
+    """经共享 RasterStore 读取整个波段（只读 memmap）"""
+    return get_raster_store().read(path, band)
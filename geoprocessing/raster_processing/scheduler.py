@@ -0,0 +1,200 @@
+import os
+import time
+import multiprocessing
+import concurrent.futures
+from .output_profile import gdal_env
+
+
+class StageRef:
+    """引用上游阶段的返回值（通常是输出路径），同时用于推断阶段间的依赖关系"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"StageRef({self.name!r})"
+
+
+class Stage:
+    """
+    流水线中的一个处理阶段：func(*args, **kwargs)
+    args/kwargs 中出现的 StageRef 会在运行时替换为对应上游阶段的结果
+    """
+
+    def __init__(self, name, func, args=(), kwargs=None, out_path=None, description=None):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.out_path = out_path
+        self.description = description or name
+        self.deps = sorted(set(_collect_refs(self.args) + _collect_refs(self.kwargs)))
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps})"
+
+
+def _collect_refs(value):
+    if isinstance(value, StageRef):
+        return [value.name]
+    if isinstance(value, (list, tuple)):
+        return [name for item in value for name in _collect_refs(item)]
+    if isinstance(value, dict):
+        return [name for item in value.values() for name in _collect_refs(item)]
+    return []
+
+
+def _resolve_refs(value, results):
+    if isinstance(value, StageRef):
+        return results[value.name]
+    if isinstance(value, list):
+        return [_resolve_refs(item, results) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_resolve_refs(item, results) for item in value)
+    if isinstance(value, dict):
+        return {key: _resolve_refs(item, results) for key, item in value.items()}
+    return value
+
+
+def _timed_call(func, args, kwargs, io_threads="ALL_CPUS"):
+    """在工作进程中执行阶段函数并返回 (结果, 墙钟耗时)；io_threads 为 GDAL 压缩/解压线程数"""
+    start = time.perf_counter()
+    with gdal_env(io_threads):
+        result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _check_graph(stages):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names in pipeline: {names}")
+
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {missing}")
+
+    # Kahn 拓扑排序，检测环
+    pending = {stage.name: len(stage.deps) for stage in stages}
+    ready = [name for name, count in pending.items() if count == 0]
+    visited = 0
+    while ready:
+        name = ready.pop()
+        visited += 1
+        for stage in stages:
+            if name in stage.deps:
+                pending[stage.name] -= 1
+                if pending[stage.name] == 0:
+                    ready.append(stage.name)
+    if visited != len(stages):
+        raise ValueError("Pipeline stages contain a dependency cycle!")
+
+
+def run_stages(stages, n_workers=None, skip=None, on_stage_done=None, log=print, cache=None):
+    """
+    按依赖关系调度流水线阶段，互不依赖的阶段在进程池中并发执行
+    skip(stage) 返回 True 时直接复用 stage.out_path
+    cache 为 IntermediateCache 时按阶段键复用结果，只重新计算键发生变化的阶段
+    on_stage_done(stage, elapsed, n_done, n_total) 在每个阶段结束时回调
+    返回 (results, timings)：各阶段返回值与墙钟耗时（秒）
+    """
+    _check_graph(stages)
+    n_workers = n_workers or os.cpu_count() or 1
+
+    results = {}
+    timings = {}
+    keys = {}
+    remaining = list(stages)
+
+    def ready_stages():
+        return [stage for stage in remaining if all(dep in results for dep in stage.deps)]
+
+    def finish(stage, result, elapsed, skipped=False):
+        if cache is not None and not skipped and stage.name in keys:
+            cache.store(keys[stage.name], stage.out_path, result)
+        results[stage.name] = result
+        timings[stage.name] = elapsed
+        if skipped:
+            log(f"✅ {stage.description} is up to date, skipping: {result}")
+        else:
+            log(f"⏱️ {stage.description} finished in {elapsed:.2f}s")
+        if on_stage_done is not None:
+            on_stage_done(stage, elapsed, len(results), len(stages))
+
+    def take_skipped():
+        # 可复用的阶段不必进入进程池，循环处理直到没有新的可跳过阶段
+        found = True
+        while found:
+            found = False
+            for stage in ready_stages():
+                if skip is not None and skip(stage):
+                    remaining.remove(stage)
+                    finish(stage, stage.out_path, 0.0, skipped=True)
+                    found = True
+                elif cache is not None and stage.out_path is not None and stage.name not in keys:
+                    args = _resolve_refs(stage.args, results)
+                    kwargs = _resolve_refs(stage.kwargs, results)
+                    keys[stage.name] = cache.stage_key(stage.func, args, kwargs, stage.out_path)
+                    hit, result = cache.lookup(keys[stage.name], stage.out_path)
+                    if hit:
+                        remaining.remove(stage)
+                        finish(stage, result, 0.0, skipped=True)
+                        found = True
+
+    if n_workers <= 1:
+        # 单进程顺序执行，便于调试
+        while remaining:
+            take_skipped()
+            if not remaining:
+                break
+            stage = ready_stages()[0]
+            remaining.remove(stage)
+            log(f"{stage.description}...")
+            args = _resolve_refs(stage.args, results)
+            kwargs = _resolve_refs(stage.kwargs, results)
+            try:
+                result, elapsed = _timed_call(stage.func, args, kwargs)
+            except Exception as e:
+                raise RuntimeError(f"Stage {stage.name} failed: {e}") from e
+            finish(stage, result, elapsed)
+        return results, timings
+
+    # 各工作进程平分 CPU 作为 GDAL 压缩/解压线程，避免线程数超额
+    io_threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+    # 使用 spawn 启动工作进程，避免在 GUI 后台线程中 fork 带来的问题
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+        running = {}
+        while remaining or running:
+            take_skipped()
+            for stage in ready_stages():
+                remaining.remove(stage)
+                log(f"{stage.description}...")
+                args = _resolve_refs(stage.args, results)
+                kwargs = _resolve_refs(stage.kwargs, results)
+                running[executor.submit(_timed_call, stage.func, args, kwargs, io_threads)] = stage
+
+            if not running:
+                continue
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    for pending in running:
+                        pending.cancel()
+                    raise RuntimeError(f"Stage {stage.name} failed: {e}") from e
+                finish(stage, result, elapsed)
+
+    return results, timings
+
+
+def format_timings(timings):
+    """将各阶段耗时格式化为按耗时降序排列的文本表"""
+    lines = [f"{name:<20s} {elapsed:8.2f}s" for name, elapsed in
+             sorted(timings.items(), key=lambda item: item[1], reverse=True)]
+    return "\n".join(lines)
@@ -15,42 +15,303 @@ try:
 except Exception as e:
     print(f"⚠️ Failed to load EPSG:27700, using WKT string instead: {e}")
 
+from contextlib import ExitStack
+
 import rasterio
 import numpy as np
+from rasterio.windows import Window
 from .constants import print_crs_info, EPSG_27700_WKT
+from .output_profile import open_output, output_band_count, write_masked
+from .tiling import iter_windows
+
+# 流式分位数直方图：坡度取值 [0, 90] 度，默认分箱宽 0.001 度
+SLOPE_HISTOGRAM_BINS = 90000
+
+# 坡度算法："gradient" 为 np.gradient 中心差分（原始实现），
+# "horn" 为 Horn 3x3 加权差分，"zevenbergen" 为 Zevenbergen-Thorne 四邻域差分
+SLOPE_METHODS = ("gradient", "horn", "zevenbergen")
+
+# 地形派生栅格的 nodata；坡向在平地处取 -1
+TERRAIN_NODATA = -9999.0
+
+
+def compute_slope(dem_path, out_path, grid_size=None, block_size=None, method="gradient", output_profile=None):
+    """
+    计算坡度并按 25/50/75 分位数分级
+    grid_size 为空时从栅格仿射变换读取 x/y 两个方向的像元尺寸（地理坐标系按纬度换算为米），
+    否则两个方向都使用 grid_size
+    method 选择坡度算法（见 SLOPE_METHODS）；"horn"/"zevenbergen" 总是走分块引擎（分位数取自直方图）
+    block_size 不为空时使用分块引擎：每块带 1 像元重叠读取，float32 计算，
+    第一遍累加坡度直方图求分位数，第二遍重新计算坡度并写出得分，内存只占一个块
+    output_profile 为输出配置（见 OUTPUT_PROFILES），为空时使用 DEFAULT_OUTPUT_PROFILE
+    """
+    if method not in SLOPE_METHODS:
+        raise ValueError(f"Unknown slope method: {method}")
+
+    if block_size or method != "gradient":
+        return _compute_slope_windowed(dem_path, out_path, grid_size, block_size, method, output_profile)
 
-def compute_slope(dem_path, out_path, grid_size):
     with rasterio.open(dem_path) as src:
         print_crs_info(f"Input DEM {dem_path}", src.crs)
         dem = src.read(1).astype(float)
         profile = src.profile
+        cell_x, cell_y = _cell_sizes(src, grid_size, np.arange(src.height))
 
-    dx = np.gradient(dem, axis=1) / grid_size
-    dy = np.gradient(dem, axis=0) / grid_size
-    slope = np.sqrt(dx ** 2 + dy ** 2)
-    slope_degrees = np.arctan(slope) * (180.0 / np.pi)
+    slope_degrees = _slope_degrees(dem, cell_x, cell_y)
 
     valid_mask = ~np.isnan(slope_degrees)
     breaks = np.percentile(slope_degrees[valid_mask], [25, 50, 75])
+    score = _score_slope(slope_degrees, valid_mask, breaks)
+
+    _update_slope_profile(profile, out_path)
+
+    with open_output(out_path, profile, output_profile) as dst:
+        write_masked(dst, score, valid_mask)
+
+    return out_path
+
+
+def axis_cell_sizes(transform, crs, rows):
+    """
+    像元在 x/y 方向的地面尺寸（米）
+    投影坐标系直接取仿射变换两个轴的长度（支持非方形像元）；
+    地理坐标系按各行中心纬度在椭球上换算：y 向用子午圈曲率半径 M，x 向用 N·cos(纬度)，
+    此时返回形状为 (len(rows), 1) 的数组，可直接按行广播
+    """
+    size_x = np.hypot(transform.a, transform.d)
+    size_y = np.hypot(transform.b, transform.e)
+    if crs is None or not crs.is_geographic:
+        return size_x, size_y
+
+    ellipsoid = CRS.from_wkt(crs.to_wkt()).ellipsoid
+    semi_major = ellipsoid.semi_major_metre
+    flattening = 1.0 / ellipsoid.inverse_flattening if ellipsoid.inverse_flattening else 0.0
+    e2 = flattening * (2 - flattening)
+
+    latitude = np.radians(transform.f + (np.asarray(rows, dtype=np.float64) + 0.5) * transform.e)
+    sin2 = np.sin(latitude) ** 2
+    meridian = semi_major * (1 - e2) / (1 - e2 * sin2) ** 1.5
+    normal = semi_major / np.sqrt(1 - e2 * sin2)
+    cell_x = np.radians(size_x) * normal * np.cos(latitude)
+    cell_y = np.radians(size_y) * meridian
+    return cell_x[:, None], cell_y[:, None]
+
+
+def _cell_sizes(src, grid_size, rows):
+    if grid_size:
+        return grid_size, grid_size
+    return axis_cell_sizes(src.transform, src.crs, rows)
+
+
+def _slope_degrees(dem, cell_x, cell_y):
+    dx = np.gradient(dem, axis=1) / cell_x
+    dy = np.gradient(dem, axis=0) / cell_y
+    slope = np.sqrt(dx ** 2 + dy ** 2)
+    return np.arctan(slope) * (180.0 / np.pi)
+
+
+def _score_slope(slope_degrees, valid_mask, breaks):
     score = np.ones_like(slope_degrees, dtype=np.uint8)
     score[(slope_degrees > breaks[0]) & valid_mask] = 3
     score[(slope_degrees > breaks[1]) & valid_mask] = 2
     score[(slope_degrees > breaks[2]) & valid_mask] = 1
+    return score
 
-    # 添加透明通道
-    alpha_band = (valid_mask * 255).astype(np.uint8)
-    output_data = np.stack([score, alpha_band], axis=0)
 
+def _update_slope_profile(profile, out_path):
     profile.update(
         dtype=rasterio.uint8,
         nodata=0,
         crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
-        count=2  # 更新波段数
+        count=output_band_count()  # 更新波段数
     )
 
     print_crs_info(f"Output slope raster {out_path}", profile["crs"])
 
-    with rasterio.open(out_path, 'w', **profile) as dst:
-        dst.write(output_data)
 
-    return out_path
\ No newline at end of file
+def _read_with_halo(src, window, halo=1):
+    """
+    读取窗口及四周 halo 像元（在栅格边缘处截断），返回数据、窗口在数据中的切片和数据的首行行号；
+    块边缘因此仍用中心差分，栅格边缘与整幅计算一样用单侧差分
+    """
+    row_start = max(window.row_off - halo, 0)
+    col_start = max(window.col_off - halo, 0)
+    row_stop = min(window.row_off + window.height + halo, src.height)
+    col_stop = min(window.col_off + window.width + halo, src.width)
+    data = src.read(1, window=Window(col_start, row_start, col_stop - col_start, row_stop - row_start))
+    inner = (slice(window.row_off - row_start, window.row_off - row_start + window.height),
+             slice(window.col_off - col_start, window.col_off - col_start + window.width))
+    return data, inner, row_start
+
+
+def _read_padded(src, window):
+    """读取带 1 像元 halo 的窗口，栅格边缘处复制边缘像元补齐，nodata 转为 NaN，返回 float32 (h+2, w+2)"""
+    data, inner, _ = _read_with_halo(src, window)
+    data = data.astype(np.float32)
+    if src.nodata is not None:
+        data[data == src.nodata] = np.nan
+    pad_rows = (1 - inner[0].start, 1 - (data.shape[0] - inner[0].stop))
+    pad_cols = (1 - inner[1].start, 1 - (data.shape[1] - inner[1].stop))
+    return np.pad(data, (pad_rows, pad_cols), mode="edge")
+
+
+def terrain_derivatives(dem, cell_x, cell_y, method="horn"):
+    """
+    3x3 核的一阶偏导数；dem 四周已各扩 1 像元，返回内部区域的 (dz/dx 向东, dz/dy 向北)
+    邻域编号    a b c
+               d e f
+               g h i
+    """
+    a, b, c = dem[:-2, :-2], dem[:-2, 1:-1], dem[:-2, 2:]
+    d, f = dem[1:-1, :-2], dem[1:-1, 2:]
+    g, h, i = dem[2:, :-2], dem[2:, 1:-1], dem[2:, 2:]
+    if method == "horn":
+        dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * cell_x)
+        dz_dy = ((a + 2 * b + c) - (g + 2 * h + i)) / (8 * cell_y)
+    elif method == "zevenbergen":
+        dz_dx = (f - d) / (2 * cell_x)
+        dz_dy = (b - h) / (2 * cell_y)
+    else:
+        raise ValueError(f"Unknown terrain kernel: {method}")
+    return dz_dx, dz_dy
+
+
+def _tile_derivatives(src, window, grid_size, method, z_factor=1.0):
+    dem = _read_padded(src, window)
+    cell_x, cell_y = _cell_sizes(src, grid_size, np.arange(window.row_off, window.row_off + window.height))
+    if isinstance(cell_x, np.ndarray):
+        cell_x, cell_y = cell_x.astype(np.float32), cell_y.astype(np.float32)
+    dz_dx, dz_dy = terrain_derivatives(dem, cell_x, cell_y, method)
+    if z_factor != 1.0:
+        dz_dx, dz_dy = dz_dx * np.float32(z_factor), dz_dy * np.float32(z_factor)
+    return dz_dx, dz_dy
+
+
+def _derivative_slope(dz_dx, dz_dy):
+    return np.degrees(np.arctan(np.sqrt(dz_dx ** 2 + dz_dy ** 2)))
+
+
+def _tile_slope(src, window, grid_size, method="gradient"):
+    if method != "gradient":
+        return _derivative_slope(*_tile_derivatives(src, window, grid_size, method))
+
+    dem, inner, row_start = _read_with_halo(src, window)
+    cell_x, cell_y = _cell_sizes(src, grid_size, np.arange(row_start, row_start + dem.shape[0]))
+    if isinstance(cell_x, np.ndarray):
+        cell_x, cell_y = cell_x.astype(np.float32), cell_y.astype(np.float32)
+    else:
+        cell_x, cell_y = np.float32(cell_x), np.float32(cell_y)
+    return _slope_degrees(dem.astype(np.float32), cell_x, cell_y)[inner]
+
+
+def histogram_quantiles(counts, edges, quantiles):
+    """
+    由直方图估计分位数（分箱内线性插值），误差不超过一个分箱宽度；quantiles 取 0-100
+    """
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    if total == 0:
+        raise ValueError("Histogram is empty!")
+    result = []
+    for q in quantiles:
+        target = q / 100.0 * total
+        index = min(int(np.searchsorted(cumulative, target, side="left")), counts.size - 1)
+        before = cumulative[index - 1] if index > 0 else 0
+        fraction = (target - before) / counts[index] if counts[index] else 0.0
+        result.append(edges[index] + fraction * (edges[index + 1] - edges[index]))
+    return np.array(result)
+
+
+def _slope_windows(src, block_size):
+    if not block_size:
+        return [Window(0, 0, src.width, src.height)]
+    return list(iter_windows(src.height, src.width, block_size))
+
+
+def _compute_slope_windowed(dem_path, out_path, grid_size, block_size, method="gradient", output_profile=None):
+    with rasterio.open(dem_path) as src:
+        print_crs_info(f"Input DEM {dem_path}", src.crs)
+        profile = src.profile
+        windows = _slope_windows(src, block_size)
+
+        # 第一遍：坡度直方图
+        edges = np.linspace(0.0, 90.0, SLOPE_HISTOGRAM_BINS + 1)
+        counts = np.zeros(SLOPE_HISTOGRAM_BINS, dtype=np.int64)
+        for window in windows:
+            slope_degrees = _tile_slope(src, window, grid_size, method)
+            counts += np.histogram(slope_degrees[~np.isnan(slope_degrees)], bins=edges)[0]
+
+        if counts.sum() == 0:
+            raise ValueError("DEM has no valid data for slope classification!")
+        breaks = histogram_quantiles(counts, edges, [25, 50, 75])
+        print(f"[INFO] Slope breaks (25/50/75%): {[round(float(b), 3) for b in breaks]}")
+
+        _update_slope_profile(profile, out_path)
+
+        # 第二遍：重新计算坡度并写出得分
+        with open_output(out_path, profile, output_profile) as dst:
+            for window in windows:
+                slope_degrees = _tile_slope(src, window, grid_size, method)
+                valid_mask = ~np.isnan(slope_degrees)
+                write_masked(dst, _score_slope(slope_degrees, valid_mask, breaks), valid_mask, window=window)
+
+    return out_path
+
+
+def compute_terrain(dem_path, slope_path=None, aspect_path=None, hillshade_path=None, method="horn",
+                    grid_size=None, z_factor=1.0, azimuth=315.0, altitude=45.0, block_size=None, output_profile=None):
+    """
+    一次读取 DEM，按块同时输出坡度（度）、坡向（自正北顺时针的度数，平地为 -1）和山体阴影（0-255）
+    三者共用同一组 3x3 偏导数；不需要的输出传 None 即可
+    输出经 open_output / write_masked 写出，有效性按当前掩膜方式保存（nodata 模式下坡度、坡向为 TERRAIN_NODATA）
+    返回 {"slope": 路径, "aspect": 路径, "hillshade": 路径}（仅含实际写出的项）
+    """
+    if method not in ("horn", "zevenbergen"):
+        raise ValueError(f"Unknown terrain kernel: {method}")
+    outputs = {key: path for key, path in
+               (("slope", slope_path), ("aspect", aspect_path), ("hillshade", hillshade_path)) if path}
+    if not outputs:
+        raise ValueError("No terrain output path given!")
+
+    # 光源方向（东、北、天顶分量）
+    sun_azimuth, sun_altitude = np.radians(azimuth), np.radians(altitude)
+    sun = (np.sin(sun_azimuth) * np.cos(sun_altitude), np.cos(sun_azimuth) * np.cos(sun_altitude),
+           np.sin(sun_altitude))
+
+    with rasterio.open(dem_path) as src:
+        print_crs_info(f"Input DEM {dem_path}", src.crs)
+        profile = src.profile
+        profile.update(count=output_band_count(), dtype=rasterio.float32, nodata=TERRAIN_NODATA)
+
+        with ExitStack() as stack:
+            destinations = {}
+            for key, path in outputs.items():
+                if key == "hillshade":
+                    destinations[key] = stack.enter_context(
+                        open_output(path, dict(profile, dtype=rasterio.uint8, nodata=0), output_profile))
+                else:
+                    destinations[key] = stack.enter_context(open_output(path, profile, output_profile))
+                print_crs_info(f"Output {key} raster {path}", destinations[key].crs)
+
+            for window in _slope_windows(src, block_size):
+                dz_dx, dz_dy = _tile_derivatives(src, window, grid_size, method, z_factor)
+                valid = ~(np.isnan(dz_dx) | np.isnan(dz_dy))
+
+                if "slope" in destinations:
+                    slope = _derivative_slope(dz_dx, dz_dy)
+                    write_masked(destinations["slope"], np.where(valid, slope, TERRAIN_NODATA).astype(np.float32),
+                                 valid, window=window)
+                if "aspect" in destinations:
+                    # 坡向为下坡方向 (-dz/dx, -dz/dy) 的方位角
+                    aspect = np.degrees(np.arctan2(-dz_dx, -dz_dy)) % 360.0
+                    aspect[(dz_dx == 0) & (dz_dy == 0)] = -1.0
+                    write_masked(destinations["aspect"], np.where(valid, aspect, TERRAIN_NODATA).astype(np.float32),
+                                 valid, window=window)
+                if "hillshade" in destinations:
+                    # 单位法向量 (-dz/dx, -dz/dy, 1) / |.| 与光源方向的点积
+                    shade = (sun[2] - dz_dx * sun[0] - dz_dy * sun[1]) / np.sqrt(1 + dz_dx ** 2 + dz_dy ** 2)
+                    shade = np.clip(np.nan_to_num(shade), 0, 1) * 254 + 1
+                    write_masked(destinations["hillshade"], np.where(valid, shade, 0).astype(np.uint8), valid,
+                                 window=window)
+
+    return outputs
@@ -0,0 +1,18 @@
+from rasterio.windows import Window
+
+# 默认分块大小（像元），分块模式下每块内存约为 block_size² × 8 字节
+DEFAULT_BLOCK_SIZE = 1024
+
+
+def iter_windows(height, width, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    按行优先顺序生成覆盖整个栅格的分块窗口，边缘块自动截断
+    """
+    if block_size <= 0:
+        raise ValueError(f"block_size must be positive, got {block_size}")
+
+    for row_off in range(0, height, block_size):
+        block_height = min(block_size, height - row_off)
+        for col_off in range(0, width, block_size):
+            block_width = min(block_size, width - col_off)
+            yield Window(col_off, row_off, block_width, block_height)
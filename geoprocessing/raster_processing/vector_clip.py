@@ -16,26 +16,61 @@ except Exception as e:
     print(f"⚠️ Failed to load EPSG:27700, using WKT string instead: {e}")
 
 import geopandas as gpd
+import fiona
+import shapely
+import itertools
+from contextlib import ExitStack
+import multiprocessing
 import concurrent.futures
+import numpy as np
+from shapely.geometry import mapping
 from tqdm import tqdm
 
 from .constants import print_crs_info
 from .constants import EPSG_27700_WKT
+from .boundary import get_boundary
 
-def clip_vector_to_boundary(vector_path, boundary_shp, out_path, use_spatial_index=True, n_threads=4):
+# 向量化裁剪时每个进程任务处理的几何数量
+VECTORIZED_CHUNK = 20000
+
+# 流式写出时源几何类型提升后的 Multi* 类型与对应的 shapely 构造函数和几何类型编号
+MULTI_GEOMETRY_TYPES = {
+    "Point": ("MultiPoint", shapely.multipoints, [0]),
+    "LineString": ("MultiLineString", shapely.multilinestrings, [1, 2]),
+    "Polygon": ("MultiPolygon", shapely.multipolygons, [3]),
+}
+
+def clip_vector_to_boundary(vector_path, boundary_shp, out_path, use_spatial_index=True, n_threads=4,
+                            chunk_size=None, mask_filter=False, engine="threads", n_processes=4):
     """
     裁剪矢量数据到边界范围内，支持空间索引和多线程优化
+    chunk_size 不为空时流式读取：边界范围（mask_filter=True 时为边界几何）下推到 OGR 读取过滤，
+    按固定要素数分块裁剪并逐块追加写出，峰值内存只与块大小有关
+    engine="vectorized" 时使用 shapely 2 的向量化 intersection（边界几何预先 prepare），
+    要素很多时按数组分块分配到 n_processes 个进程（n_threads 只用于 "threads" 引擎的线程数）；
+    进程池在整个调用（含流式读取的全部分块）中只创建一次
+    两种读取方式的输出相同：几何统一为源类型对应的 Multi* 类型，求交产生的低维部分被丢弃（见 _promote_geometries）
     """
+    if engine not in ("threads", "vectorized"):
+        raise ValueError(f"Unknown clipping engine: {engine}")
+
+    if chunk_size:
+        return _clip_vector_streaming(vector_path, boundary_shp, out_path, use_spatial_index, n_threads,
+                                      chunk_size, mask_filter, engine, n_processes)
+
     gdf = gpd.read_file(vector_path)
     print_crs_info(f"Vector data {vector_path}", gdf.crs)
+    with fiona.open(vector_path) as src:
+        base_type = _base_geometry_type(src.schema["geometry"])
 
-    boundary = gpd.read_file(boundary_shp)
-    print_crs_info(f"Boundary Vector {boundary_shp}", boundary.crs)
+    # 边界由边界服务统一读取并缓存（同一进程内的各裁剪阶段共用）
+    boundary = get_boundary(boundary_shp)
 
     if gdf.empty:
         raise ValueError(f"Vector data{vector_path}is empty！")
-    if boundary.empty:
-        raise ValueError(f"Boundary Vector{boundary_shp}is empty！")
+
+    # 合并所有边界为单个几何对象
+    boundary_geom = boundary.union()
 
     # 统一使用WKT进行坐标转换
     if gdf.crs != boundary.crs:
@@ -47,11 +82,138 @@ def clip_vector_to_boundary(vector_path, boundary_shp, out_path, use_spatial_ind
             # 转换失败时强制使用目标WKT
             print(f"[WARNING] Failed to convert directly, forcefully using EPSG:27700 WKT")
             gdf = gdf.to_crs(EPSG_27700_WKT)
-            boundary = boundary.to_crs(EPSG_27700_WKT)
+            boundary_geom = boundary.union(EPSG_27700_WKT)
 
-    # 合并所有边界为单个几何对象
-    boundary_geom = boundary.geometry.unary_union
+    if engine == "vectorized":
+        pool = _open_clip_pool(boundary_geom, n_processes)
+        try:
+            clipped = _clip_vectorized(gdf, boundary_geom, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    else:
+        clipped = _clip_to_geometry(gdf, boundary_geom, use_spatial_index, n_threads)
+
+    clipped = _promote_geometries(clipped, base_type)
+    if clipped.empty:
+        raise ValueError(f"Vector data is empty after clipping!")
+
+    # 设置输出CRS为EPSG:27700（使用WKT）
+    clipped = clipped.to_crs(EPSG_27700_WKT)
+    print_crs_info(f"Output clipped vector {out_path}", clipped.crs)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    clipped.to_file(out_path)
+
+    return out_path
+
+
+def _clip_vector_streaming(vector_path, boundary_shp, out_path, use_spatial_index, n_threads, chunk_size,
+                           mask_filter, engine="threads", n_processes=4):
+    boundary = get_boundary(boundary_shp)
+    boundary_geom = boundary.union()
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    # 进程池只创建一次，工作进程按需启动，各分块共用
+    pool = _open_clip_pool(boundary_geom, n_processes) if engine == "vectorized" else None
+    with fiona.open(vector_path) as src, ExitStack() as stack:
+        if pool is not None:
+            stack.callback(pool.shutdown)
+        src_crs = src.crs_wkt
+        print_crs_info(f"Vector data {vector_path}", src_crs)
+        # 求交可能得到 Multi* 或 GeometryCollection，输出统一为源类型对应的 Multi* 类型
+        base_type = _base_geometry_type(src.schema["geometry"])
+        out_type = MULTI_GEOMETRY_TYPES[base_type][0] if base_type in MULTI_GEOMETRY_TYPES else "Unknown"
+        out_schema = {"geometry": out_type, "properties": src.schema["properties"]}
+
+        # 将边界转换到源数据坐标系，过滤条件下推到 OGR 读取，边界外的要素不会被读入内存
+        try:
+            filter_geom = boundary.union(src_crs)
+            if mask_filter:
+                print("[INFO] Reading features intersecting the boundary geometry...")
+                features = src.filter(mask=mapping(filter_geom))
+            else:
+                print(f"[INFO] Reading features within boundary bbox {filter_geom.bounds}...")
+                features = src.filter(bbox=filter_geom.bounds)
+        except Exception as e:
+            print(f"[WARNING] Failed to build read filter, reading all features: {e}")
+            features = iter(src)
+
+        n_read = 0
+        n_written = 0
+        while True:
+            chunk = list(itertools.islice(features, chunk_size))
+            if not chunk:
+                break
+            n_read += len(chunk)
+
+            gdf = gpd.GeoDataFrame.from_features(chunk, crs=src_crs)
+            del chunk
+
+            if gdf.crs != boundary.crs:
+                try:
+                    gdf = gdf.to_crs(boundary.crs)
+                    chunk_boundary = boundary_geom
+                except Exception:
+                    print(f"[WARNING] Failed to convert directly, forcefully using EPSG:27700 WKT")
+                    gdf = gdf.to_crs(EPSG_27700_WKT)
+                    chunk_boundary = boundary.union(EPSG_27700_WKT)
+            else:
+                chunk_boundary = boundary_geom
+
+            if engine == "vectorized":
+                # 回退到 EPSG:27700 边界的分块与进程池中的边界不同，改为在本进程内求交
+                clipped = _clip_vectorized(gdf, chunk_boundary, pool if chunk_boundary is boundary_geom else None)
+            else:
+                clipped = _clip_to_geometry(gdf, chunk_boundary, use_spatial_index, n_threads)
+            if clipped.empty:
+                continue
 
+            # 逐块追加写出，输出CRS为EPSG:27700（使用WKT）
+            clipped = _promote_geometries(clipped, base_type)
+            if clipped.empty:
+                continue
+            clipped = clipped.to_crs(EPSG_27700_WKT)
+            clipped.to_file(out_path, mode="w" if n_written == 0 else "a", engine="fiona", schema=out_schema)
+            n_written += len(clipped)
+            print(f"[INFO] Streamed {n_read} features, {n_written} clipped features written")
+
+    if n_written == 0:
+        raise ValueError(f"Vector data is empty after clipping!")
+
+    print_crs_info(f"Output clipped vector {out_path}", EPSG_27700_WKT)
+    return out_path
+
+def _base_geometry_type(schema_type):
+    """图层几何类型去掉 3D 与 Multi 前缀后的基本类型（如 "3D MultiPolygon" -> "Polygon"）"""
+    return schema_type.replace("3D ", "").replace("Multi", "")
+
+
+def _promote_geometries(gdf, base_type):
+    """
+    将几何统一为 base_type 对应的 Multi* 类型：拆开 Multi* 与 GeometryCollection，
+    只保留与 base_type 同类的部分（如多边形求交产生的线、点会被丢弃），不含同类部分的要素整行删除
+    base_type 不在 MULTI_GEOMETRY_TYPES 中时原样返回（输出类型为 Unknown）
+    """
+    if base_type not in MULTI_GEOMETRY_TYPES or gdf.empty:
+        return gdf
+    _, build, type_ids = MULTI_GEOMETRY_TYPES[base_type]
+
+    geoms = np.asarray(gdf.geometry.values, dtype=object)
+    parts, index = shapely.get_parts(geoms, return_index=True)
+    # GeometryCollection 中可能嵌套 Multi* 几何，再拆一层
+    parts, inner = shapely.get_parts(parts, return_index=True)
+    index = index[inner]
+
+    keep = np.isin(shapely.get_type_id(parts), type_ids) & ~shapely.is_empty(parts)
+    rows, groups = np.unique(index[keep], return_inverse=True)
+    promoted = gdf.iloc[rows].copy()
+    promoted["geometry"] = build(parts[keep], indices=groups)
+    return promoted
+
+
+def _clip_to_geometry(gdf, boundary_geom, use_spatial_index=True, n_threads=4):
+    """用边界几何裁剪 GeoDataFrame，返回裁剪结果（可能为空）"""
     # 使用空间索引筛选可能相交的要素
     if use_spatial_index and len(gdf) > 100:  # 要素数量较少时可能不需要空间索引
         print("[INFO] Using R-Tree spatial index to accelerate clipping...")
@@ -119,14 +281,64 @@ def clip_vector_to_boundary(vector_path, boundary_shp, out_path, use_spatial_ind
         clipped['geometry'] = valid_geometries
         clipped = clipped.dropna(subset=['geometry'])
 
-    if clipped.empty:
-        raise ValueError(f"Vector data is empty after clipping!")
+    return clipped
 
-    # 设置输出CRS为EPSG:27700（使用WKT）
-    clipped = clipped.to_crs(EPSG_27700_WKT)
-    print_crs_info(f"Output clipped vector {out_path}", clipped.crs)
 
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    clipped.to_file(out_path)
+_worker_boundary = None
 
-    return out_path
+
+def _init_clip_worker(boundary_geom):
+    """进程池初始化：每个工作进程只接收并 prepare 一次边界几何"""
+    global _worker_boundary
+    _worker_boundary = boundary_geom
+    shapely.prepare(_worker_boundary)
+
+
+def _intersect_chunk(geoms):
+    return shapely.intersection(geoms, _worker_boundary)
+
+
+def _open_clip_pool(boundary_geom, n_processes):
+    """向量化裁剪的进程池（每个工作进程只接收并 prepare 一次边界几何），进程数不足 2 时返回 None"""
+    n_processes = min(n_processes, os.cpu_count() or 1)
+    if n_processes <= 1:
+        return None
+    context = multiprocessing.get_context("spawn")
+    return concurrent.futures.ProcessPoolExecutor(max_workers=n_processes, mp_context=context,
+                                                  initializer=_init_clip_worker, initargs=(boundary_geom,))
+
+
+def _clip_vectorized(gdf, boundary_geom, pool=None, chunk=VECTORIZED_CHUNK):
+    """
+    向量化裁剪：prepare 后的边界一次性判断相交与完全包含，完全位于边界内的要素直接保留，
+    其余要素批量求交；要素数超过一个分块且给出进程池（_open_clip_pool，边界须与 boundary_geom 相同）时
+    按数组分块并行求交
+    """
+    geoms = np.asarray(gdf.geometry.values, dtype=object)
+    shapely.prepare(boundary_geom)
+
+    hits = shapely.intersects(geoms, boundary_geom)
+    candidates = geoms[hits]
+    inside = shapely.contains_properly(boundary_geom, candidates)
+    to_clip = candidates[~inside]
+    print(f"[INFO] Vectorized clipping: {len(candidates)} intersecting features, {int(inside.sum())} fully inside")
+
+    if pool is not None and len(to_clip) > chunk:
+        chunks = [to_clip[i:i + chunk] for i in range(0, len(to_clip), chunk)]
+        print(f"[INFO] Using process pool for {len(chunks)} clipping chunks...")
+        clipped_parts = []
+        with tqdm(total=len(to_clip), desc="Clipping progress", unit="feature") as progress:
+            for part in pool.map(_intersect_chunk, chunks):
+                clipped_parts.append(part)
+                progress.update(len(part))
+        clipped_geoms = np.concatenate(clipped_parts) if clipped_parts else np.array([], dtype=object)
+    else:
+        clipped_geoms = shapely.intersection(to_clip, boundary_geom)
+
+    result = candidates.copy()
+    result[~inside] = clipped_geoms
+
+    clipped = gdf[hits].copy()
+    clipped["geometry"] = result
+    clipped = clipped[~shapely.is_empty(result)]
+    return clipped
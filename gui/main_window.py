@@ -77,6 +77,12 @@ class GreenAmmoniaApp:
         ttk.Button(button_frame, text="Show Result Map", command=self.show_result_map).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Recalculate All", command=self.recalculate_all_threaded).pack(side=tk.LEFT, padx=5)
 
+        # 并行进程数
+        ttk.Label(button_frame, text="Workers").pack(side=tk.LEFT, padx=(20, 5))
+        self.worker_var = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(button_frame, from_=1, to=os.cpu_count() or 1, width=5,
+                    textvariable=self.worker_var).pack(side=tk.LEFT)
+
         # 进度条
         self.progress = ttk.Progressbar(main_frame, orient='horizontal', mode='determinate', length=400)
         self.progress.pack(fill=tk.X, pady=5)
@@ -105,6 +111,18 @@ class GreenAmmoniaApp:
         self.threshold_var = tk.DoubleVar(value=50)
         self.map_extent = None
         self.boundary_data = None
+        self.boundary = None
+        self.current_crs = None
+
+        # 对齐后的因子栅格与因子堆栈（权重变化时直接重新打分，无需重新读取栅格）
+        # 堆栈在后台线程读入，锁保证预加载与重新打分不会重复读取
+        self.factor_paths = None
+        self.factor_stack = None
+        self.factor_stack_paths = None
+        self.factor_stack_lock = threading.Lock()
+        # 重新打分后地图显示的是预览层级，导出时按 current_weights 在原始分辨率重算
+        self.current_level = 0
+        self.current_weights = None
 
     def try_load_saved_weights(self):
         try:
@@ -141,6 +159,10 @@ class GreenAmmoniaApp:
                 self.weight_entries[label].insert(0, str(weights_dict[key]))
                 self.weight_entries[label].config(state='readonly')
 
+        # 地图已打开时立即按新权重重新打分
+        if getattr(self, "map_window", None) is not None and getattr(self, "factor_paths", None):
+            self.rescore_map()
+
     def log(self, message):
         self.root.after(0, lambda: self._update_log(message))
 
@@ -189,12 +211,30 @@ class GreenAmmoniaApp:
             self._set_inputs_state("disabled")
             threading.Thread(target=self.run, kwargs={"recalculate_all": True}).start()
 
+    def get_worker_count(self):
+        try:
+            return max(1, int(self.worker_var.get()))
+        except (tk.TclError, ValueError):
+            return 1
+
     def _set_inputs_state(self, state):
         for entry in self.inputs.values():
             entry.config(state=state)
         for entry in self.weight_entries.values():
             entry.config(state=state)
 
+    def get_weights(self):
+        """读取并验证权重输入，顺序与 FACTOR_KEYS 一致"""
+        try:
+            weights = [float(self.weight_entries[label].get()) for label in self.weight_entries]
+            if not all(0 <= w <= 1 for w in weights):
+                raise ValueError("Value of weights must be between 0 and 1")
+            if not np.isclose(sum(weights), 1.0, atol=0.01):
+                self.log(f"⚠️ Warning: sum of weights{sum(weights):.2f}，should be adjusted to 1.0")
+        except ValueError as e:
+            raise ValueError(f"Wrong weight input: {str(e)}")
+        return weights
+
     def run(self, recalculate_all=False):
         try:
             self.set_progress(0)
@@ -217,18 +257,10 @@ class GreenAmmoniaApp:
                     raise ValueError(f"Input file does not exist: {file}")
 
             # 获取用户输入的权重并验证
-            try:
-                weights = [float(self.weight_entries[label].get()) for label in self.weight_entries]
-                if not all(0 <= w <= 1 for w in weights):
-                    raise ValueError("Value of weights must be between 0 and 1")
-                if not np.isclose(sum(weights), 1.0, atol=0.01):
-                    self.log(f"⚠️ Warning: sum of weights{sum(weights):.2f}，should be adjusted to 1.0")
-            except ValueError as e:
-                raise ValueError(f"Wrong weight input: {str(e)}")
+            weights = self.get_weights()
 
             # 输出目录设置
             out_dir = os.path.dirname(landuse)
-            ref_raster = landuse
             self.log(f"Output directory: {out_dir}")
 
             # 如果选择全部重新计算，删除所有中间结果文件
@@ -237,165 +269,41 @@ class GreenAmmoniaApp:
                 self.delete_intermediate_results(out_dir)
                 self.set_progress(5)
 
-            # 1. 裁剪矢量
-            self.log("\n===== Start clipping vectors =====")
-            road_clip = f"{out_dir}/road_clip.shp"
-            if os.path.exists(road_clip) and os.path.getsize(road_clip) > 0 and not recalculate_all:
-                self.log(f"✅ Road clipping result already exists, skipping: {road_clip}")
-            else:
-                self.log("Clipping road vector...")
-                road_clip = rp.clip_vector_to_boundary(road, boundary, road_clip)
-            self.set_progress(10)
-
-            water_clip = f"{out_dir}/water_clip.shp"
-            if os.path.exists(water_clip) and os.path.getsize(water_clip) > 0 and not recalculate_all:
-                self.log(f"✅ Water clipping result already exists, skipping: {water_clip}")
-            else:
-                self.log("Clipping water vector...")
-                water_clip = rp.clip_vector_to_boundary(water, boundary, water_clip)
-            self.set_progress(15)
-
-            reserve_clip = f"{out_dir}/reserve_clip.shp"
-            if os.path.exists(reserve_clip) and os.path.getsize(reserve_clip) > 0 and not recalculate_all:
-                self.log(f"✅ Protected area clipping result already exists, skipping: {reserve_clip}")
-            else:
-                self.log("Clipping protected area vector...")
-                reserve_clip = rp.clip_vector_to_boundary(reserve, boundary, reserve_clip)
-            self.set_progress(20)
-
-            # 2. 裁剪栅格并处理
-            self.log("\n===== Start raster processing  =====")
-            landuse_crop = f"{out_dir}/landuse_crop.tif"
-            if os.path.exists(landuse_crop) and os.path.getsize(landuse_crop) > 0 and not recalculate_all:
-                self.log(f"✅ Land use crop already exists, skipping: {landuse_crop}")
-            else:
-                self.log("Cropping land use raster...")
-                landuse_crop = rp.crop_raster_to_boundary(landuse, boundary, landuse_crop)
-            self.set_progress(25)
-
-            landuse_reclass = f"{out_dir}/landuse_reclass.tif"
-            if os.path.exists(landuse_reclass) and os.path.getsize(landuse_reclass) > 0 and not recalculate_all:
-                self.log(f"✅ Land use reclassification already exists, skipping: {landuse_reclass}")
-            else:
-                self.log("Reclassifying land use...")
-                landuse_reclass = rp.reclassify_landuse(landuse_crop, landuse_reclass)
-            self.set_progress(35)
-
-            dem_crop = f"{out_dir}/dem_crop.tif"
-            if os.path.exists(dem_crop) and os.path.getsize(dem_crop) > 0 and not recalculate_all:
-                self.log(f"✅ DEM crop already exists, skipping: {dem_crop}")
-            else:
-                self.log("Cropping DEM...")
-                dem_crop = rp.crop_raster_to_boundary(dem, boundary, dem_crop)
-
-            slope = f"{out_dir}/slope_score.tif"
-            if os.path.exists(slope) and os.path.getsize(slope) > 0 and not recalculate_all:
-                self.log(f"✅ Slope computation already exists, skipping: {slope}")
-            else:
-                self.log("Computing slope...")
-                slope = rp.compute_slope(dem_crop, slope, grid_size=50)
-            self.set_progress(50)
+            # 按依赖关系构建流水线：裁剪、重分类、坡度、分类、缓冲、对齐、叠加
+            stages = rp.build_suitability_stages(
+                {
+                    "landuse": landuse, "dem": dem, "solar": solar, "wind": wind,
+                    "road": road, "water": water, "reserve": reserve, "boundary": boundary
+                },
+                weights,
+                out_dir
+            )
 
-            solar_crop = f"{out_dir}/solar_crop.tif"
-            if os.path.exists(solar_crop) and os.path.getsize(solar_crop) > 0 and not recalculate_all:
-                self.log(f"✅ Solar crop already exists, skipping: {solar_crop}")
-            else:
-                self.log("Cropping solar raster...")
-                solar_crop = rp.crop_raster_to_boundary(solar, boundary, solar_crop)
+            # 释放上次结果的文件句柄，流水线会重写结果栅格
+            rp.get_raster_store().close()
 
-            solar_class = f"{out_dir}/solar_score.tif"
-            if os.path.exists(solar_class) and os.path.getsize(solar_class) > 0 and not recalculate_all:
-                self.log(f"✅ Solar classification already exists, skipping: {solar_class}")
-            else:
-                self.log("Classifying solar potential...")
-                solar_class = rp.classify_natural_breaks(solar_crop, solar_class)
-            self.set_progress(65)
+            # 中间结果缓存：输入文件、参数或边界变化时只重算受影响的阶段
+            cache = rp.IntermediateCache(os.path.join(out_dir, rp.CACHE_DIR_NAME))
 
-            wind_crop = f"{out_dir}/wind_crop.tif"
-            if os.path.exists(wind_crop) and os.path.getsize(wind_crop) > 0 and not recalculate_all:
-                self.log(f"✅ Wind crop already exists, skipping: {wind_crop}")
-            else:
-                self.log("Cropping wind raster...")
-                wind_crop = rp.crop_raster_to_boundary(wind, boundary, wind_crop)
+            def on_stage_done(stage, elapsed, n_done, n_total):
+                self.set_progress(int(n_done / n_total * 100))
 
-            wind_class = f"{out_dir}/wind_score.tif"
-            if os.path.exists(wind_class) and os.path.getsize(wind_class) > 0 and not recalculate_all:
-                self.log(f"✅ Wind classification already exists, skipping: {wind_class}")
-            else:
-                self.log("Classifying wind potential...")
-                wind_class = rp.classify_natural_breaks(wind_crop, wind_class)
-            self.set_progress(80)
-
-            # 3. 矢量缓冲并栅格化
-            self.log("\n===== Start buffer analysis =====")
-            road_score = f"{out_dir}/road_score.tif"
-            road_breaks = [1000, 3000, 5000]
-            road_scores = [1, 0.8, 0.5, 0.2]
-            if os.path.exists(road_score) and os.path.getsize(road_score) > 0 and not recalculate_all:
-                self.log(f"✅ Road buffer result already exists, skipping: {road_score}")
-            else:
-                self.log("Buffering and rasterizing road...")
-                road_score = rp.buffer_and_rasterize(road_clip, ref_raster, road_breaks, road_scores,
-                                                     out_path=road_score)
-            self.set_progress(85)
-
-            water_score = f"{out_dir}/water_score.tif"
-            water_breaks = [500, 1000, 2000]
-            water_scores = [1, 0.8, 0.6, 0.3]
-            if os.path.exists(water_score) and os.path.getsize(water_score) > 0 and not recalculate_all:
-                self.log(f"✅ Water buffer result already exists, skipping: {water_score}")
-            else:
-                self.log("Buffering and rasterizing water...")
-                water_score = rp.buffer_and_rasterize(water_clip, ref_raster, water_breaks, water_scores,
-                                                      out_path=water_score)
-            self.set_progress(90)
-
-            reserve_score = f"{out_dir}/reserve_score.tif"
-            reserve_breaks = [1000, 2000, 5000]
-            reserve_scores = [0, 0.2, 0.6, 1]
-            if os.path.exists(reserve_score) and os.path.getsize(reserve_score) > 0 and not recalculate_all:
-                self.log(f"✅ Protected area buffer result already exists, skipping: {reserve_score}")
-            else:
-                self.log("Buffering and rasterizing protected area (negative impact)...")
-                reserve_score = rp.buffer_and_rasterize(reserve_clip, ref_raster, reserve_breaks, reserve_scores,
-                                                        reverse=True, out_path=reserve_score)
-            self.set_progress(95)
-
-            # 4. 栅格对齐
-            self.log("\n===== Start raster alignment =====")
-            raster_paths = [
-                landuse_reclass,
-                slope,
-                solar_class,
-                wind_class,
-                road_score,
-                water_score,
-                reserve_score
-            ]
-            aligned_rasters = []
-            for i, path in enumerate(raster_paths):
-                aligned_path = f"{out_dir}/aligned_{i}.tif"
-                if os.path.exists(aligned_path) and os.path.getsize(aligned_path) > 0 and not recalculate_all:
-                    self.log(f"✅ Aligned raster {i} already exists, skipping: {aligned_path}")
-                    aligned_rasters.append(aligned_path)
-                    continue
-                self.log(f"Aligning raster {i}...")
-                aligned_path = rp.align_raster_to_template(path, landuse_reclass, aligned_path)
-                aligned_rasters.append(aligned_path)
-            self.set_progress(98)
-
-            # 5. 加权叠加
-            self.log("\n===== Start weighted overlay =====")
-            result = f"{out_dir}/suitability_score.tif"
-            if os.path.exists(result) and os.path.getsize(result) > 0 and not recalculate_all:
-                self.log(f"✅ Suitability result already exists, skipping: {result}")
-            else:
-                self.log("Performing weighted overlay...")
-                result = rp.weighted_overlay(aligned_rasters, weights, result)
+            n_workers = self.get_worker_count()
+            self.log(f"\n===== Start processing pipeline ({n_workers} workers) =====")
+            results, timings = rp.run_stages(stages, n_workers=n_workers, cache=cache,
+                                             on_stage_done=on_stage_done, log=self.log)
+            self.log("\n===== Stage wall time =====")
+            self.log(rp.format_timings(timings))
+            result = results["overlay"]
             self.set_progress(100)
 
-            # 保存结果路径
+            # 保存结果路径与对齐后的因子，权重调整后可直接重新打分
             self.result_path = result
+            self.factor_paths = [results[f"align_{i}"] for i in range(len(rp.FACTOR_KEYS))]
+            with self.factor_stack_lock:
+                # 因子栅格已被重写，旧堆栈即使路径相同也不能复用
+                self.factor_stack = None
+            threading.Thread(target=self._preload_factor_stack, args=(self.factor_paths,), daemon=True).start()
 
             self.log(f"\n✔️ Suitability analysis completed! Result file: {result}")
             # 修复成功提示的闭包变量引用
@@ -413,24 +321,10 @@ class GreenAmmoniaApp:
             if not os.path.exists(out_dir):
                 return
 
-            files_to_delete = [
-                "road_clip.shp", "road_clip.shx", "road_clip.dbf", "road_clip.prj",
-                "water_clip.shp", "water_clip.shx", "water_clip.dbf", "water_clip.prj",
-                "reserve_clip.shp", "reserve_clip.shx", "reserve_clip.dbf", "reserve_clip.prj",
-                "landuse_crop.tif", "landuse_reclass.tif",
-                "dem_crop.tif", "slope_score.tif",
-                "solar_crop.tif", "solar_score.tif",
-                "wind_crop.tif", "wind_score.tif",
-                "road_score.tif", "water_score.tif", "reserve_score.tif"
-            ]
-
-            # 添加对齐栅格文件
-            for i in range(7):
-                files_to_delete.append(f"aligned_{i}.tif")
+            files_to_delete = rp.intermediate_paths(out_dir)
 
             deleted_count = 0
-            for file in files_to_delete:
-                file_path = os.path.join(out_dir, file)
+            for file_path in files_to_delete:
                 if os.path.exists(file_path):
                     os.remove(file_path)
                     self.log(f"Deleted: {file_path}")
@@ -438,6 +332,9 @@ class GreenAmmoniaApp:
 
             self.log(f"Total {deleted_count} intermediate files deleted")
 
+            rp.IntermediateCache(os.path.join(out_dir, rp.CACHE_DIR_NAME)).clear()
+            self.log("Intermediate cache cleared")
+
         except Exception as e:
             self.log(f"Error occurred while deleting intermediate files: {str(e)}")
             messagebox.showerror("Error", f"Error occurred while deleting intermediate files: {str(e)}")
@@ -463,30 +360,34 @@ class GreenAmmoniaApp:
                 messagebox.showwarning("Warning", "Boundary Vector file does not exist, please check your input")
                 return
 
-            # 读取边界数据
+            # 读取边界数据（边界服务缓存，重复打开地图或重绘时不再重新读取）
             self.log("Loading boundary data...")
-            self.boundary_data = gpd.read_file(boundary_path)
+            self.boundary = rp.get_boundary(boundary_path)
+            self.boundary_data = self.boundary.frame()
 
-            with rasterio.open(self.result_path) as src:
-                data = src.read(1)
-                transform = src.transform
-                self.current_data = data
-                self.current_transform = transform
+            # 结果栅格经 RasterStore 读取：首次解码为 .npy 后以 memmap 复用，重复打开地图无需重新解压
+            store = rp.get_raster_store()
+            src = store.dataset(self.result_path)
+            transform = src.transform
+            self.current_data = store.read(self.result_path)
+            self.current_level = 0
+            self.current_transform = transform
+            self.current_crs = src.crs
 
-                # 计算地理边界范围
-                left = transform.c
-                right = transform.c + transform.a * src.width
-                bottom = transform.f + transform.e * src.height
-                top = transform.f
-                self.map_extent = (left, right, bottom, top)
+            # 计算地理边界范围
+            left = transform.c
+            right = transform.c + transform.a * src.width
+            bottom = transform.f + transform.e * src.height
+            top = transform.f
+            self.map_extent = (left, right, bottom, top)
 
-                # 创建弹出窗口
-                self.create_map_window()
+            # 创建弹出窗口
+            self.create_map_window()
 
-                # 显示栅格数据和边界
-                self.update_map_display()
+            # 显示栅格数据和边界
+            self.update_map_display()
 
-                self.log("Suitability map and boundary displayed in a new window")
+            self.log("Suitability map and boundary displayed in a new window")
 
         except Exception as e:
             # 修复异常处理的闭包变量引用
@@ -535,6 +436,7 @@ class GreenAmmoniaApp:
         threshold_scale.pack(side=tk.LEFT, padx=5)
         ttk.Button(filter_frame, text="Apply Threshold", command=self.apply_threshold).pack(side=tk.LEFT, padx=5)
         # 拆分导出按钮为栅格和矢量
+        ttk.Button(filter_frame, text="Rescore", command=self.rescore_map).pack(side=tk.LEFT, padx=5)
         ttk.Button(filter_frame, text="Export Raster", command=self.export_filtered_raster).pack(side=tk.LEFT, padx=5)
         # ttk.Button(filter_frame, text="导出矢量", command=self.export_filtered_vector).pack(side=tk.LEFT, padx=5)
         ttk.Button(filter_frame, text="Emission & Cost Viewer", command=self.open_emission_cost_popup).pack(
@@ -582,23 +484,21 @@ class GreenAmmoniaApp:
             )
 
             # ===== 仅把边界外盖白（包含稳健的 CRS 处理）=====
-            if self.boundary_data is not None:
-                # 读取栅格 CRS，并尽量用 WKT 表达
-                raster_crs_wkt = None
-                try:
-                    with rasterio.open(self.result_path) as src:
-                        raster_crs_wkt = src.crs.to_wkt() if src.crs is not None else None
-                except Exception:
-                    pass
+            if self.boundary is not None:
+                # 栅格 CRS 在打开结果时已记录，尽量用 WKT 表达
+                raster_crs_wkt = self.current_crs.to_wkt() if self.current_crs is not None else None
 
-                # 如果边界的 CRS 与栅格不一致，尝试重投影（用 WKT；失败再回退 EPSG:27700）
+                # 如果边界的 CRS 与栅格不一致，取边界服务中缓存的重投影结果（用 WKT；失败再回退 EPSG:27700）
+                target_crs = None
                 try:
                     if raster_crs_wkt is not None and (
-                            self.boundary_data.crs is None or self.boundary_data.crs.to_wkt() != raster_crs_wkt):
-                        self.boundary_data = self.boundary_data.to_crs(raster_crs_wkt)
+                            self.boundary.crs is None or self.boundary.crs.to_wkt() != raster_crs_wkt):
+                        self.boundary_data = self.boundary.frame(raster_crs_wkt)
+                        target_crs = raster_crs_wkt
                 except Exception:
                     try:
-                        self.boundary_data = self.boundary_data.to_crs("EPSG:27700")
+                        self.boundary_data = self.boundary.frame("EPSG:27700")
+                        target_crs = "EPSG:27700"
                     except Exception:
                         # 实在不行就不转换，但可能导致遮罩不对齐
                         pass
@@ -607,8 +507,8 @@ class GreenAmmoniaApp:
                 left, right, bottom, top = self.map_extent
                 outer = box(left, bottom, right, top)
 
-                # 合并边界
-                boundary_union = self.boundary_data.geometry.unary_union
+                # 合并边界（已缓存）
+                boundary_union = self.boundary.union(target_crs)
 
                 # 计算外部区域 = 外框 - 边界
                 try:
@@ -669,6 +569,65 @@ class GreenAmmoniaApp:
 
             # 外框（当前地图范围）
 
+    def _load_factor_stack(self, factor_paths):
+        """读入（或复用）factor_paths 对应的因子堆栈；除导出外只在后台线程调用"""
+        with self.factor_stack_lock:
+            if self.factor_stack is None or self.factor_stack_paths != factor_paths:
+                self.log("Loading factor stack...")
+                self.factor_stack = rp.FactorStack.from_rasters(factor_paths)
+                self.factor_stack_paths = factor_paths
+                self.log("Factor stack loaded")
+            return self.factor_stack
+
+    def _preload_factor_stack(self, factor_paths):
+        """分析完成后在后台预先读入因子堆栈，首次重新打分时无需等待"""
+        try:
+            self._load_factor_stack(factor_paths)
+        except Exception as e:
+            self.log(f"⚠️ Failed to load factor stack: {str(e)}")
+
+    def rescore_map(self):
+        """按当前权重从因子堆栈重新计算适宜性得分并刷新地图；读堆栈与打分在后台线程进行，地图显示预览层级"""
+        if not self.factor_paths:
+            messagebox.showwarning("Warning", "Please run the suitability analysis first")
+            return
+
+        try:
+            weights = self.get_weights()
+        except Exception as e:
+            self.log(f"❌ Failed to rescore map: {str(e)}")
+            messagebox.showerror("Error", f"Failed to rescore map: {str(e)}")
+            return
+        threading.Thread(target=self._rescore, args=(self.factor_paths, weights), daemon=True).start()
+
+    def _rescore(self, factor_paths, weights):
+        try:
+            stack = self._load_factor_stack(factor_paths)
+            level = stack.preview_level()
+            score = stack.score(weights, level)
+            self.root.after(0, lambda: self._show_rescored(score, level, weights))
+        except Exception as e:
+            self.log(f"❌ Failed to rescore map: {str(e)}")
+            self.root.after(0, lambda error=str(e): messagebox.showerror("Error", f"Failed to rescore map: {error}"))
+
+    def _show_rescored(self, score, level, weights):
+        if self.map_window is None:
+            return
+        self.current_data = score
+        self.current_level = level
+        self.current_weights = weights
+        self.update_map_display()
+        self.log(f"Suitability map rescored with weights {weights}" + (f" (preview level {level})" if level else ""))
+
+    def _full_resolution_data(self):
+        """
+        导出用的原始分辨率得分：地图显示的是预览层级时按相同权重在第 0 层重算
+        run() 会清空因子堆栈，这里经 _load_factor_stack 取得（必要时重新读入）当前因子的堆栈
+        """
+        if self.current_level:
+            return self._load_factor_stack(self.factor_paths).score(self.current_weights)
+        return self.current_data
+
     def apply_threshold(self):
         try:
             threshold = float(self.threshold_var.get())
@@ -691,7 +650,8 @@ class GreenAmmoniaApp:
                 return
 
             # 低于阈值的置 0；边界外本来就是 0
-            masked_data = np.where(self.current_data < threshold, 0, self.current_data)
+            data = self._full_resolution_data()
+            masked_data = np.where(data < threshold, 0, data)
 
             raster_out_path = filedialog.asksaveasfilename(
                 defaultextension=".tif",
@@ -700,11 +660,10 @@ class GreenAmmoniaApp:
             if not raster_out_path:
                 return
 
-            with rasterio.open(self.result_path) as src:
-                profile = src.profile
-                profile.update(dtype=rasterio.float32, nodata=0, count=1)
-                with rasterio.open(raster_out_path, 'w', **profile) as dst:
-                    dst.write(masked_data.astype(np.float32), 1)
+            profile = rp.get_raster_store().profile(self.result_path)
+            profile.update(dtype=rasterio.float32, nodata=0, count=1)
+            with rp.open_output(raster_out_path, profile) as dst:
+                dst.write(masked_data.astype(np.float32), 1)
 
             self.log(f"✅ Filtered raster exported to: {raster_out_path}")
             messagebox.showinfo("Success", f"Raster exported successfully: {raster_out_path}")
@@ -726,7 +685,8 @@ class GreenAmmoniaApp:
                 return
 
             # 应用阈值过滤（仅保留符合条件的区域）
-            masked_data = np.where(self.current_data >= threshold, self.current_data, 0)
+            data = self._full_resolution_data()
+            masked_data = np.where(data >= threshold, data, 0)
 
             # 选择保存路径
             vector_out_path = filedialog.asksaveasfilename(
@@ -737,28 +697,28 @@ class GreenAmmoniaApp:
                 return  # 用户取消选择
 
             # 栅格转矢量（使用rasterio.features.shapes）
-            with rasterio.open(self.result_path) as src:
-                # 生成矢量形状（仅保留值>0的区域）
-                shapes = rasterio.features.shapes(
-                    masked_data.astype(np.float32),
-                    mask=masked_data > 0,  # 仅转换有值的区域
-                    transform=src.transform
-                )
+            src = rp.get_raster_store().dataset(self.result_path)
+            # 生成矢量形状（仅保留值>0的区域）
+            shapes = rasterio.features.shapes(
+                masked_data.astype(np.float32),
+                mask=masked_data > 0,  # 仅转换有值的区域
+                transform=src.transform
+            )
 
-                # 提取几何和属性
-                geometries = []
-                values = []
-                for geom, value in shapes:
-                    geometries.append(geom)
-                    values.append(round(value, 2))  # 保留2位小数
-
-                # 创建GeoDataFrame并保存
-                gdf = gpd.GeoDataFrame(
-                    {'suitability': values},  # 适宜性分数作为属性
-                    geometry=geometries,
-                    crs=src.crs  # 继承原栅格的坐标系统
-                )
-                gdf.to_file(vector_out_path)
+            # 提取几何和属性
+            geometries = []
+            values = []
+            for geom, value in shapes:
+                geometries.append(geom)
+                values.append(round(value, 2))  # 保留2位小数
+
+            # 创建GeoDataFrame并保存
+            gdf = gpd.GeoDataFrame(
+                {'suitability': values},  # 适宜性分数作为属性
+                geometry=geometries,
+                crs=src.crs  # 继承原栅格的坐标系统
+            )
+            gdf.to_file(vector_out_path)
 
             self.log(f"✅ Filtered vector exported to: {vector_out_path}")
             messagebox.showinfo("Success", f"Vector exported successfully: {vector_out_path}")
@@ -778,4 +738,5 @@ class GreenAmmoniaApp:
             self.map_im = None
             self.map_extent = None
             self.boundary_data = None
+            self.boundary = None
 
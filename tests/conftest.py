@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import LineString, Point
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# ahp 各模块之间使用平铺导入（from constants import ...），需要把 ahp 目录也加入搜索路径
+sys.path[:0] = [ROOT, os.path.join(ROOT, "ahp")]
+
+from geoprocessing.raster_processing.constants import EPSG_27700_WKT
+from geoprocessing.raster_processing.output_profile import MASK_MODE_ENV
+
+# 测试栅格的左上角坐标与像元大小（EPSG:27700，米）
+ORIGIN = (400000.0, 300000.0)
+CELL_SIZE = 50.0
+
+
+@pytest.fixture(autouse=True)
+def default_output_settings(monkeypatch):
+    """每个测试都从默认掩膜方式开始，测试内的修改不会串到其他测试"""
+    monkeypatch.delenv(MASK_MODE_ENV, raising=False)
+
+
+@pytest.fixture
+def write_raster(tmp_path):
+    """写出单波段测试栅格，返回路径"""
+
+    def write(name, data, nodata=None):
+        path = str(tmp_path / name)
+        profile = {
+            "driver": "GTiff",
+            "height": data.shape[0],
+            "width": data.shape[1],
+            "count": 1,
+            "dtype": data.dtype.name,
+            "crs": rasterio.crs.CRS.from_wkt(EPSG_27700_WKT),
+            "transform": from_origin(ORIGIN[0], ORIGIN[1], CELL_SIZE, CELL_SIZE),
+            "nodata": nodata,
+        }
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(data, 1)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def factor_rasters(write_raster):
+    """
+    三幅已对齐的因子得分栅格（70 × 90）：连续得分、含 NaN 的分级得分、整数等级，
+    均以 0 为 nodata 且包含 nodata 像元，尺寸不是分块大小的整数倍
+    """
+    rng = np.random.default_rng(0)
+    shape = (70, 90)
+
+    continuous = rng.random(shape).astype(np.float32)
+    continuous[:5, :] = 0
+
+    graded = rng.choice(np.array([0, 0.25, 0.5, 0.75, 1], dtype=np.float32), shape)
+    graded[rng.random(shape) < 0.02] = np.nan
+
+    levels = rng.integers(0, 6, shape).astype(np.float32)
+    levels[:, -7:] = 0
+
+    return [write_raster("continuous.tif", continuous, nodata=0),
+            write_raster("graded.tif", graded, nodata=0),
+            write_raster("levels.tif", levels, nodata=0)]
+
+
+@pytest.fixture
+def pipeline_config(tmp_path, write_raster):
+    """
+    完整流水线的合成输入（80 × 90 栅格，道路 / 水系为线、保护区与边界为面）及引用它们的批处理配置文件，
+    配置中的输入路径相对于配置文件所在目录；返回配置文件路径
+    """
+    rng = np.random.default_rng(0)
+    shape = (80, 90)
+    rows, cols = np.indices(shape)
+    write_raster("landuse.tif", rng.integers(1, 22, shape).astype(np.uint8), nodata=0)
+    write_raster("dem.tif", (cols * 3 + rows * 2 + rng.random(shape)).astype(np.float32), nodata=-9999)
+    write_raster("solar.tif", (rng.random(shape) * 100).astype(np.float32), nodata=-9999)
+    write_raster("wind.tif", (rng.random(shape) * 10).astype(np.float32), nodata=-9999)
+
+    x0, y0 = ORIGIN
+    vectors = {
+        "road": LineString([(x0 - 500, y0 - 1000), (x0 + 5000, y0 - 3000)]),
+        "water": LineString([(x0 + 2000, y0 + 500), (x0 + 2500, y0 - 5000)]),
+        "reserve": Point(x0 + 3500, y0 - 3000).buffer(600),
+        "boundary": Point(x0 + 2200, y0 - 2000).buffer(1700),
+    }
+    for name, geometry in vectors.items():
+        gpd.GeoDataFrame(geometry=[geometry], crs=EPSG_27700_WKT).to_file(str(tmp_path / f"{name}.shp"))
+
+    config = {
+        "inputs": {key: f"{key}.tif" for key in ["landuse", "dem", "solar", "wind"]},
+        "out_dir": "results",
+        "weights": {"landuse": 0.15, "slope": 0.15, "solar": 0.15, "wind": 0.15,
+                    "road": 0.15, "water": 0.15, "reserve": 0.10},
+        "scenarios": [{"name": "base"}, {"name": "solar_heavy", "weights": {"solar": 0.3, "road": 0.0}}],
+    }
+    config["inputs"].update({key: f"{key}.shp" for key in vectors})
+    path = tmp_path / "scenarios.json"
+    path.write_text(json.dumps(config))
+    return str(path)
@@ -0,0 +1,186 @@
+import os
+
+import numpy as np
+import pytest
+
+from ahp_core import generate_consistent_matrix
+from constants import RI_CACHE_ENV, RI_CACHE_FILE, RI_dict, factor_order
+from hierarchy import Hierarchy, random_consistent_weights, synthesize
+from solver import solve, consistent_matrices, reciprocal_matrices, random_index, SAATY_SCALE
+from uncertainty import monte_carlo_hierarchy, monte_carlo_weights
+import solver
+from geoprocessing.raster_processing.pipeline import FACTOR_KEYS
+
+# 三层层次结构：准则 -> 子准则 -> 因子，叶子深度不一
+NESTED_STRUCTURE = {
+    "Energy": {"Renewables": ["Solar Energy", "Wind Energy"], "Grid": ["Grid Connection"]},
+    "Transportation": ["Road Access", "Port Access"],
+    "Environment": {"Terrain": ["Slope"], "Hydrology": ["Water System", "Flood Risk"]},
+}
+
+
+def random_matrices(n, n_draws, seed=0):
+    """判断值在 Saaty 标度上随机抽取的互反判断矩阵堆栈"""
+    rng = np.random.default_rng(seed)
+    judgements = SAATY_SCALE[rng.integers(0, len(SAATY_SCALE), (n_draws, n * (n - 1) // 2))]
+    return reciprocal_matrices(judgements, n)
+
+
+def eig_principal(A):
+    """np.linalg.eig 求得的主特征值与归一化主特征向量"""
+    values, vectors = np.linalg.eig(A)
+    k = np.argmax(values.real)
+    vector = np.abs(vectors[:, k].real)
+    return values[k].real, vector / vector.sum()
+
+
+@pytest.mark.parametrize("n", [3, 4, 5, 7, 9])
+def test_solve_matches_numpy_eig(n):
+    matrices = random_matrices(n, 50, seed=n)
+    weights, lambda_max, CI, _ = solve(matrices)
+    for A, w, lam, ci in zip(matrices, weights, lambda_max, CI):
+        expected_lambda, expected_w = eig_principal(A)
+        assert np.allclose(w, expected_w, atol=1e-8)
+        assert np.isclose(lam, expected_lambda, rtol=1e-9)
+        assert np.isclose(ci, (expected_lambda - n) / (n - 1), atol=1e-9)
+
+
+def test_batched_solve_matches_single_solve():
+    matrices = random_matrices(6, 20)
+    weights, lambda_max, CI, CR = solve(matrices)
+    for i, A in enumerate(matrices):
+        w, lam, ci, cr = solve(A)
+        assert np.allclose(w, weights[i])
+        assert np.isclose(lam, lambda_max[i]) and np.isclose(ci, CI[i]) and np.isclose(cr, CR[i])
+
+
+@pytest.mark.parametrize("method", ["power", "geometric"])
+def test_consistent_matrix_recovers_weights(method):
+    base = np.array([0.4, 0.25, 0.2, 0.1, 0.05])
+    w, lam, _, CR = solve(consistent_matrices(base), method)
+    assert np.allclose(w, base)
+    assert np.isclose(lam, len(base))
+    assert abs(CR) < 1e-9
+
+
+def test_generate_consistent_matrix_is_reciprocal_and_consistent():
+    A, w = generate_consistent_matrix(6)
+    assert np.allclose(A * A.T, 1.0)
+    assert np.allclose(np.diag(A), 1.0)
+    assert np.allclose(solve(A)[0], w)
+    assert abs(solve(A)[3]) < 1e-9
+
+
+def path_products(structure, local_weights, root="Criteria"):
+    """沿根到每个叶子的路径逐个相乘局部权重"""
+    products = {}
+
+    def walk(name, children, weight):
+        for child in children:
+            child_weight = weight * local_weights[name][child]
+            if isinstance(children, dict):
+                walk(child, children[child], child_weight)
+            else:
+                products[child] = child_weight
+
+    walk(root, structure, 1.0)
+    return products
+
+
+def random_local_weights(hierarchy, rng):
+    weights = {}
+    for name, children in hierarchy.levels.items():
+        w = rng.random(len(children))
+        weights[name] = dict(zip(children, w / w.sum()))
+    return weights
+
+
+def test_global_weights_match_path_products():
+    hierarchy = Hierarchy(NESTED_STRUCTURE)
+    local = random_local_weights(hierarchy, np.random.default_rng(3))
+    expected = path_products(NESTED_STRUCTURE, local)
+
+    result = hierarchy.global_weights(local)
+    assert list(expected) == hierarchy.leaves
+    assert np.allclose(result, [expected[leaf] for leaf in hierarchy.leaves])
+    assert np.isclose(result.sum(), 1.0)
+    # synthesize 输出保留 4 位小数
+    assert synthesize(local, hierarchy) == pytest.approx(expected, abs=5e-5)
+
+
+def test_batched_global_weights_match_single_draws():
+    hierarchy = Hierarchy(NESTED_STRUCTURE)
+    rng = np.random.default_rng(4)
+    draws = [random_local_weights(hierarchy, rng) for _ in range(5)]
+    batched = {name: np.array([[draw[name][child] for child in children] for draw in draws])
+               for name, children in hierarchy.levels.items()}
+
+    result = hierarchy.global_weights(batched)
+    assert result.shape == (len(draws), len(hierarchy.leaves))
+    for row, draw in zip(result, draws):
+        expected = path_products(NESTED_STRUCTURE, draw)
+        assert np.allclose(row, [expected[leaf] for leaf in hierarchy.leaves])
+
+
+def test_monte_carlo_hierarchy_takes_one_matrix_dict():
+    hierarchy = Hierarchy()
+    weights, matrices = random_consistent_weights(hierarchy, rng=5)
+    samples, acceptance = monte_carlo_hierarchy(matrices, structure=hierarchy, n_draws=500)
+
+    assert 0 < acceptance <= 1
+    assert samples.shape == (len(samples), len(factor_order))
+    assert np.allclose(samples.sum(axis=1), 1.0)
+    # 扰动围绕一致性矩阵展开，抽样均值接近层次合成得到的权重
+    expected = synthesize(weights, hierarchy)
+    assert np.allclose(samples.mean(axis=0), [expected[factor] for factor in factor_order], atol=0.05)
+
+    with pytest.raises(ValueError):
+        monte_carlo_hierarchy({**matrices, "Unknown": np.ones((1, 1))}, structure=hierarchy, n_draws=10)
+
+
+def test_simulated_random_index_is_cached_outside_source_tree(tmp_path, monkeypatch):
+    monkeypatch.setenv(RI_CACHE_ENV, str(tmp_path))
+    monkeypatch.setattr(solver, "_random_indices", {})
+    n = max(RI_dict) + 2
+
+    value = random_index(n, n_draws=2000)
+    assert os.path.exists(tmp_path / RI_CACHE_FILE)
+    assert value > RI_dict[max(RI_dict)]
+
+    monkeypatch.setattr(solver, "_random_indices", {})
+    monkeypatch.setattr(solver, "simulate_random_index", lambda *args: pytest.fail("cache was not used"))
+    assert random_index(n, n_draws=2000) == value
+
+
+# AHP 因子名称与 GIS 叠加因子键的对应关系
+FACTOR_NAME_KEYS = {"Land Use": "landuse", "Slope": "slope", "Solar Energy": "solar", "Wind Energy": "wind",
+                    "Road Access": "road", "Water System": "water", "Protected Area": "reserve"}
+
+
+def test_monte_carlo_acceptance_matches_single_matrix_draws():
+    # 只有根节点一个判断矩阵时，保留的抽样与 monte_carlo_weights 逐一相同
+    A, _ = generate_consistent_matrix(5)
+    items = ["a", "b", "c", "d", "e"]
+    samples, acceptance = monte_carlo_hierarchy({"Criteria": A}, structure=Hierarchy(items), n_draws=3000,
+                                                order=items, chunk_size=700)
+    expected, cr = monte_carlo_weights(A, n_draws=3000, chunk_size=700)
+
+    assert np.allclose(samples, expected)
+    assert acceptance == pytest.approx(len(expected) / 3000)
+    assert 0 < acceptance < 1
+    assert np.all(cr < 0.1)
+
+
+def test_monte_carlo_columns_follow_factor_keys():
+    hierarchy = Hierarchy()
+    weights, matrices = random_consistent_weights(hierarchy, rng=6)
+    # 扰动极小时每个抽样都等于层次合成权重，可以逐列核对顺序
+    samples, acceptance = monte_carlo_hierarchy(matrices, structure=hierarchy, n_draws=50, method="lognormal",
+                                                sigma=1e-9)
+    assert acceptance == 1
+    assert [FACTOR_NAME_KEYS[name] for name in factor_order] == FACTOR_KEYS
+    assert samples.shape == (50, len(FACTOR_KEYS))
+    # random_consistent_weights 与 synthesize 的权重都保留 4 位小数
+    expected = synthesize(weights, hierarchy)
+    assert np.allclose(samples, [expected[name] for name in factor_order], atol=1e-3)
+    assert np.allclose(samples.sum(axis=1), 1.0)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.enums import Resampling
+
+from geoprocessing.raster_processing.align import align_raster_to_template, choose_resampling
+from geoprocessing.raster_processing.constants import EPSG_27700_WKT
+from geoprocessing.raster_processing.output_profile import read_valid_mask
+from geoprocessing.raster_processing.pipeline import FACTOR_KEYS, FACTOR_LAYER_TYPES
+from conftest import ORIGIN, CELL_SIZE
+
+CLASS_SCORES = np.array([0.2, 0.4, 0.6, 0.8, 1.0], dtype=np.float32)
+
+
+@pytest.fixture
+def graded_raster(write_raster):
+    """分级后的因子得分（5 个等级，0 为 nodata）"""
+    scores = np.random.default_rng(0).choice(CLASS_SCORES, (80, 96))
+    scores[:4] = 0
+    return write_raster("graded.tif", scores, nodata=0)
+
+
+@pytest.fixture
+def coarse_template(tmp_path):
+    """偏移半个像元、分辨率为 4 倍的模板网格"""
+    path = str(tmp_path / "template.tif")
+    transform = rasterio.transform.from_origin(ORIGIN[0] + CELL_SIZE / 2, ORIGIN[1] - CELL_SIZE / 2,
+                                               4 * CELL_SIZE, 4 * CELL_SIZE)
+    with rasterio.open(path, "w", driver="GTiff", height=19, width=23, count=1,
+                       dtype="uint8", crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT), transform=transform) as dst:
+        dst.write(np.ones((1, 19, 23), dtype=np.uint8))
+    return path
+
+
+@pytest.mark.parametrize("key", FACTOR_KEYS)
+def test_factor_scores_keep_their_classes_after_alignment(graded_raster, coarse_template, tmp_path, key):
+    with rasterio.open(graded_raster) as src, rasterio.open(coarse_template) as template:
+        assert choose_resampling(FACTOR_LAYER_TYPES[key], src, template) == Resampling.nearest
+
+    out = align_raster_to_template(graded_raster, coarse_template, str(tmp_path / f"{key}.tif"),
+                                   layer_type=FACTOR_LAYER_TYPES[key])
+    with rasterio.open(out) as dst:
+        data, valid = dst.read(1), read_valid_mask(dst)
+    assert valid.any()
+    assert set(np.unique(data[valid])) <= set(CLASS_SCORES)
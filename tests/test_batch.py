@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+from geoprocessing.raster_processing.batch import (load_config, expand_scenarios, run_batch, run_scenario,
+                                                   run_weight_sensitivity, RUN_MANIFEST_NAME, SENSITIVITY_STATS_NAME)
+from geoprocessing.raster_processing.pipeline import FACTOR_KEYS
+
+
+def test_config_paths_and_scenario_overrides(pipeline_config):
+    base_dir = os.path.dirname(pipeline_config)
+    config = load_config(pipeline_config)
+    assert config["inputs"]["dem"] == os.path.join(base_dir, "dem.tif")
+    assert config["out_dir"] == os.path.join(base_dir, "results")
+
+    base, solar_heavy = expand_scenarios(config)
+    assert base["out_dir"] == os.path.join(base_dir, "results", "base")
+    # 情景中的嵌套字典与基础配置逐键合并
+    assert solar_heavy["weights"]["solar"] == 0.3 and solar_heavy["weights"]["road"] == 0.0
+    assert solar_heavy["weights"]["landuse"] == 0.15
+    assert solar_heavy["inputs"] == base["inputs"]
+
+    config["scenarios"].append({"name": "base"})
+    with pytest.raises(ValueError, match="unique"):
+        expand_scenarios(config)
+
+
+def test_failed_scenario_does_not_stop_the_batch(pipeline_config):
+    config = load_config(pipeline_config)
+    config["scenarios"].append({"name": "broken", "inputs": {"dem": "missing.tif"}})
+
+    manifests = {manifest["name"]: manifest for manifest in run_batch(config)}
+    assert manifests["broken"]["status"] == "failed"
+    assert "dem" in manifests["broken"]["error"]
+
+    for name in ["base", "solar_heavy"]:
+        manifest = manifests[name]
+        assert manifest["status"] == "ok"
+        with open(os.path.join(manifest["out_dir"], RUN_MANIFEST_NAME), encoding="utf-8") as f:
+            assert json.load(f)["result"] == manifest["result"]
+        assert set(manifest["stage_seconds"]) == set(manifest["outputs"])
+        assert all(output["bytes"] > 0 for output in manifest["outputs"].values())
+
+    with rasterio.open(manifests["base"]["result"]) as a, rasterio.open(manifests["solar_heavy"]["result"]) as b:
+        base, solar_heavy = a.read(1), b.read(1)
+    assert base.shape == solar_heavy.shape
+    assert np.array_equal(base > 0, solar_heavy > 0)
+    assert not np.array_equal(base, solar_heavy)
+
+
+def test_rerun_reuses_cached_stages(pipeline_config):
+    scenario = expand_scenarios(load_config(pipeline_config))[0]
+    first = run_scenario(scenario)
+    with rasterio.open(first["result"]) as src:
+        expected = src.read()
+
+    second = run_scenario(scenario)
+    assert all(seconds == 0.0 for seconds in second["stage_seconds"].values())
+    with rasterio.open(second["result"]) as src:
+        assert np.array_equal(src.read(), expected)
+
+
+def test_weight_sensitivity_caps_draws(factor_rasters, tmp_path):
+    results = {f"align_{i}": factor_rasters[i % len(factor_rasters)] for i in range(len(FACTOR_KEYS))}
+    samples = np.random.default_rng(0).dirichlet(np.ones(len(FACTOR_KEYS)), 300)
+    samples_path = str(tmp_path / "samples.npy")
+    np.save(samples_path, samples)
+
+    summary = run_weight_sensitivity(results, samples_path, str(tmp_path), top_fraction=0.1, max_draws=40)
+    assert summary["draws"] == 40 and summary["total_draws"] == 300
+    with open(tmp_path / SENSITIVITY_STATS_NAME, encoding="utf-8") as f:
+        stats = json.load(f)
+    # 抽取的是原抽样中互不相同的 40 组，顺序不变
+    used = np.array([entry["weights"] for entry in stats])
+    rows = [int(np.argmin(np.abs(samples - weights).sum(axis=1))) for weights in used]
+    assert rows == sorted(set(rows))
+    assert np.allclose(samples[rows], used, atol=1e-6)
+
+    assert run_weight_sensitivity(results, samples_path, str(tmp_path), max_draws=None)["draws"] == 300
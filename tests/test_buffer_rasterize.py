@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import rasterio
+import geopandas as gpd
+import shapely
+
+from geoprocessing.raster_processing.buffer_rasterize import buffer_and_rasterize
+from geoprocessing.raster_processing.constants import EPSG_27700_WKT
+from conftest import ORIGIN, CELL_SIZE
+
+BREAKS = [500, 1000, 2000]
+SCORES = [1, 0.8, 0.6, 0.3]
+SHAPE = (200, 220)
+
+
+def random_features(rng, kind, n=6):
+    """在参考网格及其外侧（最远超出边界 1.5 km）随机生成线、圆形面或两者混合"""
+    x0, y1 = ORIGIN
+    x1, y0 = x0 + SHAPE[1] * CELL_SIZE, y1 - SHAPE[0] * CELL_SIZE
+    features = []
+    for i in range(n):
+        x, y = rng.uniform(x0 - 1500, x1 + 1500), rng.uniform(y0 - 1500, y1 + 1500)
+        if kind == "lines" or (kind == "mixed" and i % 2):
+            dx, dy = rng.uniform(-3000, 3000, 2)
+            features.append(shapely.LineString([(x, y), (x + dx, y + dy), (x + dx / 2, y - dy)]))
+        else:
+            features.append(shapely.Point(x, y).buffer(rng.uniform(100, 800)))
+    return features
+
+
+@pytest.fixture
+def ref_raster(write_raster):
+    return write_raster("ref.tif", np.ones(SHAPE, dtype=np.float32))
+
+
+def write_features(tmp_path, features):
+    path = str(tmp_path / "features.gpkg")
+    gpd.GeoDataFrame(geometry=features, crs=EPSG_27700_WKT).to_file(path)
+    return path
+
+
+def read_scores(path):
+    with rasterio.open(path) as src:
+        return src.read(1)
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("kind", ["lines", "polygons", "mixed"])
+def test_distance_method_matches_buffer_method(tmp_path, ref_raster, kind, seed):
+    shp = write_features(tmp_path, random_features(np.random.default_rng(seed), kind))
+    buffered = buffer_and_rasterize(shp, ref_raster, BREAKS, SCORES, out_path=str(tmp_path / "buffer.tif"))
+    distance = buffer_and_rasterize(shp, ref_raster, BREAKS, SCORES, out_path=str(tmp_path / "distance.tif"),
+                                    method="distance")
+    expected = read_scores(buffered)
+    assert np.array_equal(read_scores(distance), expected)
+    assert (expected > 0).any()
+
+
+def test_features_outside_the_grid_still_score(tmp_path, ref_raster):
+    # 线要素整体位于网格左侧 300 m 处，网格左缘各像元应落在前两环内
+    x0, y1 = ORIGIN
+    line = shapely.LineString([(x0 - 300, y1 + 1000), (x0 - 300, y1 - SHAPE[0] * CELL_SIZE - 1000)])
+    shp = write_features(tmp_path, [line])
+    scores = read_scores(buffer_and_rasterize(shp, ref_raster, BREAKS, SCORES, out_path=str(tmp_path / "d.tif"),
+                                              method="distance"))
+    assert np.all(scores[:, 0] == SCORES[0])
+    assert np.array_equal(scores, read_scores(
+        buffer_and_rasterize(shp, ref_raster, BREAKS, SCORES, out_path=str(tmp_path / "b.tif"))))
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from geoprocessing.raster_processing.cache import IntermediateCache
+from geoprocessing.raster_processing.scheduler import Stage, StageRef, run_stages
+
+
+def _write(input_path, text, out_path):
+    """测试阶段：把输入文件内容与 text 写入 out_path，并在 calls.log 中记录一次调用"""
+    with open(input_path) as f:
+        content = f.read()
+    with open(out_path, "w") as f:
+        f.write(f"{content}:{text}")
+    with open(os.path.join(os.path.dirname(out_path), "calls.log"), "a") as f:
+        f.write(os.path.basename(out_path) + "\n")
+    return out_path
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    input_path = tmp_path / "input.txt"
+    input_path.write_text("v1")
+    return tmp_path
+
+
+def _run(workspace, text, cache):
+    first = str(workspace / "first.txt")
+    second = str(workspace / "second.txt")
+    stages = [
+        Stage("first", _write, args=(str(workspace / "input.txt"), text, first), out_path=first),
+        Stage("second", _write, args=(StageRef("first"), "b", second), out_path=second),
+    ]
+    results, _ = run_stages(stages, n_workers=1, cache=cache, log=lambda message: None)
+    return results
+
+
+def _calls(workspace):
+    log = workspace / "calls.log"
+    calls = log.read_text().split() if log.exists() else []
+    log.unlink(missing_ok=True)
+    return calls
+
+
+def test_unchanged_stages_are_reused(workspace):
+    cache = IntermediateCache(str(workspace / "cache"))
+    _run(workspace, "a", cache)
+    assert _calls(workspace) == ["first.txt", "second.txt"]
+
+    # 新实例读取同一清单，键未变化的阶段全部命中
+    results = _run(workspace, "a", IntermediateCache(str(workspace / "cache")))
+    assert _calls(workspace) == []
+    assert results["second"] == str(workspace / "second.txt")
+    assert (workspace / "second.txt").read_text() == "v1:a:b"
+
+
+def test_changed_inputs_and_arguments_invalidate_downstream(workspace):
+    cache = IntermediateCache(str(workspace / "cache"))
+    _run(workspace, "a", cache)
+    _calls(workspace)
+
+    _run(workspace, "changed", cache)
+    assert _calls(workspace) == ["first.txt", "second.txt"]
+    assert (workspace / "second.txt").read_text() == "v1:changed:b"
+
+    (workspace / "input.txt").write_text("v2, longer")
+    _run(workspace, "changed", cache)
+    assert _calls(workspace) == ["first.txt", "second.txt"]
+    assert (workspace / "second.txt").read_text() == "v2, longer:changed:b"
+
+
+def test_previous_version_is_restored(workspace):
+    cache = IntermediateCache(str(workspace / "cache"))
+    _run(workspace, "a", cache)
+    _run(workspace, "changed", cache)
+    _calls(workspace)
+
+    # 参数改回后从对象区恢复旧结果，不重新计算
+    _run(workspace, "a", cache)
+    assert _calls(workspace) == []
+    assert (workspace / "first.txt").read_text() == "v1:a"
+    assert (workspace / "second.txt").read_text() == "v1:a:b"
+
+
+def test_old_versions_are_evicted_least_recently_used_first(workspace):
+    out_path = str(workspace / "out.txt")
+    cache = IntermediateCache(str(workspace / "cache"), max_bytes=25)
+
+    keys = []
+    for i in range(4):
+        key = cache.stage_key(_write, (str(workspace / "input.txt"), f"run{i}", out_path), {}, out_path)
+        assert cache.lookup(key, out_path) == (False, None)
+        cache.store(key, out_path, _write(str(workspace / "input.txt"), f"run{i}", out_path))
+        keys.append(key)
+
+    # 每个旧版本 7 字节，三个旧版本共 21 字节，不超过上限
+    objects = cache.manifest["objects"]
+    assert set(objects) == set(keys[:3])
+    assert sum(obj["size"] for obj in objects.values()) <= 25
+
+    # 最早替换的版本最近被使用过，淘汰的是第二个版本
+    objects[keys[0]]["last_used"] = max(obj["last_used"] for obj in objects.values()) + 1
+    cache.max_bytes = 14
+    cache.evict()
+    assert set(objects) == {keys[0], keys[2]}
+    assert not os.path.exists(os.path.join(cache.objects_dir, keys[1]))
+    assert os.path.exists(os.path.join(cache.objects_dir, keys[0]))
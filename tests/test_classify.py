@@ -0,0 +1,139 @@
+import itertools
+
+import numpy as np
+import pytest
+import rasterio
+
+from geoprocessing.raster_processing.classify import (_weighted_kmeans_1d, _centers_to_thresholds, histogram_thresholds,
+                                                      build_lookup_table, reclassify, reclassify_landuse,
+                                                      LANDUSE_RECLASS, MAX_LUT_SIZE, sample_valid_pixels,
+                                                      natural_breaks_drift, classify_natural_breaks)
+
+
+def brute_force_kmeans_1d(values, weights, n_class):
+    """枚举全部连续分段，返回加权平方误差最小的 (误差, 各类加权均值)"""
+    best = (np.inf, None)
+    for cuts in itertools.combinations(range(1, values.size), n_class - 1):
+        bounds = (0,) + cuts + (values.size,)
+        cost, centers = 0.0, []
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            mean = np.average(values[a:b], weights=weights[a:b])
+            cost += np.sum(weights[a:b] * (values[a:b] - mean) ** 2)
+            centers.append(mean)
+        if cost < best[0]:
+            best = (cost, np.array(centers))
+    return best
+
+
+def weighted_cost(values, weights, centers):
+    thresholds = _centers_to_thresholds(centers)
+    labels = np.searchsorted(thresholds, values, side="left")
+    return np.sum(weights * (values - np.asarray(centers)[labels]) ** 2)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("n_class", [2, 3, 4, 5])
+def test_weighted_kmeans_matches_brute_force(seed, n_class):
+    rng = np.random.default_rng(seed)
+    values = np.sort(rng.choice(np.linspace(0, 10, 200), 11, replace=False))
+    weights = rng.integers(1, 50, values.size).astype(np.float64)
+
+    cost, centers = brute_force_kmeans_1d(values, weights, n_class)
+    dp_centers = _weighted_kmeans_1d(values, weights, n_class)
+    assert np.allclose(dp_centers, centers)
+    assert np.isclose(weighted_cost(values, weights, dp_centers), cost)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_histogram_thresholds_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, 30, 14)
+    counts[[2, 7]] = 0
+    edges = np.linspace(-3.0, 11.0, counts.size + 1)
+
+    centers = (edges[:-1] + edges[1:]) / 2
+    keep = counts > 0
+    _, expected = brute_force_kmeans_1d(centers[keep], counts[keep].astype(np.float64), 4)
+    assert np.allclose(histogram_thresholds(counts, edges, 4), _centers_to_thresholds(expected))
+
+
+def naive_reclassify(data, mapping, default=0):
+    """逐代码比较赋值的参考实现"""
+    out = np.full(data.shape, default, dtype=np.float32)
+    for code, value in mapping.items():
+        out[data == code] = value
+    return out
+
+
+@pytest.mark.parametrize("block_size", [None, 16])
+def test_landuse_lookup_matches_per_code_mapping(write_raster, tmp_path, block_size):
+    # 含映射之外的代码（22、30）与 nodata（0）
+    data = np.random.default_rng(0).integers(0, 31, (70, 90)).astype(np.uint8)
+    path = write_raster("landuse.tif", data, nodata=0)
+
+    out = reclassify_landuse(path, str(tmp_path / "reclassified.tif"), block_size=block_size)
+    with rasterio.open(out) as src:
+        result = src.read(1)
+    assert np.array_equal(result, naive_reclassify(data, {k: 6 - v for k, v in LANDUSE_RECLASS.items()}))
+
+
+def test_code_ranges_and_float_codes(write_raster, tmp_path):
+    data = np.array([[1, 2, 3, 4.5], [7, 8, np.nan, -1], [20, 21, 9, 2]], dtype=np.float32)
+    path = write_raster("codes.tif", data, nodata=-1)
+
+    # 区间键的三种写法等价；非整数值、NaN 与 nodata 取默认值
+    mapping = {"1-2": 5, (3, 7): 3, 8: 2, "20 - 21": 1}
+    out = reclassify(path, str(tmp_path / "out.tif"), mapping, default=0)
+    with rasterio.open(out) as src:
+        result = src.read(1)
+    expected = naive_reclassify(data, {1: 5, 2: 5, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 8: 2, 20: 1, 21: 1})
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize("mapping, message", [
+    ({}, "empty"),
+    ({"5-3": 1}, "Invalid code range"),
+    ({(0, MAX_LUT_SIZE): 1}, "too large"),
+])
+def test_invalid_mappings_are_rejected(mapping, message):
+    with pytest.raises(ValueError, match=message):
+        build_lookup_table(mapping)
+
+
+@pytest.fixture
+def multimodal_raster(write_raster):
+    """五个正态分量混合的连续值栅格（200 × 200），含 nodata 条带与 NaN"""
+    rng = np.random.default_rng(0)
+    means = rng.choice([10.0, 30.0, 45.0, 70.0, 90.0], (200, 200))
+    data = (means + rng.normal(0, 4, means.shape)).astype(np.float32)
+    data[:, :8] = -9999
+    data[rng.random(data.shape) < 0.01] = np.nan
+    return write_raster("multimodal.tif", data, nodata=-9999)
+
+
+def test_stratified_sample_draws_only_valid_pixels(multimodal_raster):
+    with rasterio.open(multimodal_raster) as src:
+        data = src.read(1)
+        valid = data[(data != -9999) & ~np.isnan(data)]
+
+        sample = sample_valid_pixels(src, sample_size=5000, block_size=64)
+        assert sample.size == 5000
+        assert np.isin(sample, valid).all()
+
+        # 有效像元不足样本量时返回全部有效像元
+        everything = sample_valid_pixels(src, sample_size=valid.size + 1, block_size=64)
+        assert np.array_equal(np.sort(everything), np.sort(valid.astype(np.float64)))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_sampled_breaks_stay_close_to_full_kmeans(multimodal_raster, tmp_path, seed):
+    report = natural_breaks_drift(multimodal_raster, n_class=5, sample_size=5000, seed=seed, block_size=64)
+    assert report["max_relative_drift"] < 0.01
+    assert report["changed_fraction"] < 0.01
+
+    full = classify_natural_breaks(multimodal_raster, str(tmp_path / "full.tif"))
+    sampled = classify_natural_breaks(multimodal_raster, str(tmp_path / "sampled.tif"), method="sampled",
+                                      sample_size=5000, seed=seed, block_size=64)
+    with rasterio.open(full) as a, rasterio.open(sampled) as b:
+        full_classes, sampled_classes = a.read(1), b.read(1)
+    assert np.mean(full_classes != sampled_classes) < 0.01
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+from geoprocessing.raster_processing import factor_stack, raster_store
+from geoprocessing.raster_processing.factor_stack import FactorStack
+from geoprocessing.raster_processing.overlay import weighted_overlay
+from geoprocessing.raster_processing.output_profile import read_valid_mask, read_filled
+
+WEIGHT_SETS = [[0.5, 0.3, 0.2], [0.1, 0.1, 0.8], [0.0, 1.0, 0.0]]
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    """让 memmap 堆栈写入临时目录下的 RasterStore"""
+    path = str(tmp_path / "store")
+    monkeypatch.setattr(raster_store, "_store", raster_store.RasterStore(path))
+    return path
+
+
+@pytest.mark.parametrize("weights", WEIGHT_SETS)
+def test_score_matches_weighted_overlay(factor_rasters, tmp_path, weights):
+    stack = FactorStack.from_rasters(factor_rasters)
+    out = weighted_overlay(factor_rasters, weights, str(tmp_path / "overlay.tif"))
+    with rasterio.open(out) as src:
+        expected, valid = src.read(1), read_valid_mask(src)
+
+    score = stack.score(weights)
+    assert score.shape == expected.shape
+    assert np.allclose(score, expected, rtol=1e-5, atol=1e-4)
+    assert np.array_equal(score > 0, valid)
+
+
+def test_write_matches_weighted_overlay(factor_rasters, tmp_path):
+    weights = WEIGHT_SETS[0]
+    written = FactorStack.from_rasters(factor_rasters).write(weights, str(tmp_path / "stack.tif"))
+    expected = weighted_overlay(factor_rasters, weights, str(tmp_path / "overlay.tif"))
+    with rasterio.open(written) as a, rasterio.open(expected) as b:
+        assert np.allclose(a.read(1), b.read(1), rtol=1e-5, atol=1e-4)
+        assert np.array_equal(read_valid_mask(a), read_valid_mask(b))
+
+
+def test_memmap_stack_matches_in_memory(factor_rasters, store_dir):
+    in_memory = FactorStack.from_rasters(factor_rasters)
+    mapped = FactorStack.from_rasters(factor_rasters, block_size=32, memmap_bytes=1)
+    assert isinstance(mapped.layers, np.memmap)
+    assert np.array_equal(np.asarray(mapped.layers), in_memory.layers)
+    assert not [name for name in os.listdir(store_dir) if name.endswith(".tmp")]
+
+
+def test_failed_fill_removes_temp_memmap(factor_rasters, store_dir, monkeypatch):
+    calls = []
+
+    def failing_read(src, window=None):
+        calls.append(window)
+        if len(calls) > 2:
+            raise OSError("read failed")
+        return read_filled(src, window)
+
+    monkeypatch.setattr(factor_stack, "read_filled", failing_read)
+    with pytest.raises(OSError):
+        FactorStack.from_rasters(factor_rasters, block_size=32, memmap_bytes=1)
+    assert not [name for name in os.listdir(store_dir) if name.startswith("stack_")]
+
+
+def test_preview_level_is_strided_stack(factor_rasters):
+    stack = FactorStack.from_rasters(factor_rasters)
+    level = stack.preview_level(max_pixels=1000)
+    assert level > 0
+    step = 2 ** level
+    assert np.array_equal(stack.level(level), stack.layers[:, ::step, ::step])
+    assert stack.level(level)[0].size <= 1000
+    weights = WEIGHT_SETS[0]
+    assert np.allclose(stack.weighted_sum(weights, level), stack.weighted_sum(weights)[::step, ::step])
+
+
+def test_only_preview_level_is_copied(factor_rasters, store_dir, monkeypatch):
+    monkeypatch.setattr(factor_stack, "PREVIEW_PIXELS", 1000)
+    stack = FactorStack.from_rasters(factor_rasters, block_size=32, memmap_bytes=1)
+    preview = stack.preview_level()
+    assert preview == 2
+
+    # 非预览层级是 memmap 的视图，预览层级只复制一次
+    assert np.shares_memory(stack.level(1), stack.layers)
+    assert not np.shares_memory(stack.level(preview), stack.layers)
+    assert stack.level(preview) is stack.level(preview)
+    for k in range(preview + 2):
+        assert np.array_equal(stack.level(k), np.asarray(stack.layers)[:, ::2 ** k, ::2 ** k])
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+import rasterio
+
+from geoprocessing.raster_processing.output_profile import open_output, write_masked, read_valid_mask, \
+    output_band_count, OUTPUT_PROFILES, DEFAULT_OUTPUT_PROFILE, MASK_MODE_ENV, MASK_MODES
+from geoprocessing.raster_processing.pipeline import build_suitability_stages, INPUT_KEYS, FACTOR_KEYS
+from geoprocessing.raster_processing.align import align_raster_to_template
+from geoprocessing.raster_processing.classify import classify_natural_breaks
+from geoprocessing.raster_processing.constants import EPSG_27700_WKT
+from geoprocessing.raster_processing.scheduler import Stage, StageRef, run_stages
+from conftest import ORIGIN, CELL_SIZE
+
+
+def source_profile(write_raster, dtype):
+    with rasterio.open(write_raster("source.tif", np.zeros((70, 90), dtype=dtype))) as src:
+        return src.profile
+
+
+def sample_data(dtype):
+    rng = np.random.default_rng(0)
+    data = (rng.random((70, 90)) * 100).astype(dtype)
+    valid = rng.random((70, 90)) > 0.1
+    # 有效像元中包含恰好为 0 的值
+    data[0, :10] = 0
+    valid[0, :10] = True
+    data[~valid] = 0
+    return data, valid
+
+
+@pytest.mark.parametrize("dtype", ["float32", "uint8"])
+@pytest.mark.parametrize("name", list(OUTPUT_PROFILES))
+def test_output_profiles_round_trip(write_raster, tmp_path, name, dtype):
+    data, valid = sample_data(dtype)
+    profile = dict(source_profile(write_raster, dtype), nodata=0, count=output_band_count())
+    out_path = str(tmp_path / f"{name}.tif")
+    with open_output(out_path, profile, name) as dst:
+        for rows in (slice(0, 40), slice(40, 70)):
+            window = rasterio.windows.Window(0, rows.start, 90, rows.stop - rows.start)
+            write_masked(dst, data[rows], valid[rows], window=window)
+
+    options = OUTPUT_PROFILES[name]
+    with rasterio.open(out_path) as src:
+        assert np.array_equal(src.read(1), data)
+        assert np.array_equal(read_valid_mask(src), valid)
+        assert src.profile.get("tiled", False) == bool(options.get("tiled"))
+        compress = src.profile.get("compress")
+        assert (compress or "").lower() == options.get("compress", "")
+
+
+@pytest.mark.parametrize("mask_mode", MASK_MODES)
+def test_mask_modes_round_trip(write_raster, tmp_path, monkeypatch, mask_mode):
+    monkeypatch.setenv(MASK_MODE_ENV, mask_mode)
+    data, valid = sample_data("float32")
+    profile = dict(source_profile(write_raster, "float32"), nodata=0, count=output_band_count())
+    with open_output(str(tmp_path / "out.tif"), profile) as dst:
+        write_masked(dst, data, valid)
+
+    with rasterio.open(tmp_path / "out.tif") as src:
+        assert src.count == (2 if mask_mode == "alpha" else 1)
+        assert np.array_equal(src.read(1), data)
+        if mask_mode == "nodata":
+            # 只靠 nodata 值：值恰好为 0 的有效像元被视为无效
+            assert np.array_equal(read_valid_mask(src), valid & (data != 0))
+        else:
+            assert np.array_equal(read_valid_mask(src), valid)
+
+
+def test_default_profile_keeps_legacy_layout(write_raster, tmp_path):
+    assert DEFAULT_OUTPUT_PROFILE == "legacy"
+    data, valid = sample_data("float32")
+    profile = dict(source_profile(write_raster, "float32"), nodata=0, count=output_band_count())
+    with open_output(str(tmp_path / "out.tif"), profile) as dst:
+        write_masked(dst, data, valid)
+    with rasterio.open(tmp_path / "out.tif") as src:
+        assert src.compression is None and not src.profile.get("tiled", False)
+
+
+@pytest.mark.parametrize("mask_mode", MASK_MODES)
+def test_valid_zero_scores_survive_classify_and_align(write_raster, tmp_path, monkeypatch, mask_mode):
+    monkeypatch.setenv(MASK_MODE_ENV, mask_mode)
+    rng = np.random.default_rng(0)
+    data = (rng.random((70, 90)) * 100).astype(np.float32)
+    data[:, :6] = -9999
+    source = write_raster("source.tif", data, nodata=-9999)
+    source_valid = data != -9999
+
+    # 模板网格相对源网格平移 (3, 2) 个整像元，最近邻对齐后取值不变
+    template = str(tmp_path / "template.tif")
+    transform = rasterio.transform.from_origin(ORIGIN[0] + 3 * CELL_SIZE, ORIGIN[1] - 2 * CELL_SIZE,
+                                               CELL_SIZE, CELL_SIZE)
+    with rasterio.open(template, "w", driver="GTiff", height=70, width=90, count=1, dtype="uint8",
+                       crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT), transform=transform) as dst:
+        dst.write(np.ones((1, 70, 90), dtype=np.uint8))
+
+    # 掩膜方式经环境变量传给 spawn 出的工作进程
+    stages = [
+        Stage("classify", classify_natural_breaks, args=(source, str(tmp_path / "classified.tif"))),
+        Stage("align", align_raster_to_template, args=(StageRef("classify"), template, str(tmp_path / "aligned.tif"))),
+    ]
+    results, _ = run_stages(stages, n_workers=2, log=lambda message: None)
+
+    with rasterio.open(results["classify"]) as src:
+        classified, classified_valid = src.read(1), read_valid_mask(src)
+    with rasterio.open(results["align"]) as src:
+        aligned, aligned_valid = src.read(1), read_valid_mask(src)
+
+    # 最低等级的得分为 0：alpha / mask 模式下仍为有效像元，nodata 模式下与 nodata 无法区分
+    lowest = source_valid & (classified == 0)
+    assert lowest.any()
+    expected_valid = source_valid & ~lowest if mask_mode == "nodata" else source_valid
+    assert np.array_equal(classified_valid, expected_valid)
+
+    assert np.array_equal(aligned[:68, :87], classified[2:, 3:])
+    assert np.array_equal(aligned_valid[:68, :87], expected_valid[2:, 3:])
+    assert not aligned_valid[68:].any() and not aligned_valid[:, 87:].any()
+
+
+@pytest.mark.parametrize("output_profile", [None, "zstd"])
+def test_pipeline_passes_output_profile_to_raster_stages(tmp_path, output_profile):
+    inputs = {key: str(tmp_path / f"{key}.tif") for key in INPUT_KEYS}
+    stages = build_suitability_stages(inputs, [1 / len(FACTOR_KEYS)] * len(FACTOR_KEYS), str(tmp_path),
+                                      output_profile=output_profile)
+    raster_stages = [stage for stage in stages if not stage.name.endswith("_clip")]
+    assert raster_stages
+    for stage in raster_stages:
+        assert stage.kwargs["output_profile"] == (output_profile or DEFAULT_OUTPUT_PROFILE)
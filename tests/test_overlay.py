@@ -0,0 +1,149 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+import rasterio
+
+from geoprocessing.raster_processing import overlay
+from geoprocessing.raster_processing.align import align_raster_to_template
+from geoprocessing.raster_processing.constants import EPSG_27700_WKT
+from geoprocessing.raster_processing.factor_stack import FactorStack
+from geoprocessing.raster_processing.overlay import weighted_overlay, batch_weighted_overlay
+from geoprocessing.raster_processing.output_profile import MASK_MODE_ENV, MASK_MODES, read_valid_mask
+from conftest import ORIGIN, CELL_SIZE
+
+WEIGHTS = [0.5, 0.3, 0.2]
+
+WEIGHT_MATRIX = np.array([[0.5, 0.3, 0.2], [0.2, 0.2, 0.6], [0.8, 0.1, 0.1], [0.0, 0.5, 0.5]], dtype=np.float32)
+
+
+def read_result(path):
+    with rasterio.open(path) as src:
+        return src.read(1), read_valid_mask(src)
+
+
+@pytest.mark.parametrize("mask_mode", MASK_MODES)
+@pytest.mark.parametrize("block_size", [16, 25, 128])
+def test_windowed_overlay_matches_in_memory(factor_rasters, tmp_path, monkeypatch, mask_mode, block_size):
+    monkeypatch.setenv(MASK_MODE_ENV, mask_mode)
+    full = weighted_overlay(factor_rasters, WEIGHTS, str(tmp_path / "full.tif"))
+    windowed = weighted_overlay(factor_rasters, WEIGHTS, str(tmp_path / "windowed.tif"), block_size=block_size)
+
+    data, valid = read_result(full)
+    windowed_data, windowed_valid = read_result(windowed)
+    assert np.array_equal(data, windowed_data)
+    assert np.array_equal(valid, windowed_valid)
+    assert valid.any() and not valid.all()
+
+
+def test_virtual_overlay_on_template_grid_matches_in_memory(factor_rasters, tmp_path):
+    full = weighted_overlay(factor_rasters, WEIGHTS, str(tmp_path / "full.tif"))
+    virtual = weighted_overlay(factor_rasters, WEIGHTS, str(tmp_path / "virtual.tif"), block_size=32,
+                               template_path=factor_rasters[0])
+
+    data, valid = read_result(full)
+    virtual_data, virtual_valid = read_result(virtual)
+    assert np.array_equal(data, virtual_data)
+    assert np.array_equal(valid, virtual_valid)
+
+
+@pytest.fixture
+def shifted_template(tmp_path):
+    """偏移 1/3 个像元、像元大小为 1.5 倍且超出因子范围的模板网格"""
+    path = str(tmp_path / "template.tif")
+    transform = rasterio.transform.from_origin(ORIGIN[0] - 10 * CELL_SIZE / 3, ORIGIN[1] + CELL_SIZE / 3,
+                                               1.5 * CELL_SIZE, 1.5 * CELL_SIZE)
+    with rasterio.open(path, "w", driver="GTiff", height=53, width=67, count=1, dtype="uint8",
+                       crs=rasterio.crs.CRS.from_wkt(EPSG_27700_WKT), transform=transform) as dst:
+        dst.write(np.ones((1, 53, 67), dtype=np.uint8))
+    return path
+
+
+@pytest.mark.parametrize("mask_mode", MASK_MODES)
+@pytest.mark.parametrize("layer_types", [None, ["continuous", "categorical", "categorical"]])
+def test_virtual_overlay_matches_align_then_overlay(factor_rasters, shifted_template, tmp_path, monkeypatch,
+                                                    mask_mode, layer_types):
+    monkeypatch.setenv(MASK_MODE_ENV, mask_mode)
+    types = layer_types or ["categorical"] * len(factor_rasters)
+    aligned = [align_raster_to_template(path, shifted_template, str(tmp_path / f"aligned_{i}.tif"),
+                                        layer_type=layer_type, block_size=20)
+               for i, (path, layer_type) in enumerate(zip(factor_rasters, types))]
+    expected = weighted_overlay(aligned, WEIGHTS, str(tmp_path / "expected.tif"))
+    virtual = weighted_overlay(factor_rasters, WEIGHTS, str(tmp_path / "virtual.tif"), block_size=20,
+                               template_path=shifted_template, layer_types=layer_types)
+
+    data, valid = read_result(expected)
+    virtual_data, virtual_valid = read_result(virtual)
+    assert data.shape == (53, 67)
+    assert np.array_equal(valid, virtual_valid)
+    assert valid.any() and not valid.all()
+    assert np.allclose(data, virtual_data, rtol=0, atol=1e-4)
+
+    # 批量叠加与因子堆栈的虚拟对齐读取方式相同
+    stats = batch_weighted_overlay(factor_rasters, WEIGHT_MATRIX[:1], block_size=20, template_path=shifted_template,
+                                   layer_types=layer_types)
+    assert stats[0]["valid_pixels"] == int(np.count_nonzero(data > 0))
+    stack = FactorStack.from_rasters(factor_rasters, template_path=shifted_template, layer_types=layer_types)
+    assert np.allclose(stack.score(WEIGHTS), data, rtol=0, atol=1e-4)
+
+
+def single_runs(factor_rasters, tmp_path):
+    """对 WEIGHT_MATRIX 的每一行单独运行 weighted_overlay"""
+    return [read_result(weighted_overlay(factor_rasters, weights, str(tmp_path / f"single_{i}.tif")))
+            for i, weights in enumerate(WEIGHT_MATRIX)]
+
+
+def test_batch_stats_match_single_runs(factor_rasters, tmp_path):
+    threshold = 50.0
+    stats = batch_weighted_overlay(factor_rasters, WEIGHT_MATRIX, threshold=threshold, block_size=32,
+                                   stability_path=str(tmp_path / "stability.tif"))
+    singles = single_runs(factor_rasters, tmp_path)
+
+    assert len(stats) == len(WEIGHT_MATRIX)
+    for entry, (score, valid) in zip(stats, singles):
+        assert entry["valid_pixels"] == valid.sum()
+        assert entry["pixels_above"] == np.count_nonzero(score[valid] >= threshold)
+        assert np.isclose(entry["mean_score"], score[valid].mean(), rtol=1e-5)
+        assert np.isclose(entry["fraction_above"], np.count_nonzero(score[valid] >= threshold) / valid.sum())
+
+    # 排序稳定性 = 各像元得分 ≥ threshold 的情景比例
+    frequency, frequency_valid = read_result(str(tmp_path / "stability.tif"))
+    expected = np.mean([(score >= threshold) & valid for score, valid in singles], axis=0)
+    assert np.allclose(frequency, expected)
+    assert np.array_equal(frequency_valid, np.any([valid for _, valid in singles], axis=0))
+
+
+def test_batch_top_fraction_cutoffs_match_single_runs(factor_rasters, tmp_path):
+    top_fraction = 0.2
+    stats = batch_weighted_overlay(factor_rasters, WEIGHT_MATRIX, top_fraction=top_fraction, block_size=32)
+    for entry, (score, valid) in zip(stats, single_runs(factor_rasters, tmp_path)):
+        # 截断值取自 0.01 分精度的直方图：不低于真实分位数前一个分箱，且至少选中 top_fraction 的像元
+        values = score[valid]
+        assert np.count_nonzero(values >= entry["top_cutoff"]) >= top_fraction * values.size
+        assert entry["top_cutoff"] >= np.quantile(values, 1 - top_fraction) - 0.01
+
+
+def test_batch_stack_matches_batch_rasters(factor_rasters):
+    from_rasters = batch_weighted_overlay(factor_rasters, WEIGHT_MATRIX, threshold=40.0, block_size=32)
+    from_stack = batch_weighted_overlay(FactorStack.from_rasters(factor_rasters), WEIGHT_MATRIX, threshold=40.0,
+                                        block_size=32)
+    assert from_rasters == from_stack
+
+
+def test_batch_top_fraction_with_many_scenarios(factor_rasters, monkeypatch):
+    # 缩小分块上限，使 2000 个情景拆成约 20 批直方图；整体直方图需 160 MB，分批后峰值应远低于此
+    monkeypatch.setattr(overlay, "BATCH_CHUNK_ELEMENTS", 1 << 20)
+    weight_matrix = np.random.default_rng(1).dirichlet(np.ones(3), 2000).astype(np.float32)
+    picked = [0, 103, 104, 1500, 1999]
+
+    tracemalloc.start()
+    try:
+        stats = batch_weighted_overlay(factor_rasters, weight_matrix, top_fraction=0.1, block_size=32)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 2 ** 20
+
+    assert len(stats) == len(weight_matrix)
+    expected = batch_weighted_overlay(factor_rasters, weight_matrix[picked], top_fraction=0.1, block_size=32)
+    assert [stats[i] for i in picked] == expected
@@ -0,0 +1,111 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+import shapely
+from shapely.geometry import Point, box
+
+from geoprocessing.raster_processing.align import align_raster_to_template
+from geoprocessing.raster_processing.boundary import get_boundary
+from geoprocessing.raster_processing.constants import EPSG_27700_WKT
+from geoprocessing.raster_processing.grid import GridSpec, grid_from_boundary
+from geoprocessing.raster_processing.output_profile import MASK_MODE_ENV, MASK_MODES, read_valid_mask
+from geoprocessing.raster_processing.raster_crop import crop_raster_to_boundary
+from conftest import ORIGIN, CELL_SIZE
+
+
+@pytest.fixture
+def boundary_path(tmp_path):
+    """圆形与矩形拼接的不规则边界，位于栅格内部且不与像元边界对齐"""
+    x0, y0 = ORIGIN
+    circle = Point(x0 + 30.3 * CELL_SIZE, y0 - 28.7 * CELL_SIZE).buffer(17.2 * CELL_SIZE)
+    rectangle = box(x0 + 40.4 * CELL_SIZE, y0 - 52.6 * CELL_SIZE, x0 + 71.1 * CELL_SIZE, y0 - 33.3 * CELL_SIZE)
+    path = str(tmp_path / "boundary.shp")
+    gpd.GeoDataFrame(geometry=[circle, rectangle], crs=EPSG_27700_WKT).to_file(path)
+    return path
+
+
+@pytest.fixture
+def input_rasters(write_raster):
+    rng = np.random.default_rng(1)
+    dem = (rng.random((80, 90)) * 300).astype(np.float32)
+    dem[30:34, 20:60] = -9999
+    landuse = rng.integers(1, 22, (80, 90)).astype(np.uint8)
+    landuse[50:, 45:50] = 0
+    return [write_raster("dem.tif", dem, nodata=-9999), write_raster("landuse.tif", landuse, nodata=0)]
+
+
+@pytest.mark.parametrize("mask_mode", MASK_MODES)
+@pytest.mark.parametrize("block_size", [16, 37])
+def test_windowed_crop_matches_in_memory(input_rasters, boundary_path, tmp_path, monkeypatch, mask_mode,
+                                         block_size):
+    monkeypatch.setenv(MASK_MODE_ENV, mask_mode)
+    for raster in input_rasters:
+        full = crop_raster_to_boundary(raster, boundary_path, str(tmp_path / "full.tif"))
+        windowed = crop_raster_to_boundary(raster, boundary_path, str(tmp_path / "windowed.tif"),
+                                           block_size=block_size)
+
+        with rasterio.open(full) as a, rasterio.open(windowed) as b:
+            assert (a.height, a.width, a.count) == (b.height, b.width, b.count)
+            assert a.transform == b.transform
+            assert a.nodata == b.nodata
+            assert np.array_equal(a.read(), b.read())
+            assert np.array_equal(a.read_masks(), b.read_masks())
+
+
+def read_cropped(path):
+    with rasterio.open(path) as src:
+        return src.read(1), read_valid_mask(src), GridSpec.from_dataset(src)
+
+
+@pytest.mark.parametrize("mask_mode", MASK_MODES)
+def test_crop_to_own_grid_matches_plain_crop(input_rasters, boundary_path, tmp_path, monkeypatch, mask_mode):
+    monkeypatch.setenv(MASK_MODE_ENV, mask_mode)
+    for raster in input_rasters:
+        grid = grid_from_boundary(raster, boundary_path)
+        plain = crop_raster_to_boundary(raster, boundary_path, str(tmp_path / "plain.tif"))
+        on_grid = crop_raster_to_boundary(raster, boundary_path, str(tmp_path / "grid.tif"), grid=grid)
+
+        data, valid, plain_grid = read_cropped(plain)
+        grid_data, grid_valid, output_grid = read_cropped(on_grid)
+        assert plain_grid == grid == output_grid
+        assert np.array_equal(data, grid_data)
+        assert np.array_equal(valid, grid_valid)
+
+
+def test_crop_to_shared_grid_matches_crop_then_align(input_rasters, boundary_path, write_raster, tmp_path):
+    dem, landuse = input_rasters
+    grid = grid_from_boundary(landuse, boundary_path)
+    template = crop_raster_to_boundary(landuse, boundary_path, str(tmp_path / "template.tif"))
+
+    # 另一幅栅格位于偏移 0.3 个像元、像元更小的网格上，直接输出到共享网格需要重投影
+    rng = np.random.default_rng(2)
+    solar = (rng.random((110, 120)) * 100).astype(np.float32)
+    solar[60:64] = -9999
+    with rasterio.open(dem) as src:
+        profile = src.profile
+    path = str(tmp_path / "solar.tif")
+    profile.update(height=110, width=120, nodata=-9999,
+                   transform=rasterio.transform.from_origin(ORIGIN[0] - 0.3 * CELL_SIZE, ORIGIN[1] + 0.3 * CELL_SIZE,
+                                                            0.75 * CELL_SIZE, 0.75 * CELL_SIZE))
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(solar, 1)
+
+    cropped = crop_raster_to_boundary(path, boundary_path, str(tmp_path / "solar_crop.tif"))
+    aligned = align_raster_to_template(cropped, template, str(tmp_path / "solar_aligned.tif"))
+    on_grid = crop_raster_to_boundary(path, boundary_path, str(tmp_path / "solar_grid.tif"), grid=grid)
+
+    data, valid, aligned_grid = read_cropped(aligned)
+    grid_data, grid_valid, output_grid = read_cropped(on_grid)
+    assert aligned_grid == grid == output_grid
+
+    # 两种方式都按最近邻取值，同为有效的像元取值相同
+    both = valid & grid_valid
+    assert both.sum() > 0.8 * valid.sum()
+    assert np.array_equal(data[both], grid_data[both])
+
+    # 有效性只在边界附近不同：先裁剪按源网格判断边界，共享网格按输出网格判断
+    rows, cols = np.nonzero(valid != grid_valid)
+    xs, ys = rasterio.transform.xy(grid.transform, rows, cols)
+    edge = get_boundary(boundary_path).union(EPSG_27700_WKT).boundary
+    assert (shapely.distance(shapely.points(xs, ys), edge) <= 1.5 * CELL_SIZE).all()
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+from geoprocessing.raster_processing.output_profile import read_valid_mask
+from geoprocessing.raster_processing.raster_store import RasterStore, ARRAY_PREFIX
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RasterStore(str(tmp_path / "store"))
+
+
+def array_files(store):
+    return sorted(name for name in os.listdir(store.store_dir) if name.startswith(ARRAY_PREFIX))
+
+
+def test_store_reads_match_rasterio(factor_rasters, store):
+    for path in factor_rasters:
+        with rasterio.open(path) as src:
+            expected, valid = src.read(1), read_valid_mask(src) > 0
+        assert np.array_equal(store.read(path), expected, equal_nan=True)
+        assert np.array_equal(store.read_valid(path), valid)
+        assert store.read(path) is store.read(path)
+
+    # 新实例直接映射磁盘上已解码的数组
+    files = array_files(store)
+    other = RasterStore(store.store_dir)
+    assert np.array_equal(other.read(factor_rasters[0]), store.read(factor_rasters[0]), equal_nan=True)
+    assert array_files(other) == files
+
+
+def test_invalidate_and_clear_keep_foreign_files(factor_rasters, store):
+    foreign = os.path.join(store.store_dir, "stack_0123456789abcdef.npy")
+    np.save(foreign, np.zeros(3))
+    store.read(factor_rasters[0])
+    store.read(factor_rasters[1])
+
+    store.invalidate(factor_rasters[0])
+    assert len(array_files(store)) == 1
+    store.invalidate()
+    assert not array_files(store)
+    store.read(factor_rasters[0])
+    store.clear()
+    assert not array_files(store)
+    assert os.path.exists(foreign)
+
+
+def test_store_size_is_bounded(factor_rasters, store):
+    # 每个数组约 25 KB，上限只容得下两个：最早使用且未被映射的数组被淘汰
+    store.max_bytes = 60 * 1024
+    store.read(factor_rasters[0])
+    store.close()
+    store.read(factor_rasters[1])
+    store.read(factor_rasters[2])
+    files = array_files(store)
+    assert len(files) == 2
+    assert all(os.path.exists(store._array_path(os.path.abspath(path), store._fingerprint(os.path.abspath(path)), "b1"))
+               for path in factor_rasters[1:])
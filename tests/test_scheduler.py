@@ -0,0 +1,83 @@
+import pytest
+
+from geoprocessing.raster_processing.scheduler import Stage, StageRef, run_stages
+
+
+# 阶段函数须定义在模块级，才能被 spawn 出的工作进程导入
+def _join(*parts, sep="+"):
+    return sep.join(parts)
+
+
+def _fail(*parts):
+    raise ValueError("broken input")
+
+
+def _diamond(order=None):
+    """a → (b, c) → d 的菱形依赖，另有一个独立阶段 e；order 为阶段在列表中的排列"""
+    stages = {
+        "a": Stage("a", _join, args=("a",)),
+        "b": Stage("b", _join, args=(StageRef("a"), "b")),
+        "c": Stage("c", _join, args=(StageRef("a"),), kwargs={"sep": "-"}),
+        "d": Stage("d", _join, args=(StageRef("b"), StageRef("c")), kwargs={"sep": "|"}),
+        "e": Stage("e", _join, args=("e",)),
+    }
+    return [stages[name] for name in (order or "dcbae")]
+
+
+def _replace(stages, new_stage):
+    return [new_stage if stage.name == new_stage.name else stage for stage in stages]
+
+
+EXPECTED = {"a": "a", "b": "a+b", "c": "a", "d": "a+b|a", "e": "e"}
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_stages_run_after_their_dependencies(n_workers):
+    order = []
+    results, timings = run_stages(_diamond(), n_workers=n_workers, log=lambda message: None,
+                                  on_stage_done=lambda stage, *_: order.append(stage.name))
+
+    assert results == EXPECTED
+    assert set(timings) == set(EXPECTED)
+    assert sorted(order) == sorted(EXPECTED)
+    for stage in _diamond():
+        for dep in stage.deps:
+            assert order.index(dep) < order.index(stage.name)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_stage_error_stops_dependents(n_workers):
+    stages = _replace(_diamond(), Stage("b", _fail, args=(StageRef("a"),)))
+    done = []
+
+    with pytest.raises(RuntimeError, match="Stage b failed: broken input") as info:
+        run_stages(stages, n_workers=n_workers, log=lambda message: None,
+                   on_stage_done=lambda stage, *_: done.append(stage.name))
+
+    assert isinstance(info.value.__cause__, ValueError)
+    assert "a" in done
+    assert "b" not in done and "d" not in done
+
+
+def test_skipped_stages_reuse_out_path():
+    stages = _diamond()
+    for stage in stages:
+        stage.out_path = f"{stage.name}.tif"
+    stages = _replace(stages, Stage("a", _fail, out_path="a.tif"))
+
+    results, timings = run_stages(stages, n_workers=1, log=lambda message: None,
+                                  skip=lambda stage: stage.name == "a")
+
+    assert results["a"] == "a.tif"
+    assert timings["a"] == 0.0
+    assert results["d"] == "a.tif+b|a.tif"
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", _join, args=(StageRef("b"),)), Stage("b", _join, args=(StageRef("a"),))], "cycle"),
+    ([Stage("a", _join, args=(StageRef("missing"),))], "unknown stages"),
+    ([Stage("a", _join), Stage("a", _join)], "Duplicate stage names"),
+])
+def test_invalid_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        run_stages(stages, n_workers=1, log=lambda message: None)
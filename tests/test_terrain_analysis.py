@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+import rasterio
+
+from geoprocessing.raster_processing.output_profile import read_valid_mask, validity_source, MASK_MODE_ENV, MASK_MODES
+from geoprocessing.raster_processing.terrain_analysis import compute_slope, compute_terrain, terrain_derivatives, \
+    SLOPE_HISTOGRAM_BINS
+from conftest import CELL_SIZE
+
+
+@pytest.fixture
+def dem_path(write_raster):
+    """起伏地形加噪声的 DEM（75 × 88，无 nodata）"""
+    rows, cols = np.mgrid[0:75, 0:88]
+    rng = np.random.default_rng(2)
+    dem = 120 + 40 * np.sin(rows / 9.0) * np.cos(cols / 13.0) + 0.3 * rows + rng.normal(0, 1.5, rows.shape)
+    return write_raster("dem.tif", dem.astype(np.float32))
+
+
+def read_result(path):
+    with rasterio.open(path) as src:
+        return src.read(1), read_valid_mask(src)
+
+
+def test_windowed_slope_is_independent_of_block_size(dem_path, tmp_path):
+    results = [read_result(compute_slope(dem_path, str(tmp_path / f"slope_{block_size}.tif"), block_size=block_size))
+               for block_size in (16, 37, 1024)]
+    for data, valid in results[1:]:
+        assert np.array_equal(data, results[0][0])
+        assert np.array_equal(valid, results[0][1])
+
+
+def test_windowed_slope_matches_in_memory(dem_path, tmp_path):
+    full, full_valid = read_result(compute_slope(dem_path, str(tmp_path / "full.tif")))
+    windowed, windowed_valid = read_result(compute_slope(dem_path, str(tmp_path / "windowed.tif"), block_size=16))
+    assert np.array_equal(full_valid, windowed_valid)
+
+    # 分块引擎的分位数取自直方图（误差不超过一个分箱），只有坡度落在两种断点之间的像元等级可能不同
+    with rasterio.open(dem_path) as src:
+        dem = src.read(1).astype(float)
+    slope = np.degrees(np.arctan(np.hypot(np.gradient(dem, axis=1) / CELL_SIZE, np.gradient(dem, axis=0) / CELL_SIZE)))
+    breaks = np.percentile(slope, [25, 50, 75])
+    near_break = np.min(np.abs(slope[..., None] - breaks), axis=-1) <= 2 * 90.0 / SLOPE_HISTOGRAM_BINS
+
+    differs = full != windowed
+    assert not np.any(differs & ~near_break)
+    assert differs.mean() < 0.001
+
+
+# 倾斜平面 z = 100 + P·x（向东）+ Q·y（向北）
+P, Q = 0.12, -0.05
+
+
+@pytest.fixture
+def plane_path(write_raster):
+    """倾斜平面 DEM（40 × 52），中间挖一个 nodata 洞"""
+    rows, cols = np.mgrid[0:40, 0:52]
+    dem = (100 + P * cols * CELL_SIZE - Q * rows * CELL_SIZE).astype(np.float32)
+    dem[18:22, 25:30] = -32768
+    return write_raster("plane.tif", dem, nodata=-32768)
+
+
+def expected_hillshade(slope, aspect, azimuth=315.0, altitude=45.0):
+    """经典山体阴影公式：cos(天顶角)·cos(坡度) + sin(天顶角)·sin(坡度)·cos(光源方位 - 坡向)"""
+    zenith = np.radians(90.0 - altitude)
+    slope, aspect = np.radians(slope), np.radians(aspect)
+    value = np.cos(zenith) * np.cos(slope) + np.sin(zenith) * np.sin(slope) * np.cos(np.radians(azimuth) - aspect)
+    return np.clip(value, 0, 1) * 254 + 1
+
+
+@pytest.mark.parametrize("method", ["horn", "zevenbergen"])
+@pytest.mark.parametrize("cell", [(CELL_SIZE, CELL_SIZE), (30.0, 75.0)])
+def test_kernels_recover_plane_gradient(method, cell):
+    cell_x, cell_y = cell
+    rows, cols = np.mgrid[0:12, 0:15]
+    dem = 100 + P * cols * cell_x - Q * rows * cell_y
+    dz_dx, dz_dy = terrain_derivatives(dem, cell_x, cell_y, method)
+    assert dz_dx.shape == (10, 13)
+    assert np.allclose(dz_dx, P) and np.allclose(dz_dy, Q)
+
+
+@pytest.mark.parametrize("method", ["horn", "zevenbergen"])
+def test_terrain_outputs_on_tilted_plane(plane_path, tmp_path, method):
+    outputs = compute_terrain(plane_path, str(tmp_path / "slope.tif"), str(tmp_path / "aspect.tif"),
+                              str(tmp_path / "hillshade.tif"), method=method, block_size=16)
+    (slope, slope_valid), (aspect, _), (shade, shade_valid) = [read_result(outputs[key])
+                                                               for key in ("slope", "aspect", "hillshade")]
+
+    # 栅格边缘复制边缘像元、nodata 洞周围 1 像元不参与比较
+    interior = np.zeros(slope.shape, dtype=bool)
+    interior[1:-1, 1:-1] = True
+    interior[17:23, 24:31] = False
+    expected_slope = np.degrees(np.arctan(np.hypot(P, Q)))
+    # 下坡方向 (-P, -Q) 的方位角：自正北顺时针
+    expected_aspect = np.degrees(np.arctan2(-P, -Q)) % 360
+    assert np.allclose(slope[interior], expected_slope, atol=1e-3)
+    assert np.allclose(aspect[interior], expected_aspect, atol=1e-2)
+    assert np.all(np.abs(shade[interior].astype(float) - expected_hillshade(expected_slope, expected_aspect)) <= 1)
+
+    assert not slope_valid[18:22, 25:30].any()
+    assert np.array_equal(slope_valid, shade_valid)
+
+
+@pytest.mark.parametrize("mask_mode", MASK_MODES)
+def test_terrain_outputs_follow_mask_mode(plane_path, tmp_path, monkeypatch, mask_mode):
+    monkeypatch.setenv(MASK_MODE_ENV, mask_mode)
+    outputs = compute_terrain(plane_path, str(tmp_path / "slope.tif"), hillshade_path=str(tmp_path / "shade.tif"))
+    with rasterio.open(outputs["slope"]) as src:
+        assert src.count == (2 if mask_mode == "alpha" else 1)
+        assert validity_source(src) == ("nodata" if mask_mode == "nodata" else mask_mode)
+        valid = read_valid_mask(src)
+    assert not valid[18:22, 25:30].any() and valid[0, 0]
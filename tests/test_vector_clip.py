@@ -0,0 +1,125 @@
+import concurrent.futures
+import multiprocessing
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import LineString, Point, Polygon, box
+
+from geoprocessing.raster_processing.constants import EPSG_27700_WKT
+from geoprocessing.raster_processing.boundary import get_boundary
+from geoprocessing.raster_processing.vector_clip import (clip_vector_to_boundary, _clip_to_geometry, _clip_vectorized,
+                                                         _init_clip_worker)
+from conftest import ORIGIN
+
+X0, Y0 = ORIGIN
+
+
+@pytest.fixture
+def boundary_path(tmp_path):
+    """矩形与圆形拼接的边界；矩形边为直线，便于构造与边界只共边、共点的要素"""
+    rectangle = box(X0, Y0, X0 + 1000, Y0 + 1000)
+    circle = Point(X0 + 1000, Y0 + 500).buffer(300)
+    path = str(tmp_path / "boundary.shp")
+    gpd.GeoDataFrame(geometry=[rectangle, circle], crs=EPSG_27700_WKT).to_file(path)
+    return path
+
+
+def _random_polygons(rng, n):
+    centers = rng.uniform(-300, 1600, (n, 2))
+    sizes = rng.uniform(20, 400, (n, 2))
+    return [box(X0 + x, Y0 + y, X0 + x + w, Y0 + y + h) for (x, y), (w, h) in zip(centers, sizes)]
+
+
+def _random_lines(rng, n):
+    return [LineString(rng.uniform(-300, 1600, (4, 2)) + ORIGIN) for _ in range(n)]
+
+
+@pytest.fixture
+def source_layers(tmp_path):
+    """
+    面、线、点三种源图层（各约 150 个要素，超过空间索引与多线程的阈值），
+    包含跨越边界、完全在内、完全在外的要素，以及与边界只共边 / 共点、求交后只剩低维部分的要素
+    """
+    rng = np.random.default_rng(3)
+    polygons = _random_polygons(rng, 150) + [
+        # 与矩形下边只共边：求交结果为线
+        box(X0 + 100, Y0 - 50, X0 + 300, Y0),
+        # 一部分在边界内、另有一条边落在边界上：求交结果为 GeometryCollection（面 + 线）
+        Polygon([(X0 - 100, Y0 + 100), (X0 + 50, Y0 + 100), (X0 + 50, Y0 + 200), (X0, Y0 + 200),
+                 (X0, Y0 + 300), (X0 - 100, Y0 + 300)]),
+    ]
+    lines = _random_lines(rng, 150) + [
+        # 只在一个点上接触边界
+        LineString([(X0 - 100, Y0 - 100), (X0, Y0 + 500), (X0 - 100, Y0 + 900)]),
+    ]
+    points = [Point(X0 + x, Y0 + y) for x, y in rng.uniform(-300, 1600, (150, 2))]
+
+    layers = {}
+    for name, geoms in (("polygons", polygons), ("lines", lines), ("points", points)):
+        path = str(tmp_path / f"{name}.shp")
+        gpd.GeoDataFrame({"fid_src": np.arange(len(geoms)), "value": rng.random(len(geoms))},
+                         geometry=geoms, crs=EPSG_27700_WKT).to_file(path)
+        layers[name] = path
+    return layers
+
+
+def _read_sorted(path):
+    return gpd.read_file(path).sort_values("fid_src").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("layer, base_type", [("polygons", "Polygon"), ("lines", "LineString"),
+                                              ("points", "Point")])
+@pytest.mark.parametrize("chunk_size", [1, 40])
+def test_streaming_clip_matches_in_memory(source_layers, boundary_path, tmp_path, layer, base_type, chunk_size):
+    full = clip_vector_to_boundary(source_layers[layer], boundary_path, str(tmp_path / "full" / "out.shp"))
+    streamed = clip_vector_to_boundary(source_layers[layer], boundary_path, str(tmp_path / "streamed" / "out.shp"),
+                                       chunk_size=chunk_size)
+
+    a, b = _read_sorted(full), _read_sorted(streamed)
+    assert list(a["fid_src"]) == list(b["fid_src"])
+    assert np.allclose(a["value"], b["value"])
+    assert shapely.equals(a.geometry.values, b.geometry.values).all()
+
+    # 与输入同维：求交产生的低维部分在两种方式下都被丢弃
+    assert set(a.geometry.geom_type.str.replace("Multi", "")) == {base_type}
+
+
+def test_lower_dimension_parts_are_dropped(source_layers, boundary_path, tmp_path):
+    out = clip_vector_to_boundary(source_layers["polygons"], boundary_path, str(tmp_path / "full" / "out.shp"))
+    clipped = _read_sorted(out).set_index("fid_src")
+
+    # 只共边的要素被整行删除，面 + 线的 GeometryCollection 只保留面
+    assert 150 not in clipped.index
+    assert shapely.equals(clipped.geometry[151], box(X0, Y0 + 100, X0 + 50, Y0 + 200))
+
+
+@pytest.mark.parametrize("layer", ["polygons", "lines", "points"])
+@pytest.mark.parametrize("chunk_size", [None, 40])
+def test_vectorized_engine_matches_threads(source_layers, boundary_path, tmp_path, layer, chunk_size):
+    threads = clip_vector_to_boundary(source_layers[layer], boundary_path, str(tmp_path / "threads" / "out.shp"),
+                                      chunk_size=chunk_size)
+    vectorized = clip_vector_to_boundary(source_layers[layer], boundary_path,
+                                         str(tmp_path / "vectorized" / "out.shp"), chunk_size=chunk_size,
+                                         engine="vectorized", n_processes=1)
+
+    a, b = _read_sorted(threads), _read_sorted(vectorized)
+    assert list(a["fid_src"]) == list(b["fid_src"])
+    assert np.allclose(a["value"], b["value"])
+    assert shapely.equals(a.geometry.values, b.geometry.values).all()
+
+
+def test_vectorized_process_pool_matches_threads(source_layers, boundary_path):
+    gdf = gpd.read_file(source_layers["polygons"])
+    boundary_geom = get_boundary(boundary_path).union()
+    expected = _clip_to_geometry(gdf, boundary_geom, n_threads=4)
+
+    # 分块小于要素数，求交按数组分块分配到两个工作进程（直接建池，不受本机 CPU 数限制）
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2, mp_context=context, initializer=_init_clip_worker,
+                                                initargs=(boundary_geom,)) as pool:
+        clipped = _clip_vectorized(gdf, boundary_geom, pool, chunk=20)
+
+    assert list(clipped.index) == sorted(expected.index)
+    assert shapely.equals(clipped.geometry.values, expected.geometry.sort_index().values).all()